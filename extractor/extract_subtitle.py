@@ -1,11 +1,28 @@
 import os
+import re
+import sys
 import subprocess
 import json
-import shutil
 import time
+import signal
+import threading
+import hashlib
+import cProfile
+import functools
+from contextlib import contextmanager
 from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
 from dotenv import load_dotenv
 
+# Exécution depuis le dépôt : modules partagés dans translator/ (dans l'image Docker, copiés dans /app)
+SHARED_FOLDER = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "translator")
+if os.path.isdir(SHARED_FOLDER):
+    sys.path.append(SHARED_FOLDER)
+
+import language_detection
+import subtitle_formats
+
 # ==========================================
 # extract_subtitle_en.py - V10 (Multi-Folders)
 # ==========================================
@@ -26,6 +43,10 @@ WATCH_INTERVAL = int(os.getenv("WATCH_INTERVAL", 3600))  # défaut: 1h
 LOG_FILE = os.getenv("LOG_FILE", None)  # None = console uniquement
 LOG_FILE_MAX_SIZE_MB = int(os.getenv("LOG_FILE_MAX_SIZE_MB", 10))  # Taille max par fichier (MB)
 LOG_FILE_BACKUP_COUNT = int(os.getenv("LOG_FILE_BACKUP_COUNT", 2))  # Nombre de backups
+LOG_SUMMARY = os.getenv("LOG_SUMMARY", "false").lower() == "true"  # Skips de routine agrégés par dossier
+LOG_SLOW_SECONDS = float(os.getenv("LOG_SLOW_SECONDS", 30 if LOG_SUMMARY else 0))  # 0 = pas de ligne "opération lente"
+INCREMENTAL_SCAN = os.getenv("INCREMENTAL_SCAN", "true").lower() == "true"  # Watch : ne pas relister les dossiers inchangés (mtime)
+DEEP_SCAN_EVERY = int(os.getenv("DEEP_SCAN_EVERY", 24))  # Scan complet forcé tous les N cycles (0 = jamais)
 
 # Timeouts pour mkvmerge et mkvextract (None = pas de timeout)
 MKV_ANALYSIS_TIMEOUT = os.getenv("MKV_ANALYSIS_TIMEOUT")
@@ -45,21 +66,57 @@ except json.JSONDecodeError:
     else:
         SOURCE_FOLDERS = []
 
+# API HTTP locale (extraction immédiate d'une vidéo) : 0 = désactivée
+API_PORT = int(os.getenv("API_PORT", 0))
+API_HOST = os.getenv("API_HOST", "0.0.0.0")
+API_TOKEN = os.getenv("API_TOKEN")  # Optionnel : exige "Authorization: Bearer <token>" sur POST
+
+# Profilage : durée des étapes (spans) → trace JSON-lines par fichier + tableau récapitulatif par cycle
+PROFILE = os.getenv("PROFILE", "false").lower() == "true"
+PROFILE_DIR = os.getenv("PROFILE_DIR", "profiles")
+PROFILE_CPROFILE = os.getenv("PROFILE_CPROFILE", "false").lower() == "true"  # + dump cProfile (.prof) par fichier
+
+# Arrêt propre (docker stop) : délai laissé à l'extraction en cours avant abandon (garder < stop_grace_period, 10s par défaut)
+SHUTDOWN_GRACE_SECONDS = int(os.getenv("SHUTDOWN_GRACE_SECONDS", 8))
+
+# Langues cibles du traducteur : une vidéo n'est ignorée que si toutes sont déjà présentes
+TARGET_LANGUAGES = json.loads(os.getenv("TARGET_LANGUAGES") or '["fr"]')
+
+# Codes (fichiers externes + pistes MKV) et noms de piste reconnus par langue cible
+LANGUAGE_CODES = {
+    "fr": (["fr", "fra", "fre", "french"], ["french", "français", "francais"]),
+    "es": (["es", "spa", "spanish"], ["spanish", "español", "espanol", "castellano"]),
+    "de": (["de", "deu", "ger", "german"], ["german", "deutsch"]),
+    "it": (["it", "ita", "italian"], ["italian", "italiano"]),
+    "pt": (["pt", "por", "portuguese"], ["portuguese", "português", "portugues"]),
+    "nl": (["nl", "nld", "dut", "dutch"], ["dutch", "nederlands"]),
+}
+
+# Pistes "und" (sans langue) : langue détectée hors ligne avant de les extraire comme anglaises
+LANGUAGE_DETECTION = os.getenv("LANGUAGE_DETECTION", "true").lower() == "true"
+
 # Extensions vidéo supportées
 VIDEO_EXTENSIONS = (".mkv", ".mp4", ".avi", ".mov", ".m4v", ".webm", ".flv", ".wmv")
 
 # Extensions de sous-titres à chercher
-SUBTITLE_EXTENSIONS = ["srt", "ass", "sup", "ssa"]
+SUBTITLE_EXTENSIONS = ["srt", "ass", "sup", "ssa", "sub"]
 
 # Configuration du logger
+import atexit
+import queue
 import logging
-from logging.handlers import RotatingFileHandler
+from logging.handlers import RotatingFileHandler, QueueHandler, QueueListener
 
 logger = None
+log_listener = None
 
 def setup_logger():
-    """Configure le logger avec rotation automatique si LOG_FILE est défini"""
-    global logger
+    """
+    Configure le logger avec rotation automatique si LOG_FILE est défini
+    Écriture en arrière-plan : log() dépose le message dans une file (QueueHandler),
+    un thread (QueueListener) l'écrit sur la console et dans le fichier
+    """
+    global logger, log_listener
     
     logger = logging.getLogger('subtitle_extractor')
     logger.setLevel(logging.INFO)
@@ -70,9 +127,10 @@ def setup_logger():
     # Handler console (toujours actif)
     console_handler = logging.StreamHandler()
     console_handler.setFormatter(formatter)
-    logger.addHandler(console_handler)
+    handlers = [console_handler]
     
     # Handler fichier avec rotation (si LOG_FILE configuré)
+    file_error = None
     if LOG_FILE:
         try:
             # Rotation automatique selon configuration
@@ -83,15 +141,27 @@ def setup_logger():
                 encoding='utf-8'
             )
             file_handler.setFormatter(formatter)
-            logger.addHandler(file_handler)
-            
-            # Log de config au démarrage
-            total_files = LOG_FILE_BACKUP_COUNT + 1
-            max_space_mb = total_files * LOG_FILE_MAX_SIZE_MB
-            logger.info(f"📝 Log fichier activé: {LOG_FILE}")
-            logger.info(f"   Rotation: {LOG_FILE_MAX_SIZE_MB} MB/fichier, {total_files} fichiers max ({max_space_mb} MB total)")
+            handlers.append(file_handler)
         except Exception as e:
-            print(f"[ERROR] Impossible de créer le fichier de log {LOG_FILE}: {e}")
+            file_error = e
+    
+    # File non bornée : log() ne bloque jamais sur le disque (NAS lent, rotation)
+    log_queue = queue.SimpleQueue()
+    logger.addHandler(QueueHandler(log_queue))
+    log_listener = QueueListener(log_queue, *handlers)
+    log_listener.start()
+    atexit.register(log_listener.stop)  # vide la file avant la sortie
+    
+    if file_error:
+        print(f"[ERROR] Impossible de créer le fichier de log {LOG_FILE}: {file_error}")
+    elif LOG_FILE:
+        # Log de config au démarrage
+        total_files = LOG_FILE_BACKUP_COUNT + 1
+        max_space_mb = total_files * LOG_FILE_MAX_SIZE_MB
+        logger.info(f"📝 Log fichier activé: {LOG_FILE}")
+        logger.info(f"   Rotation: {LOG_FILE_MAX_SIZE_MB} MB/fichier, {total_files} fichiers max ({max_space_mb} MB total)")
+    if LOG_SUMMARY:
+        logger.info(f"📝 Logs résumés : skips de routine agrégés par dossier | Opérations lentes ≥ {LOG_SLOW_SECONDS:g}s")
 
 
 def log(msg):
@@ -101,29 +171,209 @@ def log(msg):
     logger.info(msg)
 
 
+# Logs résumés : issue de routine → compteur par dossier pour le cycle en cours
+_routine_lock = threading.Lock()
+routine_counts = {}  # dossier → {issue: nombre}
+
+
+def routine_folder(video_path):
+    """Dossier de SOURCE_FOLDERS contenant la vidéo (sinon son dossier parent)"""
+    for folder in SOURCE_FOLDERS:
+        if video_path.startswith(os.path.join(folder, "")):
+            return folder
+    return os.path.dirname(video_path)
+
+
+def log_routine(outcome, video_path, msg):
+    """Issue de routine (skip) : ligne individuelle, ou simple compteur par dossier si LOG_SUMMARY"""
+    if not LOG_SUMMARY:
+        log(msg)
+        return
+
+    with _routine_lock:
+        outcomes = routine_counts.setdefault(routine_folder(video_path), {})
+        outcomes[outcome] = outcomes.get(outcome, 0) + 1
+
+
+def log_routine_summary():
+    """Fin de cycle : une ligne par dossier avec les skips agrégés"""
+    with _routine_lock:
+        rows = sorted(routine_counts.items())
+        routine_counts.clear()
+
+    for folder, outcomes in rows:
+        details = " | ".join(f"{outcome}: {count}"
+                             for outcome, count in sorted(outcomes.items(), key=lambda item: -item[1]))
+        log(f"📁 {folder} → {details}")
+
+
+# =========================
+# PROFILING
+# =========================
+_profile_local = threading.local()  # pile des fichiers profilés (par thread)
+_profile_lock = threading.Lock()
+profile_totals = {}  # étape → [appels, durée totale, durée max] pour le cycle en cours
+profile_cycle_start = time.perf_counter()
+
+
+def reset_profile():
+    """Début de cycle : remet à zéro les totaux par étape"""
+    global profile_cycle_start
+    with _profile_lock:
+        profile_totals.clear()
+        profile_cycle_start = time.perf_counter()
+
+
+def profile_path(video_path, extension):
+    """Fichier de trace d'une vidéo : Film.<empreinte du chemin>.extract.jsonl"""
+    stem = os.path.splitext(os.path.basename(video_path))[0]
+    digest = hashlib.sha1(video_path.encode("utf-8")).hexdigest()[:8]
+    return os.path.join(PROFILE_DIR, f"{stem}.{digest}.extract.{extension}")
+
+
+SLOW_IGNORED_STAGES = ("file", "pause")  # durée attendue, jamais signalée comme lente
+
+
+@contextmanager
+def span(stage, **fields):
+    """
+    Mesure une étape : totaux du cycle + ligne dans la trace du fichier en cours (PROFILE=true)
+    et ligne "opération lente" au-delà de LOG_SLOW_SECONDS
+    """
+    if not PROFILE and not LOG_SLOW_SECONDS:
+        yield
+        return
+
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        duration = time.perf_counter() - started
+        stack = getattr(_profile_local, "stack", None)
+        trace = stack[-1] if stack else None
+
+        if LOG_SLOW_SECONDS and duration >= LOG_SLOW_SECONDS and stage not in SLOW_IGNORED_STAGES:
+            video = os.path.basename(trace["video"]) if trace else "-"
+            log(f"🐢 Opération lente : {stage} {duration:.1f}s | {video}")
+
+        if PROFILE:
+            with _profile_lock:
+                total = profile_totals.setdefault(stage, [0, 0.0, 0.0])
+                total[0] += 1
+                total[1] += duration
+                total[2] = max(total[2], duration)
+
+            if trace and trace["file"]:
+                record = {"stage": stage, "at": round(started - trace["started"], 4), "duration": round(duration, 4)}
+                record.update(fields)
+                trace["file"].write(json.dumps(record, ensure_ascii=False) + "\n")
+
+
+def profiled(stage):
+    """Décorateur : la fonction entière est une étape profilée"""
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            with span(stage):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def profiled_file(function):
+    """Décorateur : function(video_path, ...) produit la trace de ce fichier"""
+    @functools.wraps(function)
+    def wrapper(video_path, *args, **kwargs):
+        with profile_file(video_path):
+            return function(video_path, *args, **kwargs)
+    return wrapper
+
+
+@contextmanager
+def profile_file(video_path):
+    """Trace JSON-lines d'un fichier (réécrite à chaque traitement) + dump cProfile optionnel"""
+    if not PROFILE and not LOG_SLOW_SECONDS:
+        yield
+        return
+
+    # La pile nomme aussi la vidéo des opérations lentes, même sans PROFILE
+    stack = _profile_local.__dict__.setdefault("stack", [])
+    trace = {"video": video_path, "file": None, "started": time.perf_counter()}
+    if PROFILE:
+        os.makedirs(PROFILE_DIR, exist_ok=True)
+        trace["file"] = open(profile_path(video_path, "jsonl"), "w", encoding="utf-8", buffering=1)
+        trace["file"].write(json.dumps({"stage": "start", "video": video_path,
+                                        "date": datetime.now().isoformat(timespec="seconds")},
+                                       ensure_ascii=False) + "\n")
+
+    profiler = None
+    if PROFILE and PROFILE_CPROFILE and not stack:
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError:
+            profiler = None
+
+    stack.append(trace)
+    try:
+        with span("file"):
+            yield
+    finally:
+        stack.pop()
+        if profiler:
+            profiler.disable()
+            profiler.dump_stats(profile_path(video_path, "prof"))
+        if trace["file"]:
+            trace["file"].write(json.dumps({"stage": "end", "duration": round(time.perf_counter() - trace["started"], 4)}) + "\n")
+            trace["file"].close()
+
+
+def log_profile_summary():
+    """Fin de cycle : tableau des étapes triées par durée totale"""
+    if not PROFILE:
+        return
+
+    wall = time.perf_counter() - profile_cycle_start
+    with _profile_lock:
+        rows = sorted(profile_totals.items(), key=lambda item: item[1][1], reverse=True)
+
+    log(f"📊 PROFIL DU CYCLE | Durée: {wall:.1f}s | Traces: {PROFILE_DIR} (étapes imbriquées : total > 100% possible)")
+    log(f"   {'étape':<26} {'appels':>7} {'total':>9} {'moyenne':>9} {'max':>9} {'%':>6}")
+    for stage, (calls, total, longest) in rows:
+        share = total / wall * 100 if wall else 0
+        log(f"   {stage:<26} {calls:>7} {total:>8.2f}s {total / calls:>8.3f}s {longest:>8.3f}s {share:>5.1f}%")
+
+
 def is_trailer(filename):
     """Vérifie si le fichier est un trailer (contient '-trailer')"""
     return "-trailer" in filename.lower()
 
 
-def find_french_subtitle(base_path):
+def language_codes(language):
+    """(codes, noms de piste) reconnus pour une langue cible"""
+    return LANGUAGE_CODES.get(language, ([language], []))
+
+
+@profiled("find_target_subtitle")
+def find_target_subtitle(base_path, language):
     """
-    Cherche un fichier de sous-titre français externe
-    Patterns : .fr.srt, .fra.srt, .fre.srt, .french.srt
+    Cherche un fichier de sous-titre externe dans une langue cible
+    Patterns (fr) : .fr.srt, .fra.srt, .fre.srt, .french.srt
     
     Retourne True si trouvé, False sinon
     """
-    lang_codes = ["fr", "fra", "fre", "french"]
+    lang_codes, _ = language_codes(language)
     
     for lang in lang_codes:
         for ext in SUBTITLE_EXTENSIONS:
-            french_file = f"{base_path}.{lang}.{ext}"
-            if os.path.isfile(french_file):
+            target_file = f"{base_path}.{lang}.{ext}"
+            if os.path.isfile(target_file):
                 return True
     
     return False
 
 
+@profiled("find_external_subtitle")
 def find_external_subtitle(base_path):
     """
     Cherche un fichier de sous-titre anglais externe dans l'ordre de priorité :
@@ -150,6 +400,7 @@ def find_external_subtitle(base_path):
     return None
 
 
+@profiled("find_extracted_subtitle")
 def find_extracted_subtitle(base_path):
     """
     Cherche un fichier .en.XXX.tmp déjà extrait
@@ -162,6 +413,7 @@ def find_extracted_subtitle(base_path):
     return None
 
 
+@profiled("get_tracks")
 def get_tracks(mkv_path):
     """
     Récupère les pistes du fichier MKV
@@ -212,15 +464,21 @@ def get_tracks(mkv_path):
         return [], f"unknown_error: {str(e)}"
 
 
-def has_french_subtitle_in_mkv(mkv_path):
+def mkv_subtitle_languages(mkv_path, languages):
     """
-    Vérifie si le MKV contient une piste de sous-titre français
-    Retourne True si trouvé, False sinon
+    Langues cibles présentes comme piste de sous-titre dans le MKV
+    Retourne l'ensemble des langues trouvées parmi `languages`
     """
     tracks, error = get_tracks(mkv_path)
     if error or not tracks:
-        return False
+        return set()
     
+    return track_languages(tracks, languages)
+
+
+def track_languages(tracks, languages):
+    """Langues de `languages` présentes parmi les pistes de sous-titre (sortie de get_tracks)"""
+    found = set()
     for track in tracks:
         if track["type"] != "subtitles":
             continue
@@ -229,25 +487,220 @@ def has_french_subtitle_in_mkv(mkv_path):
         lang = (props.get("language") or "").lower()
         name = (props.get("track_name") or "").lower()
         
-        is_french = (
-            lang in ("fr", "fra", "fre") or
-            "french" in name or
-            "français" in name or
-            "francais" in name
-        )
-        
-        if is_french:
-            return True
+        for language in languages:
+            lang_codes, track_names = language_codes(language)
+            if lang in lang_codes or any(track_name in name for track_name in track_names):
+                found.add(language)
     
+    return found
+
+
+# =========================
+# DÉTECTION DE LANGUE (HORS LIGNE)
+# =========================
+# Mots outils comptés par language_detection.py (module partagé avec le translator)
+ASS_OVERRIDE_PATTERN = re.compile(r"\{[^}]*\}|<[^>]*>")
+
+
+def subtitle_text_lines(data, fmt):
+    """Texte des répliques d'une piste texte extraite (SRT, ASS/SSA, VTT), sans numéros, temps ni balises"""
+    lines = []
+    for line in data.decode("utf-8-sig", errors="replace").splitlines():
+        if fmt in ("ass", "ssa"):
+            if not line.startswith("Dialogue:"):
+                continue
+            line = line.split(",", 9)[-1].replace("\\N", " ").replace("\\n", " ")
+        elif not line.strip() or line.strip().isdigit() or "-->" in line or line.startswith("WEBVTT"):
+            continue
+        lines.append(ASS_OVERRIDE_PATTERN.sub("", line))
+    return lines
+
+
+def is_tagged_english(track):
+    """Piste déclarée anglaise (code langue ou nom de piste) : aucune détection nécessaire"""
+    props = track.get("properties", {})
+    return (props.get("language") or "").lower() in ("en", "eng") or "english" in (props.get("track_name") or "").lower()
+
+
+def needs_language_check(track):
+    """Piste texte sans langue ("und") ni nom anglais : sa langue réelle est à vérifier"""
+    props = track.get("properties", {})
+    return (
+        LANGUAGE_DETECTION
+        and (props.get("language") or "").lower() == "und"
+        and not is_tagged_english(track)
+        and track_format(track) not in ("sup", "sub")
+    )
+
+
+def retarget_track(base_path, language, fmt, data, video_name):
+    """
+    Piste "und" déjà dans une langue cible → conservée comme sous-titre externe .{langue}.srt
+    (même nommage que les sorties du translator, ASS/SSA/VTT convertis en SRT)
+    """
+    if language not in TARGET_LANGUAGES or find_target_subtitle(base_path, language):
+        return None
+    cues = subtitle_formats.parse_cues(data.decode("utf-8-sig", errors="replace").splitlines(keepends=True), fmt)
+    if not cues:
+        return None
+    target = f"{base_path}.{language}.srt"
+    subtitle_formats.write_srt(target, cues)  # écriture atomique (.partial + fsync + renommage)
+    log(f"🌐 {video_name} | Piste sans langue conservée comme {os.path.basename(target)}")
+    return target
+
+
+def check_track_language(track, data, base_path, video_name):
+    """
+    Langue réelle d'une piste "und" extraite : True si anglaise (ou indéterminée)
+    Une piste dans une langue cible devient un sous-titre externe de cette langue
+    """
+    fmt = track_format(track)
+    language, share = language_detection.detect_language(subtitle_text_lines(data, fmt))
+    if not language or language == "en":
+        return True
+    log(f"🌐 {video_name} | Piste {track['id']} (und) détectée en {language} ({share:.0%} de mots outils) → pas une source EN")
+    retarget_track(base_path, language, fmt, data, video_name)
     return False
 
 
+def english_track_candidates(tracks):
+    """
+    Pistes de sous-titre pouvant servir de source anglaise, par préférence :
+    anglaises déclarées, puis sans langue ("und"), pistes forcées (panneaux seulement) en dernier
+    """
+    candidates = []
+    for track in tracks:
+        if track["type"] != "subtitles":
+            continue
+
+        props = track.get("properties", {})
+        lang = (props.get("language") or "").lower()
+
+        if is_tagged_english(track):
+            rank = 0
+        elif lang == "und":
+            rank = 1
+        else:
+            continue
+        candidates.append((rank + (2 if props.get("forced_track") else 0), len(candidates), track))
+
+    return [track for _, _, track in sorted(candidates, key=lambda candidate: candidate[:2])]
+
+
+def select_english_track(tracks):
+    """Première piste de sous-titre anglaise (ou sans langue) parmi les pistes du MKV, None sinon"""
+    candidates = english_track_candidates(tracks)
+    return candidates[0] if candidates else None
+
+
+def track_format(track):
+    """Extension du sous-titre extrait selon le codec de la piste"""
+    codec = track.get("codec", "").lower()
+
+    if "s_text/ass" in codec or "advanced" in codec or ("ass" in codec and "substation" not in codec):
+        return "ass"
+    elif "substation" in codec or "s_text/ssa" in codec or "ssa" in codec:
+        return "ssa"
+    elif "s_hdmv/pgs" in codec or "hdmv" in codec or "pgs" in codec:
+        return "sup"
+    elif "s_vobsub" in codec or "vobsub" in codec:
+        return "sub"
+    elif "webvtt" in codec or "s_text/webvtt" in codec:
+        return "vtt"
+    else:
+        return "srt"  # Fallback (SubRip, S_TEXT/UTF8)
+
+
+@profiled("extract_track_to_memory")
+def extract_track_to_memory(mkv_path, track_id):
+    """
+    Extrait une piste du MKV en mémoire, sans fichier intermédiaire
+    mkvextract écrit dans un pipe dédié (/dev/fd/N) : sa sortie standard
+    porte ses propres messages de progression et ne peut pas servir de flux de données
+    Retourne (données, None) ou (None, raison)
+    """
+    read_fd, write_fd = os.pipe()
+    try:
+        process = subprocess.Popen(
+            ["mkvextract", "tracks", mkv_path, f"{track_id}:/dev/fd/{write_fd}"],
+            pass_fds=(write_fd,),
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL
+        )
+    except Exception as e:
+        os.close(read_fd)
+        os.close(write_fd)
+        log(f"  ⚠️ erreur inattendue extraction : {e}")
+        return None, f"extraction_error: {str(e)}"
+    os.close(write_fd)
+
+    # Timeout : le processus est tué, le pipe se ferme et la lecture se termine
+    timed_out = threading.Event()
+
+    def kill():
+        timed_out.set()
+        process.kill()
+
+    timer = threading.Timer(MKV_EXTRACT_TIMEOUT, kill) if MKV_EXTRACT_TIMEOUT is not None else None
+    if timer:
+        timer.start()
+    try:
+        with os.fdopen(read_fd, "rb") as pipe:
+            data = pipe.read()
+        returncode = process.wait()
+    finally:
+        if timer:
+            timer.cancel()
+
+    if timed_out.is_set():
+        log(f"  ⚠️ timeout extraction (>{MKV_EXTRACT_TIMEOUT}s)")
+        return None, "extraction_timeout"
+    # mkvextract : 1 = avertissements (données valides), 2 = erreur
+    if returncode not in (0, 1):
+        log(f"  ⚠️ erreur mkvextract (exit {returncode})")
+        return None, "extraction_failed"
+    if not data:
+        return None, "extraction_empty_file"
+    return data, None
+
+
+def fsync_file(path):
+    """Force l'écriture sur disque d'un fichier écrit par un autre processus (mkvextract)"""
+    with open(path, "rb") as f:
+        os.fsync(f.fileno())
+
+
+def sweep_orphan_temp_files():
+    """
+    Démarrage : supprime les extractions interrompues (Film.temp.XXX à côté de Film.mkv)
+    Le .en.XXX.tmp n'est créé que par renommage d'un fichier complet → la vidéo sera simplement ré-extraite
+    """
+    temp_extensions = {f".{ext}" for ext in SUBTITLE_EXTENSIONS} | {".idx"}
+    removed = 0
+    for folder in SOURCE_FOLDERS:
+        for root, _, files in os.walk(folder):
+            videos = {os.path.splitext(name)[0] for name in files if name.lower().endswith(VIDEO_EXTENSIONS)}
+            for name in files:
+                stem, ext = os.path.splitext(name)
+                if ext not in temp_extensions or not stem.endswith(".temp") or stem[:-len(".temp")] not in videos:
+                    continue
+                try:
+                    os.remove(os.path.join(root, name))
+                    removed += 1
+                except OSError as e:
+                    log(f"⚠️ {name} | Suppression impossible: {e}")
+
+    if removed:
+        log(f"🧹 {removed} extraction(s) interrompue(s) (.temp) supprimée(s)")
+
+
+@profiled("extract_from_mkv")
 def extract_from_mkv(mkv_path, base_path, video_name):
     """
     Extrait le sous-titre anglais du MKV vers un fichier .en.FORMAT.tmp
     Retourne un tuple (success, reason) :
     - (True, "extracted") si extraction réussie
-    - (False, "no_english_track") si aucune piste EN trouvée (légitime)
+    - (False, "no_english_track") si aucune piste EN trouvée (légitime, pistes "und" d'une autre langue incluses)
     - (False, "analysis_timeout") si timeout lors de l'analyse
     - (False, "analysis_file_error") si fichier corrompu/inexistant
     - (False, "analysis_corrupted_file") si mkvmerge retourne des erreurs
@@ -265,53 +718,33 @@ def extract_from_mkv(mkv_path, base_path, video_name):
         # Pas de pistes du tout (ne devrait pas arriver si pas d'erreur)
         return False, "analysis_no_tracks"
 
-    subtitle_tracks = []
+    # Pistes "und" : une piste dans une autre langue est écartée, la candidate suivante est essayée
+    for track in english_track_candidates(tracks):
+        success, reason = extract_track(mkv_path, track, base_path, video_name)
+        if success or reason != "not_english":
+            return success, reason
 
-    for track in tracks:
-        if track["type"] != "subtitles":
-            continue
-
-        props = track.get("properties", {})
-        lang = (props.get("language") or "").lower()
-        name = (props.get("track_name") or "").lower()
-
-        is_english = (
-            lang in ("en", "eng", "und") or
-            "english" in name
-        )
-
-        if is_english:
-            subtitle_tracks.append(track)
+    # Légitime : pas de piste EN (ou pistes "und" dans une autre langue) → créer fichier marqueur
+    marker_file = f"{base_path}.en.nosubtitle.tmp"
+    try:
+        open(marker_file, 'w').close()  # Fichier vide
+    except Exception:
+        pass  # Ignore les erreurs de création du marqueur
+    return False, "no_english_track"
 
-    if not subtitle_tracks:
-        # Légitime : pas de piste EN → créer fichier marqueur
-        marker_file = f"{base_path}.en.nosubtitle.tmp"
-        try:
-            open(marker_file, 'w').close()  # Fichier vide
-        except Exception:
-            pass  # Ignore les erreurs de création du marqueur
-        return False, "no_english_track"
 
-    track = subtitle_tracks[0]
+def extract_track(mkv_path, track, base_path, video_name):
+    """
+    Extrait une piste vers .en.FORMAT.tmp (voir extract_from_mkv)
+    (False, "not_english") : piste "und" détectée dans une autre langue, rien n'est conservé en .en
+    """
     track_id = track["id"]
-    codec = track.get("codec", "").lower()
-
-    # Déterminer l'extension selon le codec
-    if "s_text/ass" in codec or "advanced" in codec or ("ass" in codec and "substation" not in codec):
-        format_ext = "ass"
-    elif "substation" in codec or "s_text/ssa" in codec or "ssa" in codec:
-        format_ext = "ssa"
-    elif "s_hdmv/pgs" in codec or "hdmv" in codec or "pgs" in codec:
-        format_ext = "sup"
-    elif "s_vobsub" in codec or "vobsub" in codec:
-        format_ext = "sub"
-    elif "webvtt" in codec or "s_text/webvtt" in codec:
-        format_ext = "vtt"
-    else:
-        format_ext = "srt"  # Fallback (SubRip, S_TEXT/UTF8)
+    format_ext = track_format(track)
 
     temp_file = f"{base_path}.temp.{format_ext}"
     out_file = f"{base_path}.en.{format_ext}.tmp"
+    # VobSub : mkvextract écrit aussi le .idx (palette + horodatages), indispensable à l'OCR
+    temp_idx = f"{base_path}.temp.idx" if format_ext == "sub" else None
 
     try:
         kwargs = {
@@ -326,47 +759,80 @@ def extract_from_mkv(mkv_path, base_path, video_name):
         # Log avant extraction
         log(f"🔄 {video_name} | Extraction de la piste EN en cours...")
 
-        # Extraire vers un fichier temporaire
-        subprocess.run(
-            ["mkvextract", "tracks", mkv_path, f"{track_id}:{temp_file}"],
-            **kwargs
-        )
-
-        # Vérifier que le fichier extrait existe et n'est pas vide
-        if not os.path.exists(temp_file) or os.path.getsize(temp_file) == 0:
-            if os.path.exists(temp_file):
-                os.remove(temp_file)
-            return False, "extraction_empty_file"
+        # Un SIGTERM pendant l'extraction attend sa fin (SHUTDOWN_GRACE_SECONDS max)
+        with shutdown_guard():
+            # Extraire vers un fichier temporaire
+            subprocess.run(
+                ["mkvextract", "tracks", mkv_path, f"{track_id}:{temp_file}"],
+                **kwargs
+            )
 
-        # Renommer en .en.FORMAT.tmp
-        shutil.move(temp_file, out_file)
+            # Vérifier que le fichier extrait existe et n'est pas vide
+            if not os.path.exists(temp_file) or os.path.getsize(temp_file) == 0:
+                if os.path.exists(temp_file):
+                    os.remove(temp_file)
+                if temp_idx and os.path.exists(temp_idx):
+                    os.remove(temp_idx)
+                return False, "extraction_empty_file"
+
+            # Piste sans langue : vérifier qu'elle est bien en anglais avant d'en faire la source
+            if needs_language_check(track):
+                with open(temp_file, "rb") as f:
+                    data = f.read()
+                if not check_track_language(track, data, base_path, video_name):
+                    # Fichier temporaire déjà renommé si la piste a été conservée dans sa langue
+                    if os.path.exists(temp_file):
+                        os.remove(temp_file)
+                    return False, "not_english"
+
+            # Renommer en .en.FORMAT.tmp (+ .en.idx.tmp pour VobSub, avant le .sub qui signale la fin)
+            # fsync avant renommage : après un crash, un .en.XXX.tmp présent est toujours complet
+            if temp_idx and os.path.exists(temp_idx):
+                fsync_file(temp_idx)
+                os.replace(temp_idx, f"{base_path}.en.idx.tmp")
+            fsync_file(temp_file)
+            os.replace(temp_file, out_file)
         return True, "extracted"
 
     except subprocess.TimeoutExpired:
         # Timeout extraction → retry plus tard, pas de marqueur
         if os.path.exists(temp_file):
             os.remove(temp_file)
+        if temp_idx and os.path.exists(temp_idx):
+            os.remove(temp_idx)
         log(f"  ⚠️ timeout extraction (>{MKV_EXTRACT_TIMEOUT}s)")
         return False, "extraction_timeout"
     except subprocess.CalledProcessError as e:
         # mkvextract a échoué
         if os.path.exists(temp_file):
             os.remove(temp_file)
+        if temp_idx and os.path.exists(temp_idx):
+            os.remove(temp_idx)
         log(f"  ⚠️ erreur mkvextract (exit {e.returncode})")
         return False, "extraction_failed"
     except Exception as e:
         # Autre erreur
         if os.path.exists(temp_file):
             os.remove(temp_file)
+        if temp_idx and os.path.exists(temp_idx):
+            os.remove(temp_idx)
         log(f"  ⚠️ erreur inattendue extraction : {e}")
         return False, f"extraction_error: {str(e)}"
+    except KeyboardInterrupt:
+        # Arrêt (CTRL+C / SIGTERM) : mkvextract est tué par subprocess.run, pas de fichier partiel
+        if os.path.exists(temp_file):
+            os.remove(temp_file)
+        if temp_idx and os.path.exists(temp_idx):
+            os.remove(temp_idx)
+        raise
 
 
+@profiled_file
 def process_video_file(video_path):
     """
-    Processus principal avec détection FR :
-    1. Fichier FR externe existe → skip (déjà traduit)
-    2. Piste sous-titre FR dans MKV → skip (déjà traduit)
+    Processus principal avec détection des langues cibles (TARGET_LANGUAGES, défaut FR) :
+    1. Fichiers externes dans toutes les langues cibles → skip (déjà traduit)
+    2. Langues restantes présentes en piste dans le MKV → skip (déjà traduit)
     3. Fichier EN externe existe → skip (source dispo)
     4. Fichier .en.XXX.tmp déjà extrait → skip
     5. Fichier .en.nosubtitle.tmp existe → skip (MKV déjà analysé, pas de piste EN)
@@ -377,33 +843,35 @@ def process_video_file(video_path):
     video_name = os.path.basename(video_path)
     is_mkv = ext.lower() == ".mkv"
 
-    # 1. Vérifier si fichier FR externe existe
-    if find_french_subtitle(base):
-        log(f"⭐️ {video_name} | Déjà traduit (sous-titre FR externe)")
+    # 1. Vérifier si un fichier externe existe pour chaque langue cible
+    missing = [language for language in TARGET_LANGUAGES if not find_target_subtitle(base, language)]
+    labels = "/".join(language.upper() for language in TARGET_LANGUAGES)
+    if not missing:
+        log_routine("déjà traduit", video_path, f"⭐️ {video_name} | Déjà traduit (sous-titre {labels} externe)")
         return "french_external"
 
-    # 2. Vérifier si piste sous-titre FR dans le MKV
-    if is_mkv and has_french_subtitle_in_mkv(video_path):
-        log(f"⭐️ {video_name} | Déjà traduit (piste FR dans MKV)")
+    # 2. Vérifier si les langues manquantes sont en piste dans le MKV
+    if is_mkv and set(missing) <= mkv_subtitle_languages(video_path, missing):
+        log_routine("déjà traduit", video_path, f"⭐️ {video_name} | Déjà traduit (piste {labels} dans MKV)")
         return "french_in_mkv"
 
     # 3. Vérifier si fichier EN externe existe
     external_file = find_external_subtitle(base)
 
     if external_file:
-        log(f"✓ {video_name} | Source externe trouvée: {os.path.basename(external_file)}")
+        log_routine("source externe", video_path, f"✓ {video_name} | Source externe trouvée: {os.path.basename(external_file)}")
         return "external"
 
     # 4. Vérifier si déjà extrait (.en.XXX.tmp)
     extracted = find_extracted_subtitle(base)
     if extracted:
-        log(f"✓ {video_name} | Déjà extrait: {os.path.basename(extracted)}")
+        log_routine("déjà extrait", video_path, f"✓ {video_name} | Déjà extrait: {os.path.basename(extracted)}")
         return "extracted"
 
     # 5. Vérifier si fichier marqueur .en.nosubtitle.tmp existe
     marker_file = f"{base}.en.nosubtitle.tmp"
     if os.path.isfile(marker_file):
-        log(f"⏭️ {video_name} | Pas de piste EN (MKV déjà analysé)")
+        log_routine("sans piste EN", video_path, f"⏭️ {video_name} | Pas de piste EN (MKV déjà analysé)")
         return "no_subtitle_in_mkv"
 
     # 6. Pas de fichier externe → extraire du MKV
@@ -439,6 +907,90 @@ def process_video_file(video_path):
         return "no_source"
 
 
+# =========================
+# SCAN INCRÉMENTAL (MTIME DES DOSSIERS)
+# =========================
+# Créer, supprimer ou renommer un fichier change le mtime de son dossier : un dossier dont le mtime
+# n'a pas bougé depuis un passage où toutes ses vidéos étaient dans un état stable n'est pas relisté,
+# seuls ses sous-dossiers connus sont revisités (un stat chacun)
+dir_index = {}  # dossier → {"mtime", "children"} du dernier passage stable
+unstable_dirs = set()  # dossiers à relister au prochain cycle (erreur d'analyse ou d'extraction...)
+scan_stats = {"cycle": 0, "deep": True, "listed": 0, "pruned": 0}
+STABLE_OUTCOMES = ("french_external", "french_in_mkv", "external", "extracted", "mkv_extracted", "no_subtitle_in_mkv", "no_source")
+
+
+def start_scan_cycle():
+    """Début de cycle : décide si le scan est complet (premier cycle, tous les DEEP_SCAN_EVERY cycles)"""
+    scan_stats["cycle"] += 1
+    scan_stats["deep"] = (
+        not INCREMENTAL_SCAN
+        or not dir_index
+        or (DEEP_SCAN_EVERY > 0 and scan_stats["cycle"] % DEEP_SCAN_EVERY == 0)
+    )
+    scan_stats["listed"] = 0
+    scan_stats["pruned"] = 0
+
+
+def mark_unstable(directory):
+    """Le dossier devra être relisté au prochain cycle"""
+    unstable_dirs.add(directory)
+    dir_index.pop(directory, None)
+
+
+def scan_folder(folder_path):
+    """
+    os.walk() incrémental : produit (root, files) pour les seuls dossiers à relister
+    Un dossier est mémorisé une fois ses fichiers traités, sauf si mark_unstable() a été appelé entre-temps
+    """
+    stack = [folder_path]
+    while stack:
+        root = stack.pop()
+        try:
+            mtime = os.stat(root).st_mtime_ns
+        except OSError:
+            dir_index.pop(root, None)
+            continue
+
+        known = dir_index.get(root)
+        if not scan_stats["deep"] and known and known["mtime"] == mtime:
+            scan_stats["pruned"] += 1
+            stack.extend(reversed(known["children"]))
+            continue
+
+        try:
+            with os.scandir(root) as entries:
+                entries = sorted(entries, key=lambda entry: entry.name)
+        except OSError as e:
+            log(f"  ⚠️ Dossier illisible, ignoré: {root} ({e})")
+            dir_index.pop(root, None)
+            continue
+
+        children = [entry.path for entry in entries if entry.is_dir() and not entry.is_symlink()]
+        files = [entry.name for entry in entries if not entry.is_dir()]
+        scan_stats["listed"] += 1
+
+        unstable_dirs.discard(root)
+        yield root, files
+
+        # mtime lu AVANT le listing : nos propres écritures (.en.*.tmp...) provoquent un relisting au cycle suivant,
+        # un fichier arrivé pendant le traitement n'est donc jamais manqué
+        if root in unstable_dirs:
+            dir_index.pop(root, None)
+        else:
+            dir_index[root] = {"mtime": mtime, "children": children}
+        stack.extend(reversed(children))
+
+
+def log_scan_summary():
+    """Résumé du scan incrémental en fin de cycle (mode watch)"""
+    if not INCREMENTAL_SCAN or not WATCH_MODE:
+        return
+    if scan_stats["deep"]:
+        log(f"🗂️ Scan complet : {scan_stats['listed']} dossier(s) listé(s)")
+    else:
+        log(f"🗂️ Scan incrémental : {scan_stats['pruned']} dossier(s) inchangé(s) ignoré(s) | {scan_stats['listed']} relisté(s)")
+
+
 def process_folder(folder_path, folder_index, total_folders):
     """
     Traite un dossier spécifique et retourne les stats
@@ -464,7 +1016,7 @@ def process_folder(folder_path, folder_index, total_folders):
         "no_source": 0
     }
     
-    for root, _, files in os.walk(folder_path):
+    for root, files in scan_folder(folder_path):
         for file in files:
             # Vérifier l'extension
             if not file.lower().endswith(VIDEO_EXTENSIONS):
@@ -478,7 +1030,8 @@ def process_folder(folder_path, folder_index, total_folders):
             video_path = os.path.join(root, file)
             
             try:
-                result = process_video_file(video_path)
+                with extraction_lock:
+                    result = process_video_file(video_path)
 
                 if result == "french_external":
                     stats["french_external"] += 1
@@ -501,9 +1054,13 @@ def process_folder(folder_path, folder_index, total_folders):
                 elif result == "no_source":
                     stats["no_source"] += 1
 
+                if result not in STABLE_OUTCOMES:
+                    mark_unstable(root)
+
                 stats["total"] += 1
             except Exception as e:
                 log(f"❌ {file} | Erreur inattendue: {e}")
+                mark_unstable(root)
                 stats["failed"] += 1
                 stats["total"] += 1
     
@@ -527,6 +1084,8 @@ def run_extraction():
         return
     
     log("🚀 DÉBUT DE L'EXTRACTION")
+    reset_profile()
+    start_scan_cycle()
     log(f"📂 {len(SOURCE_FOLDERS)} dossier(s) configuré(s) | Formats: {', '.join(VIDEO_EXTENSIONS)} | Ignore: trailers")
     
     # Stats globales
@@ -576,12 +1135,175 @@ def run_extraction():
     if global_stats["trailers_skipped"] > 0:
         log(f"  🚫 Trailers ignorés : {global_stats['trailers_skipped']}")
 
+    log_routine_summary()
+    log_scan_summary()
+    log_profile_summary()
     log('='*60)
 
+# =========================
+# ARRÊT PROPRE (SIGTERM)
+# =========================
+class ShutdownRequested(KeyboardInterrupt):
+    """Arrêt demandé par SIGTERM : traité comme CTRL+C, jamais avalé par un except Exception"""
+
+
+shutdown_requested = threading.Event()
+_shutdown_busy = 0  # > 0 : extraction en cours, terminée avant l'arrêt si possible
+
+
+def handle_sigterm(signum, frame):
+    """
+    docker stop : arrêt immédiat hors extraction, sinon fin de l'extraction en cours
+    dans la limite de SHUTDOWN_GRACE_SECONDS (puis abandon, repris au démarrage suivant)
+    """
+    if shutdown_requested.is_set() or not _shutdown_busy or SHUTDOWN_GRACE_SECONDS <= 0:
+        shutdown_requested.set()
+        log("🛑 Arrêt demandé (SIGTERM)")
+        raise ShutdownRequested()
+
+    shutdown_requested.set()
+    log(f"🛑 Arrêt demandé (SIGTERM) : fin de l'extraction en cours (max {SHUTDOWN_GRACE_SECONDS}s)")
+    signal.signal(signal.SIGALRM, handle_grace_timeout)
+    signal.alarm(SHUTDOWN_GRACE_SECONDS)
+
+
+def handle_grace_timeout(signum, frame):
+    """Délai de grâce dépassé : l'extraction en cours est abandonnée"""
+    log(f"⏱️ Délai de grâce dépassé ({SHUTDOWN_GRACE_SECONDS}s) : extraction abandonnée, reprise au prochain démarrage")
+    raise ShutdownRequested()
+
+
+def install_shutdown_handler():
+    """SIGTERM → arrêt propre (à appeler depuis le thread principal)"""
+    signal.signal(signal.SIGTERM, handle_sigterm)
+
+
+@contextmanager
+def shutdown_guard():
+    """Extraction en cours (mkvextract + renommage) : un SIGTERM attend sa fin au lieu de l'interrompre"""
+    global _shutdown_busy
+    if shutdown_requested.is_set():
+        # Le précédent a échoué pendant le délai de grâce : ne pas en commencer un autre
+        signal.alarm(0)
+        raise ShutdownRequested()
+
+    _shutdown_busy += 1
+    try:
+        yield
+    finally:
+        _shutdown_busy -= 1
+
+    if shutdown_requested.is_set() and not _shutdown_busy:
+        signal.alarm(0)
+        log("🛑 Extraction terminée → arrêt")
+        if threading.current_thread() is not threading.main_thread():
+            # Extraction demandée par l'API : c'est le thread principal qu'il faut arrêter
+            os.kill(os.getpid(), signal.SIGTERM)
+            return
+        raise ShutdownRequested()
+
+
+# =========================
+# HTTP API (EXTRACTION À LA DEMANDE)
+# =========================
+extraction_lock = threading.Lock()  # une extraction à la fois (cycle ou API)
+recent_results = {}  # vidéo → dernier résultat d'une demande API
+
+
+def resolve_request_path(path):
+    """
+    Valide le chemin d'une demande : vidéo existante, dans un des SOURCE_FOLDERS
+    Retourne (chemin, None) ou (None, (code HTTP, message))
+    """
+    if not path:
+        return None, (400, "paramètre 'path' manquant")
+
+    video_path = os.path.abspath(path)
+    if not video_path.lower().endswith(VIDEO_EXTENSIONS):
+        return None, (400, "extension vidéo non supportée")
+
+    real_path = os.path.realpath(video_path)
+    roots = [os.path.realpath(root) for root in SOURCE_FOLDERS]
+    if not any(os.path.commonpath([real_path, root]) == root for root in roots):
+        return None, (400, "chemin hors SOURCE_FOLDERS")
+
+    if not os.path.isfile(video_path):
+        return None, (404, "vidéo introuvable")
+
+    return video_path, None
+
+
+class ExtractorAPIHandler(BaseHTTPRequestHandler):
+    """
+    POST /extract {"path": "/media/movies/Film.mkv"} → extraction immédiate (réponse à la fin)
+    GET  /status → derniers résultats des demandes API
+    """
+
+    def log_message(self, format, *args):
+        pass
+
+    def send_json(self, code, payload):
+        body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if urlparse(self.path).path != "/status":
+            return self.send_json(404, {"error": "route inconnue"})
+        return self.send_json(200, {"recent": dict(recent_results)})
+
+    def do_POST(self):
+        url = urlparse(self.path)
+        if url.path != "/extract":
+            return self.send_json(404, {"error": "route inconnue"})
+
+        if API_TOKEN and self.headers.get("Authorization") != f"Bearer {API_TOKEN}":
+            return self.send_json(401, {"error": "token invalide"})
+
+        path = parse_qs(url.query).get("path", [None])[0]
+        length = int(self.headers.get("Content-Length") or 0)
+        if length:
+            try:
+                path = json.loads(self.rfile.read(length)).get("path", path)
+            except (ValueError, AttributeError):
+                return self.send_json(400, {"error": "JSON invalide"})
+
+        video_path, error = resolve_request_path(path)
+        if error:
+            return self.send_json(error[0], {"error": error[1]})
+
+        log(f"📥 API | Extraction demandée : {os.path.basename(video_path)}")
+        with extraction_lock:
+            try:
+                result = process_video_file(video_path)
+            except Exception as e:
+                log(f"❌ {os.path.basename(video_path)} | Erreur inattendue: {e}")
+                result = "failed"
+
+        recent_results[video_path] = {"result": result, "at": datetime.now().isoformat(timespec="seconds")}
+        return self.send_json(200, {"video": video_path, "result": result})
+
+
+def start_api_server():
+    """Démarre l'API HTTP dans un thread (si API_PORT est défini)"""
+    if not API_PORT:
+        return None
+
+    server = ThreadingHTTPServer((API_HOST, API_PORT), ExtractorAPIHandler)
+    threading.Thread(target=server.serve_forever, name="api", daemon=True).start()
+    log(f"🌐 API HTTP : http://{API_HOST}:{API_PORT} (POST /extract, GET /status)")
+    return server
+
 
 def main():
     mode = "WATCH (agent continu)" if WATCH_MODE else "RUN ONCE (exécution unique)"
     log(f"🐳 Mode: {mode}")
+    install_shutdown_handler()
+    sweep_orphan_temp_files()
+    start_api_server()
     
     if WATCH_MODE:
         interval_hours = WATCH_INTERVAL / 3600
@@ -600,7 +1322,10 @@ def main():
                 log(f"⏳ Nouvelle tentative dans {interval_hours:.1f}h...")
                 time.sleep(WATCH_INTERVAL)
     else:
-        run_extraction()
+        try:
+            run_extraction()
+        except KeyboardInterrupt:
+            log("👋 Arrêt de l'agent demandé")
 
 
 if __name__ == "__main__":
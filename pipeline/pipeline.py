@@ -0,0 +1,364 @@
+import os
+import sys
+import time
+import queue
+import threading
+
+# Exécution depuis le dépôt : les deux agents sont dans les dossiers voisins
+# (dans l'image Docker, tous les scripts sont copiés dans /app)
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+for folder in ("extractor", "translator"):
+    if os.path.isdir(os.path.join(ROOT, folder)):
+        sys.path.insert(0, os.path.join(ROOT, folder))
+
+import extract_subtitle as extractor
+import translate_srt_gemini as translator
+import subtitle_formats
+import bitmap_ocr
+
+# ==========================================
+# pipeline.py - Extraction + traduction en un seul processus
+# ==========================================
+# - Un thread producteur parcourt SOURCE_FOLDERS et extrait la piste EN
+#   du MKV directement en mémoire (aucun .en.XXX.tmp sur le NAS)
+# - Une file bornée (PIPELINE_QUEUE_SIZE) le relie au traducteur (thread principal)
+# - Seul le .{langue}.srt final est écrit à côté de la vidéo
+# - "Pas de piste EN" mémorisé dans STATE_DB (remplace le marqueur .en.nosubtitle.tmp)
+# - PGS : OCR en mémoire ; VobSub (.sub + .idx) : extraction classique sur disque
+# - Configuration : variables des deux agents (SOURCE_FOLDERS, TARGET_LANGUAGES, GEMINI_*...)
+# ==========================================
+
+# =========================
+# CONFIG
+# =========================
+PIPELINE_QUEUE_SIZE = int(os.getenv("PIPELINE_QUEUE_SIZE", 2))  # Sous-titres extraits d'avance en mémoire
+
+BITMAP_FORMATS = ("sup", "sub")
+
+# Un seul journal et un seul profil (PROFILE=true) pour les deux agents
+log = translator.log
+extractor.log = translator.log
+log_routine = translator.log_routine
+extractor.span = translator.span
+
+
+# =========================
+# NO SUBTITLE CACHE
+# =========================
+def is_known_without_subtitle(video_path):
+    """MKV déjà analysé sans piste EN (et inchangé depuis)"""
+    stat = os.stat(video_path)
+    rows = translator.db_execute(
+        "SELECT 1 FROM no_subtitle WHERE video_path = ? AND size = ? AND mtime = ?",
+        (video_path, stat.st_size, stat.st_mtime)
+    )
+    return bool(rows)
+
+
+def remember_no_subtitle(video_path):
+    """Mémorise l'absence de piste EN (clé : chemin + taille + mtime)"""
+    stat = os.stat(video_path)
+    translator.db_execute(
+        "INSERT OR REPLACE INTO no_subtitle (video_path, size, mtime, checked_at) VALUES (?, ?, ?, ?)",
+        (video_path, stat.st_size, stat.st_mtime, time.time())
+    )
+
+
+# =========================
+# IN-MEMORY EXTRACTION
+# =========================
+def memory_source(video_path, languages=None):
+    """
+    Extrait la piste EN d'un MKV en mémoire pour translate_subtitle()
+    languages : langues à produire (skip si toutes déjà en piste dans le MKV)
+    Retourne (source, statut) : source = dict {"name", "key", "cues"} ou None
+    """
+    base, _ = os.path.splitext(video_path)
+    video_name = os.path.basename(video_path)
+
+    if is_known_without_subtitle(video_path):
+        log_routine("sans piste EN", video_path, f"⏭️ {video_name} | Pas de piste EN (MKV déjà analysé)")
+        return None, "no_subtitle_in_mkv"
+
+    tracks, error = extractor.get_tracks(video_path)
+    if error or not tracks:
+        log(f"❌ {video_name} | Erreur analyse MKV ({error or 'analysis_no_tracks'})")
+        return None, "mkv_analysis_error"
+
+    if languages and set(languages) <= extractor.track_languages(tracks, languages):
+        labels = "/".join(language.upper() for language in languages)
+        log_routine("déjà traduit", video_path, f"⏭️ {video_name} | Déjà traduit (piste {labels} dans MKV)")
+        return None, "already_in_mkv"
+
+    # Pistes "und" : langue vérifiée sur la piste extraite, une piste dans une autre langue est écartée
+    track, data, checked = None, None, False
+    for candidate in extractor.english_track_candidates(tracks):
+        if not extractor.needs_language_check(candidate):
+            track = candidate
+            break
+        data, reason = extractor.extract_track_to_memory(video_path, candidate["id"])
+        if data is None:
+            log(f"❌ {video_name} | Erreur extraction MKV ({reason})")
+            return None, "mkv_extraction_error"
+        if extractor.check_track_language(candidate, data, base, video_name):
+            track, checked = candidate, True
+            break
+        data = None
+
+    if track is None:
+        remember_no_subtitle(video_path)
+        log(f"⏭️ {video_name} | Pas de piste EN dans MKV")
+        return None, "no_subtitle_in_mkv"
+
+    fmt = extractor.track_format(track)
+    in_memory_ocr = fmt == "sup" and translator.ocr_available()
+    if fmt in BITMAP_FORMATS and not in_memory_ocr:
+        # VobSub (.idx écrit à côté du .sub) ou OCR indisponible → chemin classique (.en.XXX.tmp)
+        success, reason = extractor.extract_from_mkv(video_path, base, video_name)
+        if not success:
+            log(f"❌ {video_name} | Erreur extraction MKV ({reason})")
+            return None, "mkv_extraction_error"
+        return None, "bitmap"
+
+    if data is None:
+        data, reason = extractor.extract_track_to_memory(video_path, track["id"])
+    if data is None:
+        log(f"❌ {video_name} | Erreur extraction MKV ({reason})")
+        return None, "mkv_extraction_error"
+
+    if in_memory_ocr:
+        cues = translator.ocr_bitmaps(list(bitmap_ocr.iter_pgs(data)), video_name)
+    else:
+        text = data.decode("utf-8-sig", errors="replace")
+        cues = subtitle_formats.parse_cues(text.splitlines(keepends=True), fmt)
+    source = {
+        "name": f"piste {track['id']} ({fmt}, mémoire)",
+        # Clé d'état stable : même MKV + même piste → reprise possible après redémarrage
+        "key": (f"{video_path}#{track['id']}", len(data), os.stat(video_path).st_mtime),
+        "cues": cues,
+        # Piste déclarée anglaise ou déjà vérifiée ci-dessus : pas de nouvelle détection côté translator
+        "language_known": checked or extractor.is_tagged_english(track)
+    }
+    return source, "extracted"
+
+
+def provide_source(video_path):
+    """Source en mémoire pour translate_subtitle() (demandes API sans source sur disque)"""
+    if not video_path.lower().endswith(".mkv"):
+        return None
+    source, _ = memory_source(video_path)
+    return source
+
+
+# =========================
+# PRODUCER
+# =========================
+UNSTABLE_OUTCOMES = ("error", "mkv_analysis_error", "mkv_extraction_error")
+
+
+def produce(jobs, stats):
+    """Parcourt SOURCE_FOLDERS et alimente la file (vidéo, source) ; None = fin du cycle"""
+    try:
+        total_folders = len(translator.SOURCE_FOLDERS)
+        for index, folder in enumerate(translator.SOURCE_FOLDERS, start=1):
+            log(f"📂 [{index}/{total_folders}] Traitement: {folder}")
+            if not os.path.isdir(folder):
+                log(f"  ⚠️ Dossier inexistant, ignoré")
+                continue
+
+            for root, files in translator.scan_folder(folder):
+                for file in files:
+                    if not file.lower().endswith(translator.VIDEO_EXTENSIONS):
+                        continue
+
+                    if extractor.is_trailer(file):
+                        stats["trailers_skipped"] += 1
+                        continue
+
+                    video_path = os.path.join(root, file)
+                    errors = sum(stats[key] for key in UNSTABLE_OUTCOMES)
+                    try:
+                        job = prepare(video_path, stats)
+                    except Exception as e:
+                        log(f"❌ {file} | Erreur inattendue: {e}")
+                        translator.mark_unstable(root)
+                        stats["error"] += 1
+                        stats["total"] += 1
+                        continue
+
+                    # Vidéo à traduire ou en erreur → dossier relisté au prochain cycle
+                    if job is not None or sum(stats[key] for key in UNSTABLE_OUTCOMES) > errors:
+                        translator.mark_unstable(root)
+                    if job is not None:
+                        jobs.put(job)
+    finally:
+        jobs.put(None)
+
+
+def prepare(video_path, stats):
+    """
+    Décide du sort d'une vidéo côté producteur
+    Retourne (vidéo, source) à traduire, ou None si la vidéo est comptée ici
+    """
+    base, ext = os.path.splitext(video_path)
+    video_name = os.path.basename(video_path)
+
+    # Langues restantes (STATE_DB + .{langue}.srt) : rien à faire → pas d'analyse MKV
+    states, _ = translator.pending_languages(video_path, base)
+    if not states:
+        log_routine("déjà traduit", video_path, f"⏭️ {video_name} | Déjà traduit ({', '.join(translator.TARGET_LANGUAGES)})")
+        stats["already_done"] += 1
+        stats["total"] += 1
+        return None
+
+    # Source anglaise déjà sur disque (externe ou extraite avant) : le traducteur la lit
+    if translator.find_english_subtitle(base):
+        return video_path, None
+
+    if ext.lower() != ".mkv":
+        log(f"❌ {video_name} | Pas de source (non-MKV)")
+        stats["no_source"] += 1
+        stats["total"] += 1
+        return None
+
+    missing = [language for language in states if not extractor.find_target_subtitle(base, language)]
+    if not missing:
+        labels = "/".join(language.upper() for language in states)
+        log_routine("déjà traduit", video_path, f"⏭️ {video_name} | Déjà traduit (sous-titre {labels} externe)")
+        stats["already_done"] += 1
+        stats["total"] += 1
+        return None
+
+    source, status = memory_source(video_path, missing)
+    if source is not None or status == "bitmap":
+        return video_path, source
+
+    stats[status] += 1
+    stats["total"] += 1
+    return None
+
+
+# =========================
+# RUN CYCLE
+# =========================
+def run_pipeline():
+    """Un cycle complet : producteur (extraction) → file → traduction (thread principal)"""
+    if not translator.SOURCE_FOLDERS:
+        log("❌ Aucun dossier configuré (SOURCE_FOLDERS vide)")
+        log("   Configurez SOURCE_FOLDERS dans .env : SOURCE_FOLDERS=[\"/path/1\", \"/path/2\"]")
+        return
+
+    log("🚀 DÉBUT DU PIPELINE (extraction en mémoire + traduction)")
+    translator.reset_profile()
+    translator.start_scan_cycle()
+    log(f"📂 {len(translator.SOURCE_FOLDERS)} dossier(s) configuré(s) | File: {PIPELINE_QUEUE_SIZE} | Modèles: {', '.join(translator.MODELS)}")
+
+    stats = {
+        "total": 0,
+        "trailers_skipped": 0,
+        "already_done": 0,
+        "already_in_mkv": 0,
+        "completed": 0,
+        "no_source": 0,
+        "no_subtitle_in_mkv": 0,
+        "unsupported_format": 0,
+        "wrong_language": 0,
+        "mkv_analysis_error": 0,
+        "mkv_extraction_error": 0,
+        "error": 0
+    }
+    producer_stats = dict.fromkeys(stats, 0)
+
+    jobs = queue.Queue(maxsize=PIPELINE_QUEUE_SIZE)
+    translator.metric_callbacks["translator_pipeline_queue_depth"] = lambda: [({}, jobs.qsize())]
+    producer = threading.Thread(target=produce, args=(jobs, producer_stats), name="producer", daemon=True)
+    producer.start()
+
+    while True:
+        job = jobs.get()
+        if job is None:
+            break
+
+        video_path, source = job
+        try:
+            result = translator.translate_subtitle(video_path, source)
+            if result in stats:
+                stats[result] += 1
+        except Exception as e:
+            log(f"❌ {os.path.basename(video_path)} | Erreur inattendue: {e}")
+            stats["error"] += 1
+        stats["total"] += 1
+
+    producer.join()
+    for key, value in producer_stats.items():
+        stats[key] += value
+
+    skipped = stats["already_done"] + stats["already_in_mkv"] + stats["no_subtitle_in_mkv"] + stats["wrong_language"]
+    errors = (stats["error"] + stats["no_source"] + stats["unsupported_format"] +
+              stats["mkv_analysis_error"] + stats["mkv_extraction_error"])
+    log(f"✅ PIPELINE TERMINÉ | Total: {stats['total']} | Complétés: {stats['completed']} | Skippés: {skipped} | Erreurs: {errors}")
+
+    if stats["no_subtitle_in_mkv"] > 0:
+        log(f"  ⏭️ Pas de piste EN dans MKV : {stats['no_subtitle_in_mkv']}")
+    if stats["mkv_analysis_error"] > 0:
+        log(f"  ⚠️ Erreur analyse MKV (timeout/corrompu) : {stats['mkv_analysis_error']}")
+    if stats["mkv_extraction_error"] > 0:
+        log(f"  ⚠️ Erreur extraction MKV (timeout/échec) : {stats['mkv_extraction_error']}")
+    if stats["wrong_language"] > 0:
+        log(f"  🌐 Source non anglaise (détection de langue) : {stats['wrong_language']}")
+    if stats["unsupported_format"] > 0:
+        log(f"  ⚠️ Format bitmap non traduisible : {stats['unsupported_format']}")
+    if stats["no_source"] > 0:
+        log(f"  ⚠️ Aucune source trouvée : {stats['no_source']}")
+    if stats["trailers_skipped"] > 0:
+        log(f"  🚫 Trailers ignorés : {stats['trailers_skipped']}")
+
+    translator.log_hedge_summary()
+    translator.log_routing_summary()
+    translator.log_routine_summary()
+    translator.log_scan_summary()
+    translator.log_profile_summary()
+    log('='*60)
+
+
+# =========================
+# MAIN
+# =========================
+def main():
+    mode = "WATCH (agent continu)" if translator.WATCH_MODE else "RUN ONCE (exécution unique)"
+    log(f"🐳 Mode: {mode} | Pipeline (extraction en mémoire)")
+    translator.install_shutdown_handler()
+    translator.load_quota_ledger()
+    translator.release_own_leases()
+    translator.sweep_partial_files()
+    extractor.sweep_orphan_temp_files()  # VobSub : extrait sur disque pour l'OCR
+
+    # Demandes API sans source sur disque : extraction en mémoire à la volée
+    translator.source_provider = provide_source
+    translator.start_api_server()
+
+    if translator.WATCH_MODE:
+        interval_hours = translator.WATCH_INTERVAL / 3600
+        log(f"⏰ Intervalle: {translator.WATCH_INTERVAL}s ({interval_hours:.1f}h) | CTRL+C pour arrêter")
+
+        while True:
+            try:
+                run_pipeline()
+                log(f"💤 Prochaine vérification dans {interval_hours:.1f}h...")
+                translator.wait_for_next_cycle(translator.WATCH_INTERVAL)
+            except KeyboardInterrupt:
+                log("👋 Arrêt de l'agent demandé")
+                break
+            except Exception as e:
+                log(f"❌ Erreur inattendue: {e}")
+                log(f"⏳ Nouvelle tentative dans {interval_hours:.1f}h...")
+                translator.wait_for_next_cycle(translator.WATCH_INTERVAL)
+    else:
+        try:
+            run_pipeline()
+        except KeyboardInterrupt:
+            log("👋 Arrêt de l'agent demandé")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,314 @@
+import os
+import sys
+import json
+import time
+import shutil
+import tempfile
+import tracemalloc
+
+# Backend factice : aucune clé réelle, état et logs isolés du conteneur
+os.environ.setdefault("GEMINI_API_KEYS", '["bench"]')
+os.environ.setdefault("GEMINI_MODELS", '["bench-model"]')
+os.environ.update({
+    "WATCH_MODE": "false",
+    "PAUSE_SECONDS": "0",
+    "CONTEXT_CACHE": "off",
+    "STREAMING": "false",
+    "HEDGE_REQUESTS": "false",
+    "TRANSLATION_REUSE": "off",
+    "TARGET_LANGUAGES": '["fr"]',
+    "LOG_FILE": "",
+})
+
+import subtitle_formats
+import translate_srt_gemini as translator
+from benchmark import ass_timestamp, generate_ass, generate_vtt, generate_srt
+
+# ==========================================
+# bench_hotpaths.py - chemins chauds du translator (hors réseau)
+# ==========================================
+# Usage : python bench_hotpaths.py [--update] [nb_répliques ...]
+# Mesure, par étape et par fixture (500 → 10k répliques + cas pathologiques) :
+# - find_english_subtitle() (1000 vidéos, source en dernière priorité)
+# - chargement source (SRT/ASS/VTT natif, = convert_to_srt_if_needed() en mémoire)
+# - clean_html_tags(), read_srt(), write_srt()
+# - translate_subtitle() complet avec backend factice (découpage en lots + sauvegardes de progression)
+# Débit (répliques/s) + mémoire crête, comparés à bench_baseline.json :
+# une étape plus lente que BENCH_TIME_TOLERANCE × référence (ou plus gourmande que
+# BENCH_MEMORY_TOLERANCE ×) fait échouer le script (code retour 1).
+# Temps stockés en unités de calibration (charge Python fixe, remesurée avant chaque confirmation).
+# Chaque mesure dure au moins BENCH_MIN_SECONDS ; une étape hors tolérance est remesurée
+# BENCH_RECHECKS fois (calibration fraîche) et n'échoue que si aucune passe ne revient sous la tolérance.
+# --update : réécrit les références après une amélioration voulue
+# ==========================================
+
+DEFAULT_SIZES = [500, 2000, 10000]
+REPEAT = 5
+LOOKUP_VIDEOS = 1000
+BASELINE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "bench_baseline.json")
+TIME_TOLERANCE = float(os.getenv("BENCH_TIME_TOLERANCE", 1.5))
+MEMORY_TOLERANCE = float(os.getenv("BENCH_MEMORY_TOLERANCE", 1.2))
+MIN_SECONDS = float(os.getenv("BENCH_MIN_SECONDS", 0.2))  # durée cumulée minimale d'une mesure
+RECHECKS = int(os.getenv("BENCH_RECHECKS", 2))
+
+
+# =========================
+# FIXTURES PATHOLOGIQUES
+# =========================
+def generate_ass_heavy_tags(path, count):
+    """Balises d'override géantes (karaoké, \\t, \\clip) autour de chaque réplique"""
+    override = "{" + "".join(f"\\k{i}\\t(0,{i * 10},\\fscx{100 + i})\\clip(0,0,{i},{i})" for i in range(60)) + "}"
+    lines = [
+        "[Script Info]",
+        "ScriptType: v4.00+",
+        "",
+        "[Events]",
+        "Format: Layer, Start, End, Style, Name, MarginL, MarginR, MarginV, Effect, Text",
+    ]
+    for i in range(count):
+        start = i * 2500
+        lines.append(
+            f"Dialogue: 0,{ass_timestamp(start)},{ass_timestamp(start + 2000)},Default,,0,0,0,,"
+            f"{override}Line {i},{override} with heavy styling\\Nand a second line."
+        )
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("\n".join(lines) + "\n")
+
+
+def generate_srt_crlf_bom(path, count):
+    """BOM en tête, fins de ligne CRLF et LF mélangées, lignes vides en trop, balises HTML"""
+    blocks = []
+    for i in range(count):
+        newline = "\r\n" if i % 2 else "\n"
+        start = subtitle_formats.format_srt_timestamp(i * 2500)
+        end = subtitle_formats.format_srt_timestamp(i * 2500 + 2000)
+        text = f"<i>Line {i}</i>, <font color=\"#ffff00\">with some</font> dialogue{newline}and a <b>second</b> line."
+        blocks.append(f"{i + 1}{newline}{start} --> {end}{newline}{text}{newline}{newline}" + ("\r\n" if i % 5 == 0 else ""))
+    with open(path, "w", encoding="utf-8-sig", newline="") as f:
+        f.write("".join(blocks))
+
+
+FIXTURES = [
+    ("srt", "bench.en.srt", generate_srt),
+    ("ass", "bench.en.ass.tmp", generate_ass),
+    ("vtt", "bench.en.vtt.tmp", generate_vtt),
+    ("ass_tags", "bench.en.ass.tmp", generate_ass_heavy_tags),
+    ("srt_crlf_bom", "bench.en.srt", generate_srt_crlf_bom),
+]
+# Découpage en lots et sauvegardes ne dépendent pas du format source : traduction complète sur SRT seulement
+# (une passe chronométrée, la passe sous tracemalloc est ~8x plus lente)
+TRANSLATE_FIXTURES = ("srt",)
+
+
+# =========================
+# MESURE
+# =========================
+def fake_call_gemini(model, api_key, text, config=None, retry_count=0):
+    """Backend factice (une langue cible) : chaque ligne renvoyée préfixée, sans latence"""
+    return "\n".join("FR " + line for line in text.split("\n"))
+
+
+def best_time(function, setup=None, repeat=REPEAT):
+    """
+    Meilleur temps sur repeat exécutions au moins, prolongées jusqu'à MIN_SECONDS cumulées :
+    une étape de quelques millisecondes n'est pas jugée sur 5 mesures soumises au bruit de la machine
+    """
+    best = None
+    total = 0.0
+    runs = 0
+    while runs < repeat or total < MIN_SECONDS:
+        if setup:
+            setup()
+        start = time.perf_counter()
+        function()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+        total += elapsed
+        runs += 1
+    return best
+
+
+def measure(function, setup=None, repeat=REPEAT):
+    """Meilleur temps (best_time) + mémoire crête (KiB) d'une exécution supplémentaire"""
+    best = best_time(function, setup, repeat)
+
+    if setup:
+        setup()
+    tracemalloc.start()
+    function()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return best, peak / 1024
+
+
+def bench_lookup(workdir):
+    """find_english_subtitle() : pire cas (Film.srt, après .en.XXX.tmp, .en.XXX et .eng.XXX)"""
+    folder = os.path.join(workdir, "lookup")
+    os.makedirs(folder)
+    bases = []
+    for i in range(LOOKUP_VIDEOS):
+        base = os.path.join(folder, f"Film {i}")
+        open(f"{base}.srt", "w").close()
+        bases.append(base)
+
+    lookup = lambda: [translator.find_english_subtitle(base) for base in bases]
+    seconds, peak = measure(lookup)
+    return [("find_english_subtitle", "srt", LOOKUP_VIDEOS, seconds, peak, lambda: best_time(lookup))]
+
+
+def bench_fixture(workdir, name, filename, generator, count):
+    """Chargement, nettoyage HTML, lecture/écriture SRT et traduction complète d'une fixture"""
+    folder = os.path.join(workdir, f"{name}-{count}")
+    os.makedirs(folder)
+    source = os.path.join(folder, filename)
+    generator(source, count)
+    results = []
+
+    def stage(label, function, setup=None, repeat=REPEAT, count=None):
+        # Fonction de remesure conservée : confirmation d'une régression avant de la signaler
+        seconds, peak = measure(function, setup, repeat)
+        results.append((label, name, count if count is not None else len(cues), seconds, peak,
+                        lambda: best_time(function, setup, repeat)))
+
+    cues = translator.load_source_subtitles(source)[0]
+    stage("load_source", lambda: translator.load_source_subtitles(source))
+
+    srt = os.path.join(folder, "bench.to.srt")
+    if name.startswith("srt"):
+        # Nettoyage HTML mesuré sur le fichier brut (balises incluses), restauré avant chaque passage
+        raw = os.path.join(folder, "raw.srt")
+        shutil.copy(source, raw)
+        stage("clean_html_tags", lambda: translator.clean_html_tags(srt), setup=lambda: shutil.copy(raw, srt))
+
+    stage("write_srt", lambda: subtitle_formats.write_srt(srt, cues))
+    stage("read_srt", lambda: subtitle_formats.read_srt(srt))
+
+    if name not in TRANSLATE_FIXTURES:
+        return results
+
+    video = os.path.join(folder, "bench.mkv")
+    open(video, "w").close()
+    output = os.path.join(folder, "bench.fr.srt")
+
+    def reset_title():
+        translator.db_execute("DELETE FROM titles")
+        if os.path.exists(output):
+            os.remove(output)
+
+    stage("translate_subtitle", lambda: translator.translate_subtitle(video), setup=reset_title, repeat=1)
+    return results
+
+
+# =========================
+# RÉFÉRENCES
+# =========================
+def calibrate():
+    """
+    Durée d'une charge Python fixe, indépendante du code mesuré : les temps sont comparés
+    en unités de calibration → références valables d'une machine (ou d'une charge CPU) à l'autre
+    """
+    def workload():
+        text = "\n".join(f"{i} --> Line {i}, with some dialogue" for i in range(100000))
+        return sorted(text.split("\n"), key=len)[-1].count("7")
+
+    return min(best_time(workload, repeat=5) for _ in range(2))
+
+
+def load_baseline():
+    if not os.path.exists(BASELINE_FILE):
+        return {"calibration": None, "stages": {}}
+    with open(BASELINE_FILE, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def save_baseline(results, calibration):
+    baseline = load_baseline()
+    stages = baseline["stages"]
+    for stage, fixture, count, seconds, peak, _ in results:
+        stages[f"{stage}/{fixture}/{count}"] = {"units": round(seconds / calibration, 4), "peak_kib": round(peak, 1)}
+    with open(BASELINE_FILE, "w", encoding="utf-8") as f:
+        json.dump({"calibration": round(calibration, 6), "stages": dict(sorted(stages.items()))}, f, indent=2)
+        f.write("\n")
+
+
+def confirmed_ratio(rerun, reference_units, ratio):
+    """
+    Étape hors tolérance : remesurée RECHECKS fois, calibration refaite juste avant chaque passe
+    (charge CPU du moment) ; retourne le meilleur ratio obtenu
+    """
+    for _ in range(RECHECKS):
+        if ratio <= TIME_TOLERANCE:
+            break
+        calibration = calibrate()
+        ratio = min(ratio, rerun() / calibration / reference_units)
+    return ratio
+
+
+def compare(results, baseline, calibration):
+    """Affiche le tableau et retourne les régressions détectées (confirmées par remesure)"""
+    regressions = []
+    print(f"{'étape':<22} {'fixture':<13} {'répl.':>6} {'ms':>9} {'répl./s':>10} {'mém. Ki':>9} {'vs réf.':>17}")
+
+    for stage, fixture, count, seconds, peak, rerun in results:
+        reference = baseline["stages"].get(f"{stage}/{fixture}/{count}")
+        if reference:
+            time_ratio = seconds / calibration / reference["units"] if reference["units"] else 1.0
+            if time_ratio > TIME_TOLERANCE:
+                time_ratio = confirmed_ratio(rerun, reference["units"], time_ratio)
+            memory_ratio = peak / reference["peak_kib"] if reference["peak_kib"] else 1.0
+            versus = f"{time_ratio:5.2f}x {memory_ratio:5.2f}x mém"
+            if time_ratio > TIME_TOLERANCE:
+                regressions.append(f"{stage}/{fixture}/{count} : {time_ratio:.2f}x plus lent (tolérance {TIME_TOLERANCE:g}x)")
+                versus += " ❌"
+            if memory_ratio > MEMORY_TOLERANCE:
+                regressions.append(f"{stage}/{fixture}/{count} : mémoire {memory_ratio:.2f}x (tolérance {MEMORY_TOLERANCE:g}x)")
+                versus += " ❌"
+        else:
+            versus = "nouveau"
+
+        print(f"{stage:<22} {fixture:<13} {count:>6} {seconds * 1000:9.1f} {count / seconds:10.0f} {peak:9.0f} {versus:>17}")
+
+    return regressions
+
+
+def main():
+    args = sys.argv[1:]
+    update = "--update" in args
+    sizes = [int(arg) for arg in args if arg != "--update"] or DEFAULT_SIZES
+
+    translator.setup_logger()
+    translator.logger.disabled = True
+    translator.call_gemini = fake_call_gemini
+
+    calibration = calibrate()
+    baseline = load_baseline()
+    if baseline["calibration"]:
+        print(f"⚖️ Calibration : {calibration * 1000:.1f} ms (référence {baseline['calibration'] * 1000:.1f} ms)\n")
+
+    with tempfile.TemporaryDirectory() as workdir:
+        translator.STATE_DB = os.path.join(workdir, "bench.db")
+        translator.SOURCE_FOLDERS = [workdir]
+
+        results = bench_lookup(workdir)
+        for name, filename, generator in FIXTURES:
+            for count in sizes:
+                results += bench_fixture(workdir, name, filename, generator, count)
+
+        if update:
+            compare(results, {"stages": {}}, calibration)
+            save_baseline(results, calibration)
+            print(f"\n💾 Références enregistrées : {BASELINE_FILE}")
+            return
+
+        # Dans le répertoire temporaire : les remesures rejouent les étapes sur leurs fixtures
+        regressions = compare(results, baseline, calibration)
+    if regressions:
+        print("\n❌ RÉGRESSION")
+        for regression in regressions:
+            print(f"  - {regression}")
+        sys.exit(1)
+    print("\n✅ Aucune régression")
+
+
+if __name__ == "__main__":
+    main()
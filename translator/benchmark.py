@@ -0,0 +1,192 @@
+import os
+import re
+import sys
+import time
+import shutil
+import tracemalloc
+import tempfile
+import subprocess
+
+import pysrt
+
+import subtitle_formats
+
+# ==========================================
+# benchmark.py - subtitle_formats vs ffmpeg / pysrt
+# ==========================================
+# Usage : python benchmark.py [nb_répliques ...]
+# Génère des fichiers de test et mesure :
+# - Conversion ASS/VTT : parser natif vs ancien chemin ffmpeg
+#   (copie /tmp → ffmpeg → move → pysrt → nettoyage HTML → save → pysrt)
+# - SRT : comptage, lecture, écriture et mémoire crête, natif vs pysrt
+# ==========================================
+
+DEFAULT_SIZES = [500, 2000, 10000]
+REPEAT = 3
+
+
+def ass_timestamp(milliseconds):
+    seconds, ms = divmod(milliseconds, 1000)
+    minutes, seconds = divmod(seconds, 60)
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours}:{minutes:02d}:{seconds:02d}.{ms // 10:02d}"
+
+
+def vtt_timestamp(milliseconds):
+    return subtitle_formats.format_srt_timestamp(milliseconds).replace(",", ".")
+
+
+def generate_ass(path, count):
+    lines = [
+        "[Script Info]",
+        "ScriptType: v4.00+",
+        "",
+        "[V4+ Styles]",
+        "Format: Name, Fontname, Fontsize, PrimaryColour, Bold, Italic",
+        "Style: Default,Arial,20,&H00FFFFFF,0,0",
+        "",
+        "[Events]",
+        "Format: Layer, Start, End, Style, Name, MarginL, MarginR, MarginV, Effect, Text",
+    ]
+    for i in range(count):
+        start = i * 2500
+        lines.append(
+            f"Dialogue: 0,{ass_timestamp(start)},{ass_timestamp(start + 2000)},Default,,0,0,0,,"
+            f"{{\\i1\\c&H00FF00&}}Line {i}, with some dialogue{{\\i0}}\\Nand a second line."
+        )
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("\n".join(lines) + "\n")
+
+
+def generate_vtt(path, count):
+    blocks = ["WEBVTT\n"]
+    for i in range(count):
+        start = i * 2500
+        blocks.append(
+            f"{i + 1}\n{vtt_timestamp(start)} --> {vtt_timestamp(start + 2000)} align:start position:10%\n"
+            f"<v Speaker>Line {i}, with <i>some</i> dialogue</v>\nand a second line.\n"
+        )
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("\n".join(blocks))
+
+
+def generate_srt(path, count):
+    cues = [
+        subtitle_formats.Cue(i * 2500, i * 2500 + 2000, f"Line {i}, with some dialogue\nand a second line.")
+        for i in range(count)
+    ]
+    subtitle_formats.write_srt(path, cues)
+
+
+def native_path(source):
+    return len(subtitle_formats.read_cues(source))
+
+
+def ffmpeg_path(source, fmt, workdir):
+    """Reproduit l'ancien convert_to_srt_if_needed() + clean_html_tags() + pysrt.open()"""
+    tmp_input = os.path.join(workdir, "input.tmp")
+    tmp_output = os.path.join(workdir, "output.srt")
+    final_srt = os.path.join(workdir, "final.to.srt.tmp")
+
+    shutil.copy(source, tmp_input)
+    input_format = "webvtt" if fmt == "vtt" else "ass"
+    subprocess.run(["ffmpeg", "-f", input_format, "-i", tmp_input, "-c:s", "srt", tmp_output, "-y"],
+                   check=True, capture_output=True, text=True)
+    shutil.move(tmp_output, final_srt)
+    os.remove(tmp_input)
+
+    subs = pysrt.open(final_srt, encoding="utf-8")
+    for sub in subs:
+        sub.text = re.sub(r'<[^>]+>', '', sub.text)
+    subs.save(final_srt, encoding="utf-8")
+
+    count = len(pysrt.open(final_srt, encoding="utf-8"))
+    os.remove(final_srt)
+    return count
+
+
+def best_time(function, *args):
+    best = None
+    result = None
+    for _ in range(REPEAT):
+        start = time.perf_counter()
+        result = function(*args)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def peak_memory(function, *args):
+    """Mémoire crête (KiB) allouée pendant l'appel"""
+    tracemalloc.start()
+    result = function(*args)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del result
+    return peak / 1024
+
+
+def bench_srt(sizes, workdir):
+    print(f"\n{'SRT':<8} {'répliques':>9} {'natif (ms)':>11} {'pysrt (ms)':>11} {'gain':>7}")
+
+    for count in sizes:
+        source = os.path.join(workdir, "bench.en.srt")
+        output = os.path.join(workdir, "bench.fr.srt")
+        generate_srt(source, count)
+
+        cues = subtitle_formats.read_srt(source)
+        subs = pysrt.open(source, encoding="utf-8")
+
+        cases = [
+            ("compter", (subtitle_formats.count_srt_cues, source),
+                        (lambda path: len(pysrt.open(path, encoding="utf-8")), source)),
+            ("lire", (subtitle_formats.read_srt, source),
+                     (lambda path: pysrt.open(path, encoding="utf-8"), source)),
+            ("écrire", (subtitle_formats.write_srt, output, cues),
+                       (lambda path: subs.save(path, encoding="utf-8"), output)),
+        ]
+
+        for label, native_case, pysrt_case in cases:
+            native_time, _ = best_time(*native_case)
+            pysrt_time, _ = best_time(*pysrt_case)
+            print(f"{label:<8} {count:>9} {native_time * 1000:11.1f} {pysrt_time * 1000:11.1f} {pysrt_time / native_time:6.1f}x")
+
+        native_kib = peak_memory(subtitle_formats.read_srt, source)
+        pysrt_kib = peak_memory(lambda path: pysrt.open(path, encoding="utf-8"), source)
+        print(f"{'mémoire':<8} {count:>9} {native_kib:9.0f}Ki {pysrt_kib:9.0f}Ki {pysrt_kib / native_kib:6.1f}x")
+
+
+def main():
+    sizes = [int(arg) for arg in sys.argv[1:]] or DEFAULT_SIZES
+    has_ffmpeg = shutil.which("ffmpeg") is not None
+
+    if not has_ffmpeg:
+        print("⚠️ ffmpeg introuvable → seul le parser natif est mesuré")
+
+    print(f"{'format':<6} {'répliques':>9} {'natif (ms)':>11} {'ffmpeg (ms)':>12} {'gain':>7}")
+
+    with tempfile.TemporaryDirectory() as workdir:
+        for fmt, generator in (("ass", generate_ass), ("vtt", generate_vtt)):
+            for count in sizes:
+                source = os.path.join(workdir, f"bench.en.{fmt}.tmp")
+                generator(source, count)
+
+                native_time, native_count = best_time(native_path, source)
+
+                if has_ffmpeg:
+                    ffmpeg_time, ffmpeg_count = best_time(ffmpeg_path, source, fmt, workdir)
+                    ffmpeg_str = f"{ffmpeg_time * 1000:12.1f}"
+                    gain_str = f"{ffmpeg_time / native_time:6.1f}x"
+                    if ffmpeg_count != native_count:
+                        gain_str += f" (⚠️ {ffmpeg_count} vs {native_count} répliques)"
+                else:
+                    ffmpeg_str = f"{'-':>12}"
+                    gain_str = f"{'-':>7}"
+
+                print(f"{fmt:<6} {native_count:>9} {native_time * 1000:11.1f} {ffmpeg_str} {gain_str}")
+
+        bench_srt(sizes, workdir)
+
+
+if __name__ == "__main__":
+    main()
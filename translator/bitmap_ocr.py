@@ -0,0 +1,497 @@
+import os
+import hashlib
+import subprocess
+from concurrent.futures import ProcessPoolExecutor
+
+from subtitle_formats import Cue
+
+# ==========================================
+# bitmap_ocr.py - OCR des sous-titres image (PGS / VobSub)
+# ==========================================
+# - Décodeur PGS (.sup Blu-ray) : segments PCS/PDS/ODS/END → images RLE
+# - Décodeur VobSub (.idx + .sub DVD) : paquets MPEG-PS → SPU → images RLE 2 bits
+# - Rendu PGM noir sur blanc (sans dépendance image) → Tesseract (stdin)
+# - Images dédupliquées par empreinte : un même bitmap n'est reconnu qu'une fois
+# - OCR réparti sur un pool de processus (décodage RLE + Tesseract = CPU)
+# ==========================================
+
+PGS_PCS = 0x16
+PGS_PDS = 0x14
+PGS_ODS = 0x15
+PGS_END = 0x80
+
+DEFAULT_DURATION = 4000  # ms, dernière image sans fin explicite
+IMAGE_PADDING = 10  # marge blanche autour du texte (améliore Tesseract)
+TESSERACT_TIMEOUT = 60
+
+
+class Bitmap:
+    """
+    Image de sous-titre encodée (RLE), décodée seulement au moment de l'OCR
+    levels : (luminance 0-255, opacité 0-255) par index de couleur
+    offsets : VobSub uniquement, début des champs pair/impair dans data
+    """
+    __slots__ = ("start", "end", "y", "kind", "width", "height", "data", "levels", "offsets")
+
+    def __init__(self, start, end, y, kind, width, height, data, levels, offsets=None):
+        self.start = start
+        self.end = end
+        self.y = y
+        self.kind = kind
+        self.width = width
+        self.height = height
+        self.data = data
+        self.levels = levels
+        self.offsets = offsets
+
+
+# =========================
+# PGS (.sup)
+# =========================
+def iter_pgs_segments(data):
+    """Parcourt les segments PGS : (pts en ms, type, contenu)"""
+    position = 0
+    while position + 13 <= len(data):
+        if data[position:position + 2] != b"PG":
+            # Octets parasites : resynchronisation sur le prochain en-tête
+            position = data.find(b"PG", position + 1)
+            if position < 0:
+                return
+            continue
+        pts = int.from_bytes(data[position + 2:position + 6], "big") // 90
+        segment_type = data[position + 10]
+        size = int.from_bytes(data[position + 11:position + 13], "big")
+        yield pts, segment_type, data[position + 13:position + 13 + size]
+        position += 13 + size
+
+
+def iter_pgs(data):
+    """Parcourt un flux PGS et produit un Bitmap par objet affiché (ordre du fichier)"""
+    palettes = {}
+    objects = {}
+    composition = None  # ensemble en cours de définition (avant END)
+    shown = []  # objets affichés : (début, y, largeur, hauteur, rle, niveaux)
+
+    for pts, segment_type, body in iter_pgs_segments(data):
+        if segment_type == PGS_PCS and len(body) >= 11:
+            state = body[7]
+            palette_only = body[8] & 0x80
+            if palette_only and not state:
+                continue
+
+            # Toute nouvelle composition termine l'affichage précédent
+            for start, y, width, height, rle, levels in shown:
+                if pts > start:
+                    yield Bitmap(start, pts, y, "pgs", width, height, rle, levels)
+            shown = []
+
+            if state & 0x80:
+                # Début d'époque : palettes et objets repartent de zéro
+                palettes = {}
+                objects = {}
+
+            placements = []
+            position = 11
+            for _ in range(body[10]):
+                if position + 8 > len(body):
+                    break
+                object_id = int.from_bytes(body[position:position + 2], "big")
+                cropped = body[position + 3] & 0x80
+                y = int.from_bytes(body[position + 6:position + 8], "big")
+                placements.append((object_id, y))
+                position += 16 if cropped else 8
+            composition = (pts, body[9], placements) if placements else None
+
+        elif segment_type == PGS_PDS and len(body) >= 2:
+            palette = palettes.setdefault(body[0], {})
+            for position in range(2, len(body) - 4, 5):
+                index, luma, _, _, alpha = body[position:position + 5]
+                palette[index] = (luma, alpha)
+
+        elif segment_type == PGS_ODS and len(body) >= 4:
+            object_id = int.from_bytes(body[0:2], "big")
+            if body[3] & 0x80 and len(body) >= 11:
+                width = int.from_bytes(body[7:9], "big")
+                height = int.from_bytes(body[9:11], "big")
+                objects[object_id] = [width, height, bytearray(body[11:])]
+            elif object_id in objects:
+                objects[object_id][2] += body[4:]
+
+        elif segment_type == PGS_END and composition is not None:
+            start, palette_id, placements = composition
+            palette = palettes.get(palette_id, {})
+            levels = tuple(palette.get(index, (0, 0)) for index in range(256))
+            for object_id, y in placements:
+                if object_id in objects:
+                    width, height, rle = objects[object_id]
+                    shown.append((start, y, width, height, bytes(rle), levels))
+            composition = None
+
+    for start, y, width, height, rle, levels in shown:
+        yield Bitmap(start, start + DEFAULT_DURATION, y, "pgs", width, height, rle, levels)
+
+
+def decode_pgs_rle(bitmap):
+    """RLE PGS → index de couleur par pixel (bytearray largeur × hauteur)"""
+    data = bitmap.data
+    width = bitmap.width
+    pixels = bytearray()
+    line = bytearray()
+    position = 0
+    size = len(data)
+
+    while position < size:
+        byte = data[position]
+        position += 1
+        if byte:
+            line.append(byte)
+            continue
+
+        if position >= size:
+            break
+        flags = data[position]
+        position += 1
+        if flags == 0:
+            # Fin de ligne
+            pixels += line[:width].ljust(width, b"\x00")
+            line = bytearray()
+            continue
+
+        count = flags & 0x3F
+        if flags & 0x40:
+            count = (count << 8) | data[position]
+            position += 1
+        color = 0
+        if flags & 0x80:
+            color = data[position]
+            position += 1
+        line += bytes((color,)) * count
+
+    if line:
+        pixels += line[:width].ljust(width, b"\x00")
+    return pixels[:width * bitmap.height].ljust(width * bitmap.height, b"\x00")
+
+
+def count_pgs(data):
+    """Nombre d'affichages d'un flux PGS (compositions avec au moins un objet)"""
+    return sum(
+        1 for _, segment_type, body in iter_pgs_segments(data)
+        if segment_type == PGS_PCS and len(body) >= 11 and body[10] and not (body[8] & 0x80 and not body[7])
+    )
+
+
+# =========================
+# VOBSUB (.idx + .sub)
+# =========================
+def parse_idx_timestamp(value):
+    """HH:MM:SS:mmm → millisecondes"""
+    hours, minutes, seconds, milliseconds = (int(part) for part in value.strip().split(":"))
+    return ((hours * 60 + minutes) * 60 + seconds) * 1000 + milliseconds
+
+
+def parse_idx(text):
+    """Lit un .idx : (palette 16 couleurs en luminance, [(début ms, position dans .sub)])"""
+    palette = [0] * 16
+    entries = []
+    for line in text.splitlines():
+        line = line.strip()
+        if line.startswith("palette:"):
+            colors = [color.strip() for color in line[8:].split(",")]
+            for index, color in enumerate(colors[:16]):
+                try:
+                    rgb = int(color, 16)
+                except ValueError:
+                    continue
+                red, green, blue = (rgb >> 16) & 0xFF, (rgb >> 8) & 0xFF, rgb & 0xFF
+                palette[index] = (red * 299 + green * 587 + blue * 114) // 1000
+        elif line.startswith("timestamp:"):
+            timestamp, _, filepos = line[10:].partition(",")
+            try:
+                entries.append((parse_idx_timestamp(timestamp), int(filepos.split(":")[1].strip(), 16)))
+            except (ValueError, IndexError):
+                continue
+    return palette, entries
+
+
+def read_spu_packet(data, position):
+    """Assemble un paquet SPU (sous-flux 0x20-0x3F) réparti sur des paquets PES MPEG-PS"""
+    spu = bytearray()
+    spu_size = None
+
+    while position + 6 <= len(data):
+        if data[position:position + 4] == b"\x00\x00\x01\xba":
+            # En-tête de pack (MPEG-2 : 14 octets + bourrage, MPEG-1 : 12 octets)
+            if data[position + 4] & 0xC0 == 0x40:
+                position += 14 + (data[position + 13] & 0x07)
+            else:
+                position += 12
+            continue
+
+        if data[position:position + 3] != b"\x00\x00\x01":
+            break
+
+        stream_id = data[position + 3]
+        length = int.from_bytes(data[position + 4:position + 6], "big")
+        end = position + 6 + length
+
+        if stream_id == 0xBD:
+            payload = position + 9 + data[position + 8]
+            spu += data[payload + 1:end]  # 1er octet : numéro de sous-flux
+            if spu_size is None and len(spu) >= 2:
+                spu_size = int.from_bytes(spu[0:2], "big")
+            if spu_size is not None and len(spu) >= spu_size:
+                return bytes(spu[:spu_size])
+
+        position = end
+
+    return bytes(spu) if spu_size and len(spu) >= spu_size else None
+
+
+def parse_spu(spu, palette, timestamp):
+    """Paquet SPU → Bitmap (ou None si vide/illisible) ; délais en unités de 1024/90000 s"""
+    if len(spu) < 4:
+        return None
+
+    control = int.from_bytes(spu[2:4], "big")
+    start = end = None
+    colors = (0, 0, 0, 0)
+    alphas = (0, 15, 15, 15)
+    area = None
+    offsets = None
+
+    position = control
+    while position + 4 <= len(spu):
+        delay = int.from_bytes(spu[position:position + 2], "big") * 1024 // 90
+        following = int.from_bytes(spu[position + 2:position + 4], "big")
+        cursor = position + 4
+        while cursor < len(spu):
+            command = spu[cursor]
+            cursor += 1
+            if command == 0x01:
+                start = delay
+            elif command == 0x02:
+                end = delay
+            elif command == 0x03 and cursor + 2 <= len(spu):
+                colors = (spu[cursor + 1] & 0x0F, spu[cursor + 1] >> 4, spu[cursor] & 0x0F, spu[cursor] >> 4)
+                cursor += 2
+            elif command == 0x04 and cursor + 2 <= len(spu):
+                alphas = (spu[cursor + 1] & 0x0F, spu[cursor + 1] >> 4, spu[cursor] & 0x0F, spu[cursor] >> 4)
+                cursor += 2
+            elif command == 0x05 and cursor + 6 <= len(spu):
+                b = spu[cursor:cursor + 6]
+                area = ((b[0] << 4) | (b[1] >> 4), ((b[1] & 0x0F) << 8) | b[2],
+                        (b[3] << 4) | (b[4] >> 4), ((b[4] & 0x0F) << 8) | b[5])
+                cursor += 6
+            elif command == 0x06 and cursor + 4 <= len(spu):
+                offsets = (int.from_bytes(spu[cursor:cursor + 2], "big"), int.from_bytes(spu[cursor + 2:cursor + 4], "big"))
+                cursor += 4
+            elif command == 0x00:
+                continue
+            else:
+                break  # 0xFF (fin) ou commande inconnue
+        if following <= position:
+            break
+        position = following
+
+    if area is None or offsets is None:
+        return None
+    x1, x2, y1, y2 = area
+    width, height = x2 - x1 + 1, y2 - y1 + 1
+    if width <= 0 or height <= 0:
+        return None
+
+    levels = tuple((palette[colors[index]], alphas[index] * 17) for index in range(4))
+    begin = timestamp + (start or 0)
+    finish = timestamp + end if end is not None else None
+    return Bitmap(begin, finish, y1, "vobsub", width, height, spu, levels, offsets)
+
+
+def iter_vobsub(idx_text, sub_data):
+    """Parcourt un VobSub (.idx + contenu du .sub) et produit les Bitmap (ordre du fichier)"""
+    palette, entries = parse_idx(idx_text)
+    for number, (timestamp, filepos) in enumerate(entries):
+        spu = read_spu_packet(sub_data, filepos)
+        bitmap = parse_spu(spu, palette, timestamp) if spu else None
+        if bitmap is None:
+            continue
+        if bitmap.end is None or bitmap.end <= bitmap.start:
+            following = entries[number + 1][0] if number + 1 < len(entries) else None
+            bitmap.end = following if following and following > bitmap.start else bitmap.start + DEFAULT_DURATION
+        yield bitmap
+
+
+def decode_vobsub_rle(bitmap):
+    """RLE VobSub (quartets, champs pair/impair entrelacés) → index de couleur par pixel"""
+    data = bitmap.data
+    width, height = bitmap.width, bitmap.height
+    pixels = bytearray(width * height)
+
+    for field, offset in enumerate(bitmap.offsets):
+        nibble = offset * 2
+
+        def read():
+            nonlocal nibble
+            byte = data[nibble >> 1]
+            value = (byte >> 4) if nibble % 2 == 0 else (byte & 0x0F)
+            nibble += 1
+            return value
+
+        try:
+            for row in range(field, height, 2):
+                x = 0
+                base = row * width
+                while x < width:
+                    value = read()
+                    if value < 0x4:
+                        value = (value << 4) | read()
+                        if value < 0x10:
+                            value = (value << 4) | read()
+                            if value < 0x40:
+                                value = (value << 4) | read()
+                    count = value >> 2
+                    if count == 0 or x + count > width:
+                        count = width - x
+                    pixels[base + x:base + x + count] = bytes((value & 0x03,)) * count
+                    x += count
+                if nibble % 2:
+                    nibble += 1  # lignes alignées sur l'octet
+        except IndexError:
+            continue
+    return pixels
+
+
+def count_vobsub(idx_text):
+    """Nombre d'affichages d'un VobSub (entrées timestamp du .idx)"""
+    return sum(1 for line in idx_text.splitlines() if line.strip().startswith("timestamp:"))
+
+
+# =========================
+# OCR
+# =========================
+def bitmap_hash(bitmap):
+    """Empreinte d'une image (données RLE + niveaux) : les bitmaps répétés partagent leur OCR"""
+    digest = hashlib.sha1(bitmap.kind.encode("ascii"))
+    digest.update(f"{bitmap.width}x{bitmap.height}:{bitmap.offsets}".encode("ascii"))
+    digest.update(bytes(value for level in bitmap.levels for value in level))
+    digest.update(bitmap.data)
+    return digest.hexdigest()
+
+
+def render_pgm(bitmap):
+    """
+    Image PGM binaire : texte noir sur fond blanc
+    Un pixel est du texte si luminance × opacité ≥ la moitié du maximum de l'image
+    (texte clair, contour sombre et transparence ignorés)
+    """
+    indices = decode_pgs_rle(bitmap) if bitmap.kind == "pgs" else decode_vobsub_rle(bitmap)
+
+    weights = [luma * alpha for luma, alpha in bitmap.levels]
+    brightest = max(weights) or 1
+    table = bytes(0 if weight * 2 >= brightest and weight else 255 for weight in weights).ljust(256, b"\xff")
+    pixels = indices.translate(table)
+
+    width = bitmap.width + 2 * IMAGE_PADDING
+    blank = b"\xff" * (width * IMAGE_PADDING)
+    side = b"\xff" * IMAGE_PADDING
+    rows = [
+        side + pixels[row * bitmap.width:(row + 1) * bitmap.width] + side
+        for row in range(bitmap.height)
+    ]
+    header = f"P5 {width} {bitmap.height + 2 * IMAGE_PADDING} 255\n".encode("ascii")
+    return header + blank + b"".join(rows) + blank
+
+
+def clean_ocr_text(text):
+    """Lignes vides supprimées, confusions Tesseract courantes (| → I)"""
+    lines = [line.strip().replace("|", "I") for line in text.splitlines()]
+    return "\n".join(line for line in lines if line)
+
+
+def ocr_bitmap(bitmap, language="eng"):
+    """Reconnaît le texte d'une image (exécuté dans un processus du pool)"""
+    try:
+        result = subprocess.run(
+            ["tesseract", "stdin", "stdout", "-l", language, "--psm", "6"],
+            input=render_pgm(bitmap),
+            capture_output=True,
+            timeout=TESSERACT_TIMEOUT
+        )
+    except (subprocess.TimeoutExpired, OSError):
+        return ""
+    if result.returncode != 0:
+        return ""
+    return clean_ocr_text(result.stdout.decode("utf-8", errors="replace"))
+
+
+def recognize(bitmaps, lookup=None, workers=None, language="eng"):
+    """
+    OCR d'une liste de Bitmap → répliques texte (objets simultanés regroupés, de haut en bas)
+    lookup : fonction [empreintes] → {empreinte: texte} (cache persistant, optionnel)
+    Retourne (répliques, {empreinte: texte} des images reconnues pendant cet appel)
+    """
+    hashes = [bitmap_hash(bitmap) for bitmap in bitmaps]
+    known = dict(lookup(sorted(set(hashes)))) if lookup else {}
+
+    todo = {}
+    for digest, bitmap in zip(hashes, bitmaps):
+        if digest not in known and digest not in todo:
+            todo[digest] = bitmap
+
+    recognized = {}
+    if todo:
+        workers = workers or os.cpu_count() or 1
+        if workers > 1 and len(todo) > 1:
+            chunksize = max(1, len(todo) // (workers * 4))
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                texts = pool.map(ocr_bitmap, todo.values(), [language] * len(todo), chunksize=chunksize)
+                recognized = dict(zip(todo, texts))
+        else:
+            recognized = {digest: ocr_bitmap(bitmap, language) for digest, bitmap in todo.items()}
+    known.update(recognized)
+
+    cues = []
+    order = sorted(range(len(bitmaps)), key=lambda index: (bitmaps[index].start, bitmaps[index].y))
+    for index in order:
+        bitmap = bitmaps[index]
+        text = known.get(hashes[index], "")
+        if not text:
+            continue
+        if cues and cues[-1].start == bitmap.start and cues[-1].end == bitmap.end:
+            cues[-1].text += "\n" + text
+        else:
+            cues.append(Cue(bitmap.start, bitmap.end, text))
+    return cues, recognized
+
+
+# =========================
+# READ
+# =========================
+def idx_path(sub_path):
+    """Fichier .idx associé à un .sub (Film.en.sub.tmp → Film.en.idx.tmp)"""
+    if sub_path.endswith(".tmp"):
+        return idx_path(sub_path[:-4]) + ".tmp"
+    return os.path.splitext(sub_path)[0] + ".idx"
+
+
+def read_bitmaps(path):
+    """Lit un .sup (PGS) ou .sub (+ .idx VobSub) → liste de Bitmap"""
+    name = path[:-4] if path.endswith(".tmp") else path
+    with open(path, "rb") as f:
+        data = f.read()
+
+    if name.lower().endswith(".sup"):
+        return list(iter_pgs(data))
+
+    with open(idx_path(path), "r", encoding="utf-8", errors="replace") as f:
+        return list(iter_vobsub(f.read(), data))
+
+
+def count_bitmap_cues(path):
+    """Nombre d'affichages d'un .sup / .sub sans décoder les images"""
+    name = path[:-4] if path.endswith(".tmp") else path
+    if name.lower().endswith(".sup"):
+        with open(path, "rb") as f:
+            return count_pgs(f.read())
+
+    with open(idx_path(path), "r", encoding="utf-8", errors="replace") as f:
+        return count_vobsub(f.read())
@@ -0,0 +1,57 @@
+import re
+
+# ==========================================
+# language_detection.py - Langue d'un sous-titre, hors ligne
+# ==========================================
+# - Partagé par l'extractor (pistes "und" du MKV) et le translator (sources sans langue)
+# - Comptage des mots outils par langue sur un échantillon de répliques, aucune dépendance
+# - Résultat indéterminé (échantillon court ou ambigu) → la source est traitée comme de l'anglais
+# ==========================================
+
+# Mots outils les plus fréquents par langue (les mots partagés entre langues proches sont exclus) :
+# quelques centaines de mots d'un échantillon de répliques suffisent à distinguer ces langues
+LANGUAGE_STOPWORDS = {
+    "en": {"the", "and", "you", "that", "what", "this", "with", "have", "are", "was", "for", "not", "your", "just",
+           "don't", "it's", "i'm", "know", "there", "they", "will", "would", "can't", "we're", "right", "okay",
+           "about", "want", "going", "yeah", "he's", "she's", "of", "to", "it", "my", "be", "we", "all", "him"},
+    "fr": {"le", "et", "est", "je", "vous", "nous", "pas", "une", "des", "c'est", "ce", "ça", "elle", "mais",
+           "pour", "avec", "dans", "sur", "mon", "ton", "oui", "tout", "suis", "j'ai", "au", "aux", "moi", "toi",
+           "fait", "très", "rien", "où", "qu'il", "n'est"},
+    "es": {"el", "los", "las", "y", "es", "qué", "por", "pero", "del", "al", "lo", "está", "estás", "estoy", "tengo",
+           "yo", "tú", "usted", "sí", "bueno", "muy", "cómo", "dónde", "aquí", "eso", "esto", "puedo", "señor",
+           "hay", "ya", "ahora", "algo", "quiero", "creo", "soy", "eres", "gracias", "ella"},
+    "de": {"der", "die", "das", "und", "ist", "nicht", "ich", "du", "sie", "wir", "ihr", "ein", "eine", "mit",
+           "auf", "für", "zu", "den", "dem", "wie", "ja", "nein", "auch", "noch", "mir", "dich", "mich", "jetzt",
+           "bin", "hast", "sind", "kann"},
+    "it": {"il", "gli", "della", "che", "non", "è", "sono", "io", "lui", "lei", "noi", "voi", "per", "cosa",
+           "questo", "quello", "bene", "grazie", "ho", "hai", "perché", "anche", "molto", "ci"},
+    "pt": {"o", "os", "não", "é", "eu", "você", "vocês", "um", "uma", "com", "mas", "isso", "isto", "estou",
+           "tenho", "sim", "obrigado", "muito", "aqui", "ele", "ela", "nós", "dos", "meu", "minha", "então",
+           "também"},
+    "nl": {"het", "een", "en", "ik", "jij", "niet", "dat", "wat", "zijn", "wij", "met", "voor", "maar", "op",
+           "naar", "ook", "nog", "heb", "hebt", "kan", "waar", "dit", "geen", "wel", "goed", "nee"},
+}
+LANGUAGE_SAMPLE_CUES = 200  # répliques examinées, réparties sur tout le fichier
+LANGUAGE_MIN_WORDS = 40  # en dessous : indéterminé (piste forcée, quelques panneaux)
+LANGUAGE_MIN_SHARE = 0.1  # part minimale de mots outils de la langue retenue
+LANGUAGE_MIN_MARGIN = 1.5  # la langue retenue doit avoir 1.5x plus de mots outils que la suivante
+WORD_PATTERN = re.compile(r"[^\W\d_]+(?:'[^\W\d_]+)?")
+
+
+def detect_language(texts):
+    """
+    Langue d'une liste de répliques : (code ISO 639-1, part de mots outils)
+    (None, part) si l'échantillon est trop court ou ambigu → traité comme de l'anglais
+    """
+    step = max(len(texts) // LANGUAGE_SAMPLE_CUES, 1)
+    words = WORD_PATTERN.findall(" ".join(texts[::step][:LANGUAGE_SAMPLE_CUES]).lower().replace("’", "'"))
+    if len(words) < LANGUAGE_MIN_WORDS:
+        return None, 0.0
+
+    hits = {language: sum(1 for word in words if word in stopwords) for language, stopwords in LANGUAGE_STOPWORDS.items()}
+    ranked = sorted(hits, key=hits.get, reverse=True)
+    best, second = hits[ranked[0]], hits[ranked[1]]
+    share = best / len(words)
+    if share < LANGUAGE_MIN_SHARE or best < second * LANGUAGE_MIN_MARGIN:
+        return None, share
+    return ranked[0], share
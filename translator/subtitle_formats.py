@@ -0,0 +1,319 @@
+import os
+import re
+
+# ==========================================
+# subtitle_formats.py - Lecture native des sous-titres texte
+# ==========================================
+# - Parser ASS/SSA (événements Dialogue, balises {\...}, \N)
+# - Parser WebVTT (réglages de cue, balises <c>/<v>/<i>, entités)
+# - Lecture en flux (ligne par ligne) → répliques texte propres en mémoire
+# - Lecteur/écrivain SRT compact (remplace pysrt sur le chemin critique)
+# - Comptage rapide des répliques SRT sans construire d'objets
+# - Écriture atomique (.partial + fsync + renommage) : jamais de sortie tronquée
+# ==========================================
+
+
+class Cue:
+    """Réplique de sous-titre : début/fin en millisecondes + texte propre"""
+    __slots__ = ("start", "end", "text")
+
+    def __init__(self, start, end, text):
+        self.start = start
+        self.end = end
+        self.text = text
+
+    def __repr__(self):
+        return f"Cue({self.start}, {self.end}, {self.text!r})"
+
+
+# =========================
+# FORMAT DETECTION
+# =========================
+def detect_format(path):
+    """Format d'un fichier de sous-titre d'après son nom (Film.en.ass.tmp → ass)"""
+    name = path[:-4] if path.endswith(".tmp") else path
+    return name.rsplit(".", 1)[-1].lower()
+
+
+# =========================
+# ASS / SSA
+# =========================
+ASS_OVERRIDE_RE = re.compile(r"\{[^}]*\}")
+ASS_DRAWING_RE = re.compile(r"\\p([0-9]+)")
+ASS_DEFAULT_FORMAT = ["layer", "start", "end", "style", "name", "marginl", "marginr", "marginv", "effect", "text"]
+
+
+def parse_ass_timestamp(value):
+    """H:MM:SS.cc → millisecondes"""
+    hours, minutes, seconds = value.strip().split(":")
+    seconds, _, fraction = seconds.partition(".")
+    fraction = (fraction + "00")[:2]
+    return ((int(hours) * 60 + int(minutes)) * 60 + int(seconds)) * 1000 + int(fraction) * 10
+
+
+def clean_ass_text(text):
+    """
+    Nettoie le texte d'un événement ASS :
+    - supprime les blocs de dessin vectoriel (\\p1 ... \\p0)
+    - supprime les balises de surcharge {\\...}
+    - \\N / \\n → saut de ligne, \\h → espace
+    """
+    if "{" in text:
+        parts = []
+        drawing = False
+        position = 0
+        for match in ASS_OVERRIDE_RE.finditer(text):
+            if not drawing:
+                parts.append(text[position:match.start()])
+            for level in ASS_DRAWING_RE.findall(match.group(0)):
+                drawing = level != "0"
+            position = match.end()
+        if not drawing:
+            parts.append(text[position:])
+        text = "".join(parts)
+
+    text = text.replace("\\N", "\n").replace("\\n", "\n").replace("\\h", " ")
+    lines = [line.strip() for line in text.split("\n")]
+    return "\n".join(line for line in lines if line)
+
+
+def iter_ass(lines):
+    """Parcourt un flux de lignes ASS/SSA et produit les répliques (ordre du fichier)"""
+    in_events = False
+    fields = ASS_DEFAULT_FORMAT
+
+    for line in lines:
+        line = line.strip()
+
+        if line.startswith("["):
+            in_events = line.lower() == "[events]"
+            continue
+
+        if not in_events:
+            continue
+
+        if line.lower().startswith("format:"):
+            fields = [field.strip().lower() for field in line[7:].split(",")]
+            continue
+
+        if not line.startswith("Dialogue:"):
+            continue
+
+        values = line[9:].split(",", len(fields) - 1)
+        if len(values) < len(fields):
+            continue
+
+        event = dict(zip(fields, values))
+        try:
+            start = parse_ass_timestamp(event["start"])
+            end = parse_ass_timestamp(event["end"])
+        except (KeyError, ValueError):
+            continue
+
+        text = clean_ass_text(event.get("text", ""))
+        if text:
+            yield Cue(start, end, text)
+
+
+# =========================
+# WEBVTT
+# =========================
+VTT_TAG_RE = re.compile(r"<[^>]+>")
+VTT_ENTITIES = {"&amp;": "&", "&lt;": "<", "&gt;": ">", "&nbsp;": " ", "&lrm;": "", "&rlm;": "", "&quot;": '"'}
+
+
+def parse_vtt_timestamp(value):
+    """[HH:]MM:SS.mmm → millisecondes"""
+    parts = value.strip().split(":")
+    seconds, _, fraction = parts[-1].partition(".")
+    hours = int(parts[0]) if len(parts) == 3 else 0
+    minutes = int(parts[-2])
+    return ((hours * 60 + minutes) * 60 + int(seconds)) * 1000 + int((fraction + "000")[:3])
+
+
+def clean_vtt_text(lines):
+    """Supprime balises (<c>, <v>, <i>, horodatages karaoké) et entités HTML"""
+    cleaned = []
+    for line in lines:
+        line = VTT_TAG_RE.sub("", line)
+        if "&" in line:
+            for entity, value in VTT_ENTITIES.items():
+                line = line.replace(entity, value)
+        line = line.strip()
+        if line:
+            cleaned.append(line)
+    return "\n".join(cleaned)
+
+
+def iter_vtt(lines):
+    """Parcourt un flux de lignes WebVTT et produit les répliques"""
+    timing = None
+    payload = []
+    skip_block = False
+
+    for line in lines:
+        line = line.rstrip("\r\n")
+
+        if not line.strip():
+            if timing and payload:
+                text = clean_vtt_text(payload)
+                if text:
+                    yield Cue(timing[0], timing[1], text)
+            timing = None
+            payload = []
+            skip_block = False
+            continue
+
+        if skip_block:
+            continue
+
+        if timing is None:
+            if "-->" in line:
+                # Réglages de cue (align:, position:, line:...) ignorés après la fin
+                start, _, rest = line.partition("-->")
+                try:
+                    timing = (parse_vtt_timestamp(start), parse_vtt_timestamp(rest.split()[0]))
+                except (ValueError, IndexError):
+                    skip_block = True
+            elif line.startswith(("WEBVTT", "NOTE", "STYLE", "REGION")):
+                skip_block = True
+            # Sinon : identifiant de cue, ignoré
+            continue
+
+        payload.append(line)
+
+    if timing and payload:
+        text = clean_vtt_text(payload)
+        if text:
+            yield Cue(timing[0], timing[1], text)
+
+
+# =========================
+# SRT
+# =========================
+SRT_TIMING_RE = re.compile(
+    r"(\d+):(\d{1,2}):(\d{1,2})[,.](\d{1,3})\s*-->\s*(\d+):(\d{1,2}):(\d{1,2})[,.](\d{1,3})"
+)
+
+
+def parse_srt_timing(line):
+    """Ligne de timing SRT → (début, fin) en millisecondes, None si invalide"""
+    match = SRT_TIMING_RE.search(line)
+    if not match:
+        return None
+    h1, m1, s1, f1, h2, m2, s2, f2 = match.groups()
+    start = ((int(h1) * 60 + int(m1)) * 60 + int(s1)) * 1000 + int(f1.ljust(3, "0"))
+    end = ((int(h2) * 60 + int(m2)) * 60 + int(s2)) * 1000 + int(f2.ljust(3, "0"))
+    return start, end
+
+
+def iter_srt(lines):
+    """
+    Parcourt un flux de lignes SRT et produit les répliques
+    Tolérant : BOM, CRLF, index manquant, lignes vides multiples
+    """
+    timing = None
+    payload = []
+
+    for line in lines:
+        line = line.rstrip("\r\n")
+
+        if not line.strip():
+            if timing is not None:
+                yield Cue(timing[0], timing[1], "\n".join(payload))
+                timing = None
+                payload = []
+            continue
+
+        if timing is None:
+            # Index (ignoré) ou ligne de timing
+            timing = parse_srt_timing(line) if "-->" in line else None
+            continue
+
+        payload.append(line)
+
+    if timing is not None:
+        yield Cue(timing[0], timing[1], "\n".join(payload))
+
+
+def read_srt(path):
+    """Lit un fichier SRT complet en liste de répliques"""
+    with open(path, "r", encoding="utf-8-sig", errors="replace") as f:
+        return list(iter_srt(f))
+
+
+def count_srt_cues(path):
+    """Compte les répliques d'un SRT sans construire d'objets (lignes de timing '-->')"""
+    count = 0
+    with open(path, "rb") as f:
+        while True:
+            chunk = f.read(1 << 20)
+            if not chunk:
+                break
+            count += chunk.count(b"-->")
+    return count
+
+
+# =========================
+# READ / WRITE
+# =========================
+def parse_cues(lines, fmt):
+    """
+    Parse un flux de lignes au format donné (srt, ass, ssa, vtt)
+    SRT : ordre du fichier conservé ; ASS/SSA/VTT : répliques triées par début
+    """
+    if fmt == "srt":
+        return list(iter_srt(lines))
+
+    parser = iter_vtt if fmt == "vtt" else iter_ass
+    cues = list(parser(lines))
+    cues.sort(key=lambda cue: cue.start)
+    return cues
+
+
+def read_cues(path):
+    """
+    Lit un fichier ASS/SSA/VTT et retourne les répliques triées par début
+    (lecture en flux, aucun fichier intermédiaire)
+    """
+    with open(path, "r", encoding="utf-8-sig", errors="replace") as f:
+        return parse_cues(f, detect_format(path))
+
+
+def format_srt_timestamp(milliseconds):
+    """Millisecondes → HH:MM:SS,mmm"""
+    seconds, ms = divmod(int(milliseconds), 1000)
+    minutes, seconds = divmod(seconds, 60)
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours:02d}:{minutes:02d}:{seconds:02d},{ms:03d}"
+
+
+def serialize_srt(cues):
+    """Sérialise une liste de répliques au format SRT"""
+    return "\n".join(
+        f"{index}\n{format_srt_timestamp(cue.start)} --> {format_srt_timestamp(cue.end)}\n{cue.text}\n"
+        for index, cue in enumerate(cues, start=1)
+    )
+
+
+PARTIAL_SUFFIX = ".partial"  # écriture en cours : renommé seulement une fois complet et sur disque
+
+
+def atomic_write(path, data):
+    """Écrit path via path.partial + fsync + renommage : un arrêt brutal laisse l'ancienne version intacte"""
+    partial = path + PARTIAL_SUFFIX
+    try:
+        with open(partial, "w", encoding="utf-8") as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(partial, path)
+    except BaseException:
+        if os.path.exists(partial):
+            os.remove(partial)
+        raise
+
+
+def write_srt(path, cues):
+    """Écrit une liste de répliques au format SRT (UTF-8, écriture atomique)"""
+    atomic_write(path, serialize_srt(cues))
@@ -1,17 +1,36 @@
 import os
 import json
 import time
+import asyncio
 import sys
 import subprocess
 import shutil
 import re
-import pysrt
+import math
+import sqlite3
+import hashlib
+import zlib
+import difflib
+import signal
+import socket
+import threading
+import cProfile
+import functools
+import random
 import pytz
+from collections import deque
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
 from dotenv import load_dotenv
 from google import genai
 from google.genai import types
 from datetime import datetime, timedelta
 
+import subtitle_formats
+import bitmap_ocr
+import language_detection
+
 # ==========================================
 # translate_srt_gemini.py - V7 (Multi-Folders)
 # ==========================================
@@ -36,6 +55,10 @@ WATCH_INTERVAL = int(os.getenv("WATCH_INTERVAL", 3600))
 LOG_FILE = os.getenv("LOG_FILE", None)  # None = console uniquement
 LOG_FILE_MAX_SIZE_MB = int(os.getenv("LOG_FILE_MAX_SIZE_MB", 10))  # Taille max par fichier (MB)
 LOG_FILE_BACKUP_COUNT = int(os.getenv("LOG_FILE_BACKUP_COUNT", 2))  # Nombre de backups
+LOG_SUMMARY = os.getenv("LOG_SUMMARY", "false").lower() == "true"  # Skips de routine agrégés par dossier
+LOG_SLOW_SECONDS = float(os.getenv("LOG_SLOW_SECONDS", 30 if LOG_SUMMARY else 0))  # 0 = pas de ligne "opération lente"
+INCREMENTAL_SCAN = os.getenv("INCREMENTAL_SCAN", "true").lower() == "true"  # Watch : ne pas relister les dossiers inchangés (mtime)
+DEEP_SCAN_EVERY = int(os.getenv("DEEP_SCAN_EVERY", 24))  # Scan complet forcé tous les N cycles (0 = jamais)
 
 # Parse SOURCE_FOLDERS
 try:
@@ -49,6 +72,41 @@ except json.JSONDecodeError:
     else:
         SOURCE_FOLDERS = []
 
+# Conversion ASS/SSA/VTT : native (en mémoire) | ffmpeg (ancien chemin via /tmp)
+SUBTITLE_PARSER = os.getenv("SUBTITLE_PARSER", "native").lower()
+KEEP_CONVERTED_SRT = os.getenv("KEEP_CONVERTED_SRT", "false").lower() == "true"  # Écrire le .to.srt.tmp en mode natif
+
+# Streaming : lignes traduites exploitées dès réception, lot partiel sauvegardé
+STREAMING = os.getenv("STREAMING", "false").lower() == "true"
+STREAM_CHECKPOINT_LINES = int(os.getenv("STREAM_CHECKPOINT_LINES", 10))
+
+# Contexte par série (glossaire des épisodes précédents) : gemini (cache côté API) | local | off
+CONTEXT_CACHE = os.getenv("CONTEXT_CACHE", "gemini").lower()
+CONTEXT_CACHE_TTL = int(os.getenv("CONTEXT_CACHE_TTL", 3600))
+GLOSSARY_MAX_TERMS = int(os.getenv("GLOSSARY_MAX_TERMS", 150))
+
+# Langues cibles (codes ISO 639-1) : plusieurs langues = une seule requête, un .{langue}.srt par langue
+TARGET_LANGUAGES = json.loads(os.getenv("TARGET_LANGUAGES") or '["fr"]')
+MULTI_LANGUAGE = len(TARGET_LANGUAGES) > 1
+
+# Filtre avant traduction : bruitages, ♪, nombres, URL, noms propres connus seuls, doublons du fichier
+PRE_FILTER = os.getenv("PRE_FILTER", "true").lower() == "true"
+
+# Contrôle d'alignement après chaque lot : lignes fusionnées/omises, longueurs aberrantes, lignes recopiées en anglais
+# Seules les lignes suspectes sont redemandées, par sous-lots de ALIGN_CHUNK_SIZE
+ALIGN_CHECK = os.getenv("ALIGN_CHECK", "true").lower() == "true"
+ALIGN_CHUNK_SIZE = int(os.getenv("ALIGN_CHUNK_SIZE", 10))
+
+# Réutilisation des traductions terminées (même source en 1080p/2160p, même épisode dans 2 dossiers) : off | exact | fuzzy
+# exact : mêmes répliques (timings ignorés) | fuzzy : jusqu'à quelques répliques différentes, seules celles-ci partent à l'API
+TRANSLATION_REUSE = os.getenv("TRANSLATION_REUSE", "exact").lower()
+REUSE_MIN_SIMILARITY = float(os.getenv("REUSE_MIN_SIMILARITY", 0.9))  # fuzzy : part min. de répliques communes
+
+# OCR des sous-titres image (PGS/VobSub) via Tesseract, réparti sur OCR_WORKERS processus (0 = nb de CPU)
+OCR_ENABLED = os.getenv("OCR_ENABLED", "true").lower() == "true"
+OCR_WORKERS = int(os.getenv("OCR_WORKERS", 0)) or os.cpu_count() or 1
+OCR_LANGUAGE = os.getenv("OCR_LANGUAGE", "eng")
+
 # Variables de nettoyage (défaut: false = on garde tout)
 DELETE_PROGRESS_AFTER = os.getenv("DELETE_PROGRESS_AFTER", "false").lower() == "true"
 DELETE_SOURCE_AFTER = os.getenv("DELETE_SOURCE_AFTER", "false").lower() == "true"
@@ -61,23 +119,99 @@ MODELS = json.loads(os.getenv("GEMINI_MODELS") or "[]")
 COOLDOWN_SECONDS = int(os.getenv("COOLDOWN_SECONDS", 3600))
 RETRY_EMPTY_RESPONSE_DELAY = 10
 
+# Erreurs passagères (5xx, réseau, 429 par minute) : pause exponentielle du couple (modèle, clé)
+# RETRY_BASE_SECONDS, 2×, 4×... (plafonnée à COOLDOWN_SECONDS, Retry-After respecté) ;
+# après BREAKER_THRESHOLD échecs consécutifs, circuit ouvert COOLDOWN_SECONDS puis un essai
+RETRY_BASE_SECONDS = float(os.getenv("RETRY_BASE_SECONDS", 5))
+BREAKER_THRESHOLD = int(os.getenv("BREAKER_THRESHOLD", 5))
+AUTH_COOLDOWN_SECONDS = 6 * 3600  # clé refusée (401/403) : écartée pour tous les modèles
+
+# Relance (hedging) : un lot plus lent que le percentile HEDGE_PERCENTILE de son modèle est renvoyé
+# en parallèle sur un autre (modèle, clé), la première réponse gagne (appels non-streaming uniquement)
+HEDGE_REQUESTS = os.getenv("HEDGE_REQUESTS", "false").lower() == "true"
+HEDGE_PERCENTILE = float(os.getenv("HEDGE_PERCENTILE", 95))
+HEDGE_MIN_SAMPLES = int(os.getenv("HEDGE_MIN_SAMPLES", 20))  # appels réussis observés avant toute relance
+HEDGE_MIN_SECONDS = float(os.getenv("HEDGE_MIN_SECONDS", 10))  # jamais de relance avant ce délai
+HEDGE_BUDGET_PERCENT = float(os.getenv("HEDGE_BUDGET_PERCENT", 10))  # relances max en % des requêtes
+
+# Quota journalier par modèle et par clé (RPD), ex: {"gemini-3-flash-preview": 1000, "gemini-2.5-flash": 250}
+MODELS_RPD = json.loads(os.getenv("GEMINI_MODELS_RPD") or "{}")
+
+# Routage par lot : auto = modèle choisi selon la difficulté du lot, la latence observée et le quota restant
+# (GEMINI_MODELS du plus fort au plus rapide) | order = toujours dans l'ordre de GEMINI_MODELS
+MODEL_ROUTING = os.getenv("MODEL_ROUTING", "auto").lower()
+ROUTING_DENSE_CHARS = int(os.getenv("ROUTING_DENSE_CHARS", 70))  # longueur moyenne d'une réplique "dense"
+
+# Détection de langue hors ligne des sources (fichier sans langue, piste "und") avant tout appel API
+LANGUAGE_DETECTION = os.getenv("LANGUAGE_DETECTION", "true").lower() == "true"
+
+# Planification : walk (ordre os.walk) | shortest | newest | folder
+SCHEDULE_POLICY = os.getenv("SCHEDULE_POLICY", "walk").lower()
+PLAN_DRY_RUN = os.getenv("PLAN_DRY_RUN", "false").lower() == "true"
+
+# API HTTP locale (traduction prioritaire + progression) : 0 = désactivée
+API_PORT = int(os.getenv("API_PORT", 0))
+API_HOST = os.getenv("API_HOST", "0.0.0.0")
+API_TOKEN = os.getenv("API_TOKEN")  # Optionnel : exige "Authorization: Bearer <token>" sur POST
+
+# Profilage : durée des étapes (spans) → trace JSON-lines par fichier + tableau récapitulatif par cycle
+PROFILE = os.getenv("PROFILE", "false").lower() == "true"
+PROFILE_DIR = os.getenv("PROFILE_DIR", "profiles")
+PROFILE_CPROFILE = os.getenv("PROFILE_CPROFILE", "false").lower() == "true"  # + dump cProfile (.prof) par fichier
+
+# Arrêt propre (docker stop) : délai laissé au lot en cours avant abandon (garder < stop_grace_period, 10s par défaut)
+SHUTDOWN_GRACE_SECONDS = int(os.getenv("SHUTDOWN_GRACE_SECONDS", 8))
+
+# État local persistant (ledger quota, cooldowns) - monter un volume pour survivre aux redémarrages
+STATE_DB = os.getenv("STATE_DB", "state/translator.db")
+QUOTA_RESET_TIME = os.getenv("QUOTA_RESET_TIME", "11:05")  # Heure de reset par défaut (avant toute observation)
+# Quota épuisé partout : essais toutes les QUOTA_PROBE_SECONDS autour du reset estimé (de 1 essai avant
+# à QUOTA_PROBE_HOURS après) → chaque reset observé tient dans un intervalle court entre dernier échec et succès
+QUOTA_PROBE_SECONDS = 15 * 60
+QUOTA_PROBE_HOURS = 3
+
+# Plusieurs instances (un conteneur par partage) : même STATE_DB sur un volume local commun
+# → bail par vidéo + quotas, cooldowns et cadence partagés par (modèle, clé)
+REPLICA_ID = os.getenv("REPLICA_ID") or socket.gethostname()
+LEASE_SECONDS = int(os.getenv("LEASE_SECONDS", 900))  # Bail d'une vidéo, renouvelé à chaque lot
+KEY_MIN_INTERVAL = float(os.getenv("KEY_MIN_INTERVAL", 0))  # Écart min. entre 2 requêtes d'un (modèle, clé), toutes instances (0 = libre)
+
 if not API_KEYS or not MODELS:
     raise RuntimeError("GEMINI_API_KEYS ou GEMINI_MODELS manquant dans .env")
 
+if not TARGET_LANGUAGES:
+    raise RuntimeError("TARGET_LANGUAGES vide (ex: [\"fr\", \"es\", \"de\"])")
+
+if SCHEDULE_POLICY not in ("walk", "shortest", "newest", "folder"):
+    raise RuntimeError(f"SCHEDULE_POLICY invalide: {SCHEDULE_POLICY} (walk, shortest, newest, folder)")
+
+if MODEL_ROUTING not in ("auto", "order"):
+    raise RuntimeError(f"MODEL_ROUTING invalide: {MODEL_ROUTING} (auto, order)")
+
+if TRANSLATION_REUSE not in ("off", "exact", "fuzzy"):
+    raise RuntimeError(f"TRANSLATION_REUSE invalide: {TRANSLATION_REUSE} (off, exact, fuzzy)")
+
 VIDEO_EXTENSIONS = (".mkv", ".mp4", ".avi", ".mov", ".m4v", ".webm", ".flv", ".wmv")
 SUBTITLE_EXTENSIONS = ["srt", "ass", "sup", "ssa", "vtt", "sub"]
 
 PARIS_TZ = pytz.timezone('Europe/Paris')
 
 # Configuration du logger
+import atexit
+import queue
 import logging
-from logging.handlers import RotatingFileHandler
+from logging.handlers import RotatingFileHandler, QueueHandler, QueueListener
 
 logger = None
+log_listener = None
 
 def setup_logger():
-    """Configure le logger avec rotation automatique si LOG_FILE est défini"""
-    global logger
+    """
+    Configure le logger avec rotation automatique si LOG_FILE est défini
+    Écriture en arrière-plan : log() dépose le message dans une file (QueueHandler),
+    un thread (QueueListener) l'écrit sur la console et dans le fichier
+    """
+    global logger, log_listener
     
     logger = logging.getLogger('subtitle_translator')
     logger.setLevel(logging.INFO)
@@ -88,9 +222,10 @@ def setup_logger():
     # Handler console (toujours actif)
     console_handler = logging.StreamHandler()
     console_handler.setFormatter(formatter)
-    logger.addHandler(console_handler)
+    handlers = [console_handler]
     
     # Handler fichier avec rotation (si LOG_FILE configuré)
+    file_error = None
     if LOG_FILE:
         try:
             # Rotation automatique selon configuration
@@ -103,15 +238,27 @@ def setup_logger():
                 encoding='utf-8'
             )
             file_handler.setFormatter(formatter)
-            logger.addHandler(file_handler)
-            
-            # Log de config au démarrage
-            total_files = LOG_FILE_BACKUP_COUNT + 1
-            max_space_mb = total_files * LOG_FILE_MAX_SIZE_MB
-            logger.info(f"📝 Log fichier activé: {LOG_FILE}")
-            logger.info(f"   Rotation: {LOG_FILE_MAX_SIZE_MB} MB/fichier, {total_files} fichiers max ({max_space_mb} MB total)")
+            handlers.append(file_handler)
         except Exception as e:
-            print(f"[ERROR] Impossible de créer le fichier de log {LOG_FILE}: {e}")
+            file_error = e
+    
+    # File non bornée : log() ne bloque jamais sur le disque (NAS lent, rotation)
+    log_queue = queue.SimpleQueue()
+    logger.addHandler(QueueHandler(log_queue))
+    log_listener = QueueListener(log_queue, *handlers)
+    log_listener.start()
+    atexit.register(log_listener.stop)  # vide la file avant la sortie
+    
+    if file_error:
+        print(f"[ERROR] Impossible de créer le fichier de log {LOG_FILE}: {file_error}")
+    elif LOG_FILE:
+        # Log de config au démarrage
+        total_files = LOG_FILE_BACKUP_COUNT + 1
+        max_space_mb = total_files * LOG_FILE_MAX_SIZE_MB
+        logger.info(f"📝 Log fichier activé: {LOG_FILE}")
+        logger.info(f"   Rotation: {LOG_FILE_MAX_SIZE_MB} MB/fichier, {total_files} fichiers max ({max_space_mb} MB total)")
+    if LOG_SUMMARY:
+        logger.info(f"📝 Logs résumés : skips de routine agrégés par dossier | Opérations lentes ≥ {LOG_SLOW_SECONDS:g}s")
 
 
 def log(msg):
@@ -121,23 +268,694 @@ def log(msg):
     logger.info(msg)
 
 
+# Logs résumés : issue de routine → compteur par dossier pour le cycle en cours
+_routine_lock = threading.Lock()
+routine_counts = {}  # dossier → {issue: nombre}
+
+
+def routine_folder(video_path):
+    """Dossier de SOURCE_FOLDERS contenant la vidéo (sinon son dossier parent)"""
+    for folder in SOURCE_FOLDERS:
+        if video_path.startswith(os.path.join(folder, "")):
+            return folder
+    return os.path.dirname(video_path)
+
+
+def log_routine(outcome, video_path, msg):
+    """Issue de routine (skip) : ligne individuelle, ou simple compteur par dossier si LOG_SUMMARY"""
+    if not LOG_SUMMARY:
+        log(msg)
+        return
+
+    with _routine_lock:
+        outcomes = routine_counts.setdefault(routine_folder(video_path), {})
+        outcomes[outcome] = outcomes.get(outcome, 0) + 1
+
+
+def log_routine_summary():
+    """Fin de cycle : une ligne par dossier avec les skips agrégés"""
+    with _routine_lock:
+        rows = sorted(routine_counts.items())
+        routine_counts.clear()
+
+    for folder, outcomes in rows:
+        details = " | ".join(f"{outcome}: {count}"
+                             for outcome, count in sorted(outcomes.items(), key=lambda item: -item[1]))
+        log(f"📁 {folder} → {details}")
+
+
+# =========================
+# PROFILING
+# =========================
+_profile_local = threading.local()  # pile des fichiers profilés (par thread)
+_profile_lock = threading.Lock()
+profile_totals = {}  # étape → [appels, durée totale, durée max] pour le cycle en cours
+profile_cycle_start = time.perf_counter()
+
+
+def reset_profile():
+    """Début de cycle : remet à zéro les totaux par étape"""
+    global profile_cycle_start
+    with _profile_lock:
+        profile_totals.clear()
+        profile_cycle_start = time.perf_counter()
+
+
+def profile_path(video_path, extension):
+    """Fichier de trace d'une vidéo : Film.<empreinte du chemin>.jsonl (noms identiques dans plusieurs dossiers)"""
+    stem = os.path.splitext(os.path.basename(video_path))[0]
+    digest = hashlib.sha1(video_path.encode("utf-8")).hexdigest()[:8]
+    return os.path.join(PROFILE_DIR, f"{stem}.{digest}.{extension}")
+
+
+SLOW_IGNORED_STAGES = ("file", "pause")  # durée attendue, jamais signalée comme lente
+
+
+@contextmanager
+def span(stage, **fields):
+    """
+    Mesure une étape : totaux du cycle + ligne dans la trace du fichier en cours (PROFILE=true)
+    et ligne "opération lente" au-delà de LOG_SLOW_SECONDS
+    """
+    if not PROFILE and not LOG_SLOW_SECONDS:
+        yield
+        return
+
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        duration = time.perf_counter() - started
+        stack = getattr(_profile_local, "stack", None)
+        trace = stack[-1] if stack else None
+
+        if LOG_SLOW_SECONDS and duration >= LOG_SLOW_SECONDS and stage not in SLOW_IGNORED_STAGES:
+            video = os.path.basename(trace["video"]) if trace else "-"
+            log(f"🐢 Opération lente : {stage} {duration:.1f}s | {video}")
+
+        if PROFILE:
+            with _profile_lock:
+                total = profile_totals.setdefault(stage, [0, 0.0, 0.0])
+                total[0] += 1
+                total[1] += duration
+                total[2] = max(total[2], duration)
+
+            if trace and trace["file"]:
+                record = {"stage": stage, "at": round(started - trace["started"], 4), "duration": round(duration, 4)}
+                record.update(fields)
+                trace["file"].write(json.dumps(record, ensure_ascii=False) + "\n")
+
+
+def profiled(stage):
+    """Décorateur : la fonction entière est une étape profilée"""
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            with span(stage):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def profiled_file(function):
+    """Décorateur : function(video_path, ...) produit la trace de ce fichier"""
+    @functools.wraps(function)
+    def wrapper(video_path, *args, **kwargs):
+        with profile_file(video_path):
+            return function(video_path, *args, **kwargs)
+    return wrapper
+
+
+@contextmanager
+def profile_file(video_path):
+    """Trace JSON-lines d'un fichier (réécrite à chaque traitement) + dump cProfile optionnel"""
+    if not PROFILE and not LOG_SLOW_SECONDS:
+        yield
+        return
+
+    # La pile nomme aussi la vidéo des opérations lentes, même sans PROFILE
+    stack = _profile_local.__dict__.setdefault("stack", [])
+    trace = {"video": video_path, "file": None, "started": time.perf_counter()}
+    if PROFILE:
+        os.makedirs(PROFILE_DIR, exist_ok=True)
+        trace["file"] = open(profile_path(video_path, "jsonl"), "w", encoding="utf-8", buffering=1)
+        trace["file"].write(json.dumps({"stage": "start", "video": video_path,
+                                        "date": datetime.now(PARIS_TZ).isoformat(timespec="seconds")},
+                                       ensure_ascii=False) + "\n")
+
+    # Un seul profileur actif à la fois : pas de cProfile pour une demande imbriquée
+    profiler = None
+    if PROFILE and PROFILE_CPROFILE and not stack:
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError:
+            profiler = None
+
+    stack.append(trace)
+    try:
+        with span("file"):
+            yield
+    finally:
+        stack.pop()
+        if profiler:
+            profiler.disable()
+            profiler.dump_stats(profile_path(video_path, "prof"))
+        if trace["file"]:
+            trace["file"].write(json.dumps({"stage": "end", "duration": round(time.perf_counter() - trace["started"], 4)}) + "\n")
+            trace["file"].close()
+
+
+def log_profile_summary():
+    """Fin de cycle : tableau des étapes triées par durée totale"""
+    if not PROFILE:
+        return
+
+    wall = time.perf_counter() - profile_cycle_start
+    with _profile_lock:
+        rows = sorted(profile_totals.items(), key=lambda item: item[1][1], reverse=True)
+
+    log(f"📊 PROFIL DU CYCLE | Durée: {wall:.1f}s | Traces: {PROFILE_DIR} (étapes imbriquées : total > 100% possible)")
+    log(f"   {'étape':<26} {'appels':>7} {'total':>9} {'moyenne':>9} {'max':>9} {'%':>6}")
+    for stage, (calls, total, longest) in rows:
+        share = total / wall * 100 if wall else 0
+        log(f"   {stage:<26} {calls:>7} {total:>8.2f}s {total / calls:>8.3f}s {longest:>8.3f}s {share:>5.1f}%")
+
+
+# =========================
+# MÉTRIQUES (PROMETHEUS)
+# =========================
+# Format texte Prometheus sur GET /metrics (serveur API_PORT) ; aucune dépendance externe
+_metrics_lock = threading.Lock()
+metric_counters = {}  # (nom, labels) → valeur
+metric_histograms = {}  # (nom, labels) → [compte par borne, somme, nombre]
+metric_callbacks = {}  # nom → fonction () → [(labels, valeur)], évaluée au scrape
+LATENCY_BUCKETS = (1, 2, 5, 10, 20, 30, 60, 120, 300)
+
+METRIC_HELP = {
+    "translator_gemini_requests_total": ("counter", "Requêtes Gemini réussies par (modèle, clé)"),
+    "translator_gemini_tokens_total": ("counter", "Tokens facturés (usage_metadata) par (modèle, clé, type)"),
+    "translator_gemini_errors_total": ("counter", "Erreurs d'appel par (modèle, clé, type) - transient, rate_limit, "
+                                                  "quota_exhausted, content_rejected, invalid_request, auth"),
+    "translator_rejected_lines_total": ("counter", "Répliques refusées par le modèle, conservées en anglais"),
+    "translator_batch_seconds": ("histogram", "Durée d'un appel de lot réussi par modèle"),
+    "translator_cues_total": ("counter", "Répliques traitées : envoyées à l'API (api) ou résolues sans appel (saved)"),
+    "translator_reused_cues_total": ("counter", "Répliques reprises d'une source déjà traduite (exact/fuzzy)"),
+    "translator_context_cache_total": ("counter", "Cache de contexte de série : hit, miss, failed"),
+    "translator_titles_total": ("counter", "Vidéos examinées par issue (already_done, completed, no_source...)"),
+    "translator_scan_dirs_total": ("counter", "Dossiers du scan : listed (relistés) ou pruned (inchangés, ignorés)"),
+    "translator_key_cooldown_seconds": ("gauge", "Cooldown restant par (modèle, clé)"),
+    "translator_key_requests": ("gauge", "Requêtes sur la période de quota en cours par (modèle, clé)"),
+    "translator_key_rpd_limit": ("gauge", "Quota journalier configuré par (modèle, clé) - GEMINI_MODELS_RPD"),
+    "translator_key_failures": ("gauge", "Échecs passagers consécutifs par (modèle, clé) - circuit ouvert à BREAKER_THRESHOLD"),
+    "translator_priority_queue_depth": ("gauge", "Demandes API en attente"),
+    "translator_pipeline_queue_depth": ("gauge", "Vidéos préparées en attente de traduction (mode pipeline)"),
+    "translator_language_checks_total": ("counter", "Sources examinées par la détection de langue, par langue détectée (und = indéterminée)"),
+    "translator_routed_batches_total": ("counter", "Lots par modèle choisi en premier par le routage (MODEL_ROUTING=auto)"),
+    "translator_hedges_total": ("counter", "Relances de lots lents (sent, won, lost, over_budget)"),
+}
+
+
+def metric_key(name, labels):
+    return name, tuple(sorted((label, str(value)) for label, value in labels.items()))
+
+
+def metric_inc(name, value=1, **labels):
+    if not value:
+        return
+    key = metric_key(name, labels)
+    with _metrics_lock:
+        metric_counters[key] = metric_counters.get(key, 0) + value
+
+
+def metric_observe(name, value, **labels):
+    key = metric_key(name, labels)
+    with _metrics_lock:
+        histogram = metric_histograms.setdefault(key, [[0] * len(LATENCY_BUCKETS), 0.0, 0])
+        for index, bound in enumerate(LATENCY_BUCKETS):
+            if value <= bound:
+                histogram[0][index] += 1
+        histogram[1] += value
+        histogram[2] += 1
+
+
+def counted_outcome(function):
+    """Décorateur : l'issue retournée (already_done, completed...) alimente translator_titles_total"""
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        result = function(*args, **kwargs)
+        metric_inc("translator_titles_total", outcome=result)
+        return result
+    return wrapper
+
+
+def format_labels(labels):
+    if not labels:
+        return ""
+    escaped = (str(value).replace("\\", "\\\\").replace('"', '\\"') for _, value in labels)
+    return "{" + ",".join(f'{label}="{value}"' for (label, _), value in zip(labels, escaped)) + "}"
+
+
+def render_metrics():
+    """Exposition texte Prometheus (version 0.0.4)"""
+    with _metrics_lock:
+        samples = {}
+        for (name, labels), value in sorted(metric_counters.items()):
+            samples.setdefault(name, []).append(f"{name}{format_labels(labels)} {value}")
+        for (name, labels), (buckets, total, count) in sorted(metric_histograms.items()):
+            rows = samples.setdefault(name, [])
+            for bound, bucket_count in zip(LATENCY_BUCKETS, buckets):
+                rows.append(f"{name}_bucket{format_labels(labels + (('le', str(bound)),))} {bucket_count}")
+            rows.append(f"{name}_bucket{format_labels(labels + (('le', '+Inf'),))} {count}")
+            rows.append(f"{name}_sum{format_labels(labels)} {total:.3f}")
+            rows.append(f"{name}_count{format_labels(labels)} {count}")
+        callbacks = list(metric_callbacks.items())
+
+    for name, callback in callbacks:
+        for labels, value in callback():
+            samples.setdefault(name, []).append(f"{name}{format_labels(metric_key(name, labels)[1])} {value}")
+
+    lines = []
+    for name in sorted(samples):
+        kind, text = METRIC_HELP.get(name, ("untyped", name))
+        lines += [f"# HELP {name} {text}", f"# TYPE {name} {kind}"] + samples[name]
+    return "\n".join(lines) + "\n"
+
+
+def key_gauges(values):
+    return [({"model": model, "key": idx + 1}, values(model, idx)) for model in MODELS for idx in range(len(API_KEYS))]
+
+
+metric_callbacks.update({
+    "translator_key_cooldown_seconds": lambda: key_gauges(lambda model, idx: round(max(cooldowns.get((model, idx), 0) - now(), 0))),
+    "translator_key_requests": lambda: key_gauges(lambda model, idx: usage_counts.get((model, idx), 0)),
+    "translator_key_rpd_limit": lambda: key_gauges(lambda model, idx: int(MODELS_RPD.get(model, 0))),
+    "translator_key_failures": lambda: key_gauges(lambda model, idx: key_failures.get((model, idx), 0)),
+    "translator_priority_queue_depth": lambda: [({}, len(priority_queue))],
+    "translator_hedges_total": lambda: [({"result": result}, hedge_stats[result]) for result in ("sent", "won", "lost", "over_budget")]
+                                       if HEDGE_REQUESTS else [],
+})
+
+
+# Usage par fichier : requêtes et tokens du fichier en cours de traduction (pile : demandes prioritaires imbriquées)
+_usage_stack = []
+
+
+@contextmanager
+def tracked_usage():
+    _usage_stack.append({"requests": 0, "prompt_tokens": 0, "output_tokens": 0, "cached_tokens": 0,
+                         "api_cues": 0, "models": {}})
+    try:
+        yield _usage_stack[-1]
+    finally:
+        _usage_stack.pop()
+
+
+def record_usage(model, api_key, usage):
+    """Tokens d'une réponse (usage_metadata) → métriques + usage du fichier en cours"""
+    if usage is None:
+        return
+    key = API_KEYS.index(api_key) + 1 if api_key in API_KEYS else "?"
+    tokens = {
+        "prompt_tokens": usage.prompt_token_count or 0,
+        "output_tokens": usage.candidates_token_count or 0,
+        "cached_tokens": usage.cached_content_token_count or 0,
+    }
+    for kind, count in tokens.items():
+        metric_inc("translator_gemini_tokens_total", count, model=model, key=key, type=kind.replace("_tokens", ""))
+        if _usage_stack:
+            _usage_stack[-1][kind] += count
+
+
+def save_title_usage(video_path, languages, cues, duration):
+    """Fin de fichier : enregistrement de l'usage (planification de capacité), retourne le résumé"""
+    if not _usage_stack:
+        return None
+    usage = _usage_stack[-1]
+    db_execute(
+        "INSERT INTO title_usage (video_path, finished_at, languages, cues, api_cues, requests, prompt_tokens, "
+        "output_tokens, cached_tokens, duration, models) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+        (video_path, now(), ",".join(languages), cues, usage["api_cues"], usage["requests"], usage["prompt_tokens"],
+         usage["output_tokens"], usage["cached_tokens"], duration, json.dumps(usage["models"]))
+    )
+    return usage
+
+
+# =========================
+# ARRÊT PROPRE (SIGTERM)
+# =========================
+class ShutdownRequested(KeyboardInterrupt):
+    """Arrêt demandé par SIGTERM : traité comme CTRL+C, jamais avalé par un except Exception"""
+
+
+shutdown_requested = threading.Event()
+_shutdown_busy = 0  # > 0 : lot en cours, terminé avant l'arrêt si possible
+
+
+def handle_sigterm(signum, frame):
+    """
+    docker stop : arrêt immédiat hors lot, sinon fin du lot en cours
+    dans la limite de SHUTDOWN_GRACE_SECONDS (puis abandon, repris au démarrage suivant)
+    """
+    if shutdown_requested.is_set() or not _shutdown_busy or SHUTDOWN_GRACE_SECONDS <= 0:
+        shutdown_requested.set()
+        log("🛑 Arrêt demandé (SIGTERM)")
+        raise ShutdownRequested()
+
+    shutdown_requested.set()
+    log(f"🛑 Arrêt demandé (SIGTERM) : fin du lot en cours (max {SHUTDOWN_GRACE_SECONDS}s)")
+    signal.signal(signal.SIGALRM, handle_grace_timeout)
+    signal.alarm(SHUTDOWN_GRACE_SECONDS)
+
+
+def handle_grace_timeout(signum, frame):
+    """Délai de grâce dépassé : le lot en cours est abandonné"""
+    log(f"⏱️ Délai de grâce dépassé ({SHUTDOWN_GRACE_SECONDS}s) : lot abandonné, repris au prochain démarrage")
+    raise ShutdownRequested()
+
+
+def install_shutdown_handler():
+    """SIGTERM → arrêt propre (à appeler depuis le thread principal)"""
+    signal.signal(signal.SIGTERM, handle_sigterm)
+
+
+@contextmanager
+def shutdown_guard():
+    """Lot en cours (appel API + sauvegarde) : un SIGTERM attend sa fin au lieu de l'interrompre"""
+    global _shutdown_busy
+    if shutdown_requested.is_set():
+        # Le précédent a échoué pendant le délai de grâce : ne pas en commencer un autre
+        signal.alarm(0)
+        raise ShutdownRequested()
+
+    _shutdown_busy += 1
+    try:
+        yield
+    finally:
+        _shutdown_busy -= 1
+
+    if shutdown_requested.is_set() and not _shutdown_busy:
+        signal.alarm(0)
+        log("🛑 Lot sauvegardé → arrêt")
+        raise ShutdownRequested()
+
+
+# =========================
+# STATE STORE
+# =========================
+_db = None
+_db_lock = threading.RLock()
+
+STATE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS quota_ledger (
+    model TEXT NOT NULL,
+    key_id TEXT NOT NULL,
+    requests INTEGER NOT NULL DEFAULT 0,
+    period_end REAL NOT NULL DEFAULT 0,
+    cooldown_until REAL NOT NULL DEFAULT 0,
+    exhausted_at REAL,
+    PRIMARY KEY (model, key_id)
+);
+CREATE TABLE IF NOT EXISTS glossary (
+    show TEXT NOT NULL,
+    term TEXT NOT NULL,
+    occurrences INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (show, term)
+);
+CREATE TABLE IF NOT EXISTS quota_resets (
+    failed_at REAL NOT NULL,
+    succeeded_at REAL NOT NULL,
+    model TEXT NOT NULL,
+    key_id TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS titles (
+    source_path TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    mtime REAL NOT NULL,
+    language TEXT NOT NULL,
+    video_path TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'in_progress',
+    last_index INTEGER NOT NULL DEFAULT 0,
+    total INTEGER,
+    partial TEXT,
+    output_checksum TEXT,
+    started_at REAL,
+    finished_at REAL,
+    duration REAL,
+    updated_at REAL NOT NULL,
+    PRIMARY KEY (source_path, size, mtime, language)
+);
+CREATE INDEX IF NOT EXISTS titles_video_language ON titles (video_path, language);
+CREATE TABLE IF NOT EXISTS ocr_cache (
+    hash TEXT PRIMARY KEY,
+    text TEXT NOT NULL,
+    created_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS no_subtitle (
+    video_path TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    mtime REAL NOT NULL,
+    checked_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS translation_cache (
+    hash TEXT NOT NULL,
+    language TEXT NOT NULL,
+    cues INTEGER NOT NULL,
+    data BLOB NOT NULL,
+    video_path TEXT,
+    created_at REAL NOT NULL,
+    PRIMARY KEY (hash, language)
+);
+CREATE INDEX IF NOT EXISTS translation_cache_cues ON translation_cache (language, cues);
+CREATE TABLE IF NOT EXISTS source_languages (
+    source TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    mtime REAL NOT NULL,
+    language TEXT NOT NULL,
+    share REAL NOT NULL,
+    checked_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS title_usage (
+    video_path TEXT NOT NULL,
+    finished_at REAL NOT NULL,
+    languages TEXT NOT NULL,
+    cues INTEGER NOT NULL,
+    api_cues INTEGER NOT NULL,
+    requests INTEGER NOT NULL,
+    prompt_tokens INTEGER NOT NULL,
+    output_tokens INTEGER NOT NULL,
+    cached_tokens INTEGER NOT NULL,
+    duration REAL NOT NULL,
+    models TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS leases (
+    video_path TEXT PRIMARY KEY,
+    owner TEXT NOT NULL,
+    expires_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS key_slots (
+    model TEXT NOT NULL,
+    key_id TEXT NOT NULL,
+    next_slot REAL NOT NULL,
+    PRIMARY KEY (model, key_id)
+);
+"""
+
+
+def get_db():
+    """Connexion SQLite partagée (créée au premier appel)"""
+    global _db
+    if _db is None:
+        folder = os.path.dirname(STATE_DB)
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+        _db = sqlite3.connect(STATE_DB, timeout=30, isolation_level=None, check_same_thread=False)
+        _db.execute("PRAGMA journal_mode=WAL")
+        migrate_state_db(_db)
+        _db.executescript(STATE_SCHEMA)
+    return _db
+
+
+def migrate_state_db(db):
+    """Met à jour le schéma d'une base existante avant application de STATE_SCHEMA"""
+    columns = [row[1] for row in db.execute("PRAGMA table_info(titles)")]
+    if columns and "language" not in columns:
+        # Progression sans langue (français uniquement) → clé (source, langue)
+        db.execute("ALTER TABLE titles RENAME TO titles_fr")
+        db.executescript(STATE_SCHEMA)
+        db.execute(
+            "INSERT INTO titles (source_path, size, mtime, language, video_path, status, last_index, total, "
+            "partial, output_checksum, started_at, finished_at, duration, updated_at) "
+            "SELECT source_path, size, mtime, 'fr', video_path, status, last_index, total, partial, "
+            "output_checksum, started_at, finished_at, duration, updated_at FROM titles_fr"
+        )
+        db.execute("DROP TABLE titles_fr")
+
+
+def db_execute(sql, params=()):
+    """Exécute une requête SQL (thread-safe) et retourne toutes les lignes"""
+    with _db_lock:
+        return get_db().execute(sql, params).fetchall()
+
+
+@contextmanager
+def db_transaction():
+    """
+    Transaction exclusive (BEGIN IMMEDIATE) : lecture puis écriture sans qu'une autre instance
+    partageant STATE_DB ne s'intercale
+    """
+    with _db_lock:
+        db = get_db()
+        db.execute("BEGIN IMMEDIATE")
+        try:
+            yield db
+        except BaseException:
+            db.execute("ROLLBACK")
+            raise
+        db.execute("COMMIT")
+
+
+def key_id(key_index):
+    """Identifiant stable d'une clé API (empreinte, jamais la clé en clair)"""
+    return hashlib.sha256(API_KEYS[key_index].encode("utf-8")).hexdigest()[:12]
+
+
 # =========================
 # COOLDOWN MANAGEMENT
 # =========================
 cooldowns = {}
+usage_counts = {}  # (model, key_index) → requêtes depuis le dernier reset
+usage_period_end = 0.0
+exhausted_at = {}  # (model, key_index) → dernier 429 quota (pour observer le reset)
+key_failures = {}  # (model, key_index) → échecs passagers consécutifs (circuit breaker)
+quota_reset_minute = None  # minute du jour (heure de France) déduite des resets observés
 
 
 def now():
     return time.time()
 
 
+def refresh_ledger():
+    """
+    Recharge compteurs, cooldowns et 429 depuis STATE_DB
+    Source de vérité partagée : une clé bloquée par une autre instance l'est aussi ici
+    """
+    global usage_period_end
+
+    key_indexes = {key_id(idx): idx for idx in range(len(API_KEYS))}
+    rows = db_execute("SELECT model, key_id, requests, period_end, cooldown_until, exhausted_at FROM quota_ledger")
+
+    cooldowns.clear()
+    usage_counts.clear()
+    exhausted_at.clear()
+    for model, kid, requests, period_end, cooldown_until, failed_at in rows:
+        if model not in MODELS or kid not in key_indexes:
+            continue
+        key_index = key_indexes[kid]
+        if now() < period_end:
+            usage_counts[(model, key_index)] = requests
+            usage_period_end = max(usage_period_end, period_end)
+        if now() < cooldown_until:
+            cooldowns[(model, key_index)] = cooldown_until
+        if failed_at:
+            exhausted_at[(model, key_index)] = failed_at
+
+
+def load_quota_ledger():
+    """Recharge compteurs, cooldowns et resets observés au démarrage"""
+    global quota_reset_minute
+
+    refresh_ledger()
+    quota_reset_minute = derive_quota_reset_minute()
+
+    blocked = sum(1 for until in cooldowns.values() if until > now())
+    reset_time = next_quota_reset_time()
+    source = "observé" if quota_reset_minute is not None else "défaut"
+    log(f"📒 Ledger quota chargé ({STATE_DB}) | {blocked} clé(s) en cooldown | Reset quota: {reset_time} ({source})")
+
+
+def record_request(model, key_index):
+    """Comptabilise une requête sur la période de quota en cours"""
+    global usage_period_end
+    if now() >= usage_period_end:
+        usage_counts.clear()
+        usage_period_end = calculate_next_quota_reset()[0].timestamp()
+
+    # Incrément en base (jamais d'écrasement) : les autres instances comptent sur les mêmes lignes
+    with db_transaction() as db:
+        db.execute(
+            "INSERT INTO quota_ledger (model, key_id, requests, period_end) VALUES (?, ?, 1, ?) "
+            "ON CONFLICT(model, key_id) DO UPDATE SET "
+            "requests = CASE WHEN period_end > ? THEN requests + 1 ELSE 1 END, "
+            "period_end = MAX(period_end, excluded.period_end), exhausted_at = NULL",
+            (model, key_id(key_index), usage_period_end, now())
+        )
+        row = db.execute("SELECT requests FROM quota_ledger WHERE model = ? AND key_id = ?",
+                         (model, key_id(key_index))).fetchone()
+    usage_counts[(model, key_index)] = row[0]
+    metric_inc("translator_gemini_requests_total", model=model, key=key_index + 1)
+    if _usage_stack:
+        _usage_stack[-1]["requests"] += 1
+        models = _usage_stack[-1]["models"]
+        models[model] = models.get(model, 0) + 1
+
+    # Premier succès après un 429 quota → le reset a eu lieu entre les deux
+    failed_at = exhausted_at.pop((model, key_index), None)
+    if failed_at is not None:
+        record_quota_reset(model, key_index, failed_at)
+
+
+def daily_capacity():
+    """Capacité totale (requêtes/jour) toutes clés et modèles confondus, 0 si inconnue"""
+    return sum(int(MODELS_RPD.get(model, 0)) for model in MODELS) * len(API_KEYS)
+
+
+def remaining_daily_quota():
+    """Requêtes encore disponibles avant le prochain reset (None si GEMINI_MODELS_RPD non configuré)"""
+    capacity = daily_capacity()
+    if not capacity:
+        return None
+    if now() >= usage_period_end:
+        return capacity
+    used = sum(usage_counts.get((model, idx), 0) for model in MODELS for idx in range(len(API_KEYS)))
+    return max(capacity - used, 0)
+
+
 def is_available(model, key_index):
     return now() >= cooldowns.get((model, key_index), 0)
 
 
-def block_key(model, key_index):
-    cooldowns[(model, key_index)] = now() + COOLDOWN_SECONDS
-    log(f"🔒 clé #{key_index + 1} ({model}) bloquée → retry dans {COOLDOWN_SECONDS}s")
+def block_key(model, key_index, quota_exhausted=False, seconds=None):
+    seconds = COOLDOWN_SECONDS if seconds is None else seconds
+    cooldowns[(model, key_index)] = now() + seconds
+    if quota_exhausted:
+        exhausted_at[(model, key_index)] = now()
+    db_execute(
+        "INSERT INTO quota_ledger (model, key_id, cooldown_until, exhausted_at) VALUES (?, ?, ?, ?) "
+        "ON CONFLICT(model, key_id) DO UPDATE SET cooldown_until = MAX(cooldown_until, excluded.cooldown_until), "
+        "exhausted_at = COALESCE(excluded.exhausted_at, exhausted_at)",
+        (model, key_id(key_index), cooldowns[(model, key_index)], exhausted_at.get((model, key_index)))
+    )
+    log(f"🔒 clé #{key_index + 1} ({model}) bloquée → retry dans {seconds:.0f}s")
+
+
+def reserve_key_slot(model, key_index, only_if_free=False):
+    """
+    Réserve le prochain créneau d'appel du couple (modèle, clé), KEY_MIN_INTERVAL après le précédent
+    (toutes instances confondues) ; retourne l'attente en secondes avant d'appeler
+    only_if_free : réservation uniquement si le créneau est libre tout de suite (sinon None, rien réservé)
+    """
+    if KEY_MIN_INTERVAL <= 0:
+        return 0
+    with db_transaction() as db:
+        row = db.execute("SELECT next_slot FROM key_slots WHERE model = ? AND key_id = ?",
+                         (model, key_id(key_index))).fetchone()
+        slot = max(now(), row[0] if row else 0)
+        if only_if_free and slot > now():
+            return None
+        db.execute("INSERT OR REPLACE INTO key_slots (model, key_id, next_slot) VALUES (?, ?, ?)",
+                   (model, key_id(key_index), slot + KEY_MIN_INTERVAL))
+    return slot - now()
 
 
 def any_key_available():
@@ -148,91 +966,892 @@ def any_key_available():
     return False
 
 
+def minute_of_day(timestamp):
+    moment = datetime.fromtimestamp(timestamp, PARIS_TZ)
+    return moment.hour * 60 + moment.minute
+
+
+def record_quota_reset(model, key_index, failed_at):
+    """Enregistre un reset observé : quota épuisé à failed_at, de nouveau disponible maintenant"""
+    global quota_reset_minute
+
+    # failed_at = dernier essai en échec (chaque 429 quota le repousse) : écart borné par l'espacement
+    # des essais (QUOTA_PROBE_SECONDS en veille, COOLDOWN_SECONDS pendant le travail sur d'autres clés)
+    if now() - failed_at > 2 * max(QUOTA_PROBE_SECONDS, COOLDOWN_SECONDS):
+        return
+
+    db_execute(
+        "INSERT INTO quota_resets (failed_at, succeeded_at, model, key_id) VALUES (?, ?, ?, ?)",
+        (failed_at, now(), model, key_id(key_index))
+    )
+    quota_reset_minute = derive_quota_reset_minute()
+    log(f"📒 Reset quota observé ({model}, clé #{key_index + 1}) → reset estimé à {next_quota_reset_time()}")
+
+
+def derive_quota_reset_minute():
+    """
+    Déduit l'heure du reset quotidien à partir des resets observés
+    Chaque observation donne un intervalle ]échec, succès] contenant le reset :
+    on prend l'intersection des intervalles récents (borne haute = reset certain).
+    Retourne une minute du jour (heure de France) ou None si aucune observation.
+    """
+    rows = db_execute("SELECT failed_at, succeeded_at FROM quota_resets ORDER BY succeeded_at DESC LIMIT 14")
+    if not rows:
+        return None
+
+    intervals = []
+    reference = None
+    for failed_at, succeeded_at in rows:
+        low = minute_of_day(failed_at)
+        high = low + int((succeeded_at - failed_at) / 60) + 1
+        if reference is None:
+            reference = low
+        # Ramener chaque intervalle à ±12h de la référence (gestion de minuit)
+        while low - reference > 720:
+            low, high = low - 1440, high - 1440
+        while reference - low > 720:
+            low, high = low + 1440, high + 1440
+        intervals.append((low, high))
+
+    low = max(interval[0] for interval in intervals)
+    high = min(interval[1] for interval in intervals)
+    if low > high:
+        # Observations incohérentes (changement d'heure, reset déplacé) → médiane des bornes hautes
+        highs = sorted(interval[1] for interval in intervals)
+        high = highs[len(highs) // 2]
+
+    return high % 1440
+
+
+def next_quota_reset_time():
+    """Heure du reset quotidien au format HH:MM"""
+    if quota_reset_minute is not None:
+        return f"{quota_reset_minute // 60:02d}:{quota_reset_minute % 60:02d}"
+    return QUOTA_RESET_TIME
+
+
 def calculate_next_quota_reset():
-    """Calcule le prochain reset de quota : 11h05 heure de France"""
+    """Calcule le prochain reset de quota (heure observée, sinon QUOTA_RESET_TIME, heure de France)"""
     now_paris = datetime.now(PARIS_TZ)
+    hour, minute = (int(part) for part in next_quota_reset_time().split(":"))
     
-    if now_paris.hour > 11 or (now_paris.hour == 11 and now_paris.minute >= 5):
-        next_reset = (now_paris + timedelta(days=1)).replace(hour=11, minute=5, second=0, microsecond=0)
+    if now_paris.hour > hour or (now_paris.hour == hour and now_paris.minute >= minute):
+        next_reset = (now_paris + timedelta(days=1)).replace(hour=hour, minute=minute, second=0, microsecond=0)
     else:
-        next_reset = now_paris.replace(hour=11, minute=5, second=0, microsecond=0)
+        next_reset = now_paris.replace(hour=hour, minute=minute, second=0, microsecond=0)
     
     sleep_seconds = (next_reset - now_paris).total_seconds()
     return next_reset, sleep_seconds
 
 
 def wait_for_quota_reset():
-    """Attend jusqu'à 11h05 (reset du quota API Gemini)"""
+    """
+    Attend le prochain reset du quota API Gemini : réveil QUOTA_PROBE_SECONDS avant le reset estimé,
+    puis nouvel essai toutes les QUOTA_PROBE_SECONDS tant que le quota reste épuisé (QUOTA_PROBE_HOURS max)
+    """
     next_reset, sleep_seconds = calculate_next_quota_reset()
+    since_estimate = 24 * 3600 - sleep_seconds  # temps écoulé depuis le dernier reset estimé
     
     log("❌ Toutes les clés API bloquées (quota dépassé)")
-    log(f"⏰ Prochaine tentative : {next_reset.strftime('%d/%m/%Y à %H:%M')} (heure de France)")
-    log(f"💤 Agent en veille pendant {sleep_seconds/3600:.1f}h...")
+    if since_estimate < QUOTA_PROBE_HOURS * 3600:
+        # Reset estimé passé, quota toujours épuisé : estimation trop tôt, essais rapprochés
+        sleep_seconds = QUOTA_PROBE_SECONDS
+        log(f"⏰ Reset estimé ({next_quota_reset_time()}) dépassé → nouvel essai dans {QUOTA_PROBE_SECONDS // 60} min")
+    else:
+        if sleep_seconds > QUOTA_PROBE_SECONDS:
+            sleep_seconds -= QUOTA_PROBE_SECONDS
+        attempt = datetime.now(PARIS_TZ) + timedelta(seconds=sleep_seconds)
+        log(f"⏰ Prochaine tentative : {attempt.strftime('%d/%m/%Y à %H:%M')} (heure de France, "
+            f"reset estimé à {next_reset.strftime('%H:%M')})")
+        log(f"💤 Agent en veille pendant {sleep_seconds/3600:.1f}h...")
     
-    time.sleep(sleep_seconds)
-    log("✨ Réveil de l'agent - Quota API réinitialisé")
+    sleep_holding_leases(sleep_seconds)
+    log("✨ Réveil de l'agent - nouvel essai des clés")
     cooldowns.clear()
+    db_execute("UPDATE quota_ledger SET cooldown_until = 0")
 
 
 # =========================
 # GEMINI CALL
 # =========================
-def call_gemini(model, api_key, text, retry_count=0):
+LANGUAGE_NAMES = {
+    "fr": "français", "es": "espagnol", "de": "allemand", "it": "italien",
+    "pt": "portugais", "nl": "néerlandais", "pl": "polonais", "sv": "suédois"
+}
+
+
+def language_name(language):
+    return LANGUAGE_NAMES.get(language, language)
+
+
+if MULTI_LANGUAGE:
+    # Une réplique = une ligne JSON, réponse indexée par id et par code langue
+    SYSTEM_INSTRUCTION = (
+        "Tu es un traducteur professionnel de sous-titres. "
+        "Traduis de l'anglais vers : "
+        + ", ".join(f"{language_name(language)} ({language})" for language in TARGET_LANGUAGES) + ". "
+        'Chaque ligne reçue est un objet JSON {"id": n, "text": "..."}. '
+        "Réponds par un objet JSON par ligne, dans le même ordre, avec l'id et une clé par code langue : "
+        + json.dumps({"id": 1, **{language: "..." for language in TARGET_LANGUAGES}}, ensure_ascii=False) + ". "
+        "Aucun texte ni bloc de code autour."
+    )
+elif TARGET_LANGUAGES == ["fr"]:
+    SYSTEM_INSTRUCTION = (
+        "Tu es un traducteur professionnel de sous-titres. "
+        "Traduis de l'anglais vers le français naturel. "
+        "Une ligne traduite par ligne. "
+        "Ne numérote pas."
+    )
+else:
+    SYSTEM_INSTRUCTION = (
+        "Tu es un traducteur professionnel de sous-titres. "
+        f"Traduis de l'anglais vers : {language_name(TARGET_LANGUAGES[0])}, de façon naturelle. "
+        "Une ligne traduite par ligne. "
+        "Ne numérote pas."
+    )
+
+
+def encode_batch(texts, offset=0):
+    """
+    Texte envoyé au modèle : une réplique par ligne
+    Multi-langues : ligne JSON {"id", "text"}, id = position dans le lot (offset = lignes déjà reçues)
+    """
+    if not MULTI_LANGUAGE:
+        return "\n".join(texts)
+    return "\n".join(
+        json.dumps({"id": offset + position + 1, "text": text}, ensure_ascii=False)
+        for position, text in enumerate(texts)
+    )
+
+
+def is_response_line(line):
+    """Ligne exploitable de la réponse (multi-langues : ignore ```json et texte parasite)"""
+    return bool(line.strip()) and (not MULTI_LANGUAGE or line.lstrip().startswith("{"))
+
+
+def decode_line(line, position):
+    """
+    Ligne de réponse → (position dans le lot, {langue: traduction})
+    Multi-langues : position d'après l'id, langues absentes ou ligne illisible ignorées
+    """
+    if not MULTI_LANGUAGE:
+        return position, {TARGET_LANGUAGES[0]: line.strip()}
+
+    try:
+        data = json.loads(line.strip().rstrip(","))
+    except ValueError:
+        return position, {}
+    if not isinstance(data, dict):
+        return position, {}
+
+    try:
+        position = int(data.get("id")) - 1
+    except (TypeError, ValueError):
+        pass
+
+    values = {}
+    for language in TARGET_LANGUAGES:
+        value = data.get(language)
+        if isinstance(value, str) and value.strip():
+            values[language] = value.strip()
+    return position, values
+
+
+def decode_response(translated_text):
+    """Réponse complète → liste de (position, {langue: traduction})"""
+    lines = [line for line in translated_text.split("\n") if is_response_line(line)]
+    return [decode_line(line, position) for position, line in enumerate(lines)]
+
+
+def translation_config(model=None, key_index=None, context=None):
+    """
+    Configuration de génération commune aux appels simples et streaming
+    Avec un contexte de série : cache Gemini si disponible, sinon instruction + glossaire en clair
+    """
+    if context is None:
+        return types.GenerateContentConfig(system_instruction=SYSTEM_INSTRUCTION)
+
+    cache_name = context_cache.get(model, key_index, context)
+    if cache_name:
+        return types.GenerateContentConfig(cached_content=cache_name)
+    return types.GenerateContentConfig(system_instruction=context["instruction"])
+
+
+REJECTION_REASONS = {"SAFETY", "PROHIBITED_CONTENT", "BLOCKLIST", "SPII", "RECITATION"}
+
+
+def rejection_reason(response):
+    """Motif de refus du contenu (prompt bloqué ou génération interrompue par un filtre), None sinon"""
+    feedback = getattr(response, "prompt_feedback", None)
+    block_reason = getattr(feedback, "block_reason", None)
+    if block_reason:
+        return getattr(block_reason, "name", str(block_reason))
+    for candidate in getattr(response, "candidates", None) or []:
+        finish_reason = getattr(candidate, "finish_reason", None)
+        name = getattr(finish_reason, "name", str(finish_reason or ""))
+        if name in REJECTION_REASONS:
+            return name
+    return None
+
+
+def call_gemini(model, api_key, text, config=None, retry_count=0):
     """Appelle l'API Gemini avec system_instruction optimisé"""
     client = genai.Client(api_key=api_key)
 
     response = client.models.generate_content(
         model=model,
         contents=text,
-        config=types.GenerateContentConfig(
-            system_instruction=(
-                "Tu es un traducteur professionnel de sous-titres. "
-                "Traduis de l'anglais vers le français naturel. "
-                "Une ligne traduite par ligne. "
-                "Ne numérote pas."
-            )
-        )
+        config=config or translation_config()
     )
+    # Tokens facturés même si la réponse est vide
+    record_usage(model, api_key, getattr(response, "usage_metadata", None))
+
+    # Contenu refusé : le renvoyer tel quel échouerait encore, inutile de réessayer
+    reason = rejection_reason(response)
+    if reason:
+        raise RuntimeError(f"Contenu refusé ({reason})")
 
     if not response or not response.text or response.text.strip() == "":
         if retry_count < 1:
             log(f"  ⚠️ Réponse vide, nouvelle tentative dans {RETRY_EMPTY_RESPONSE_DELAY}s...")
             time.sleep(RETRY_EMPTY_RESPONSE_DELAY)
-            return call_gemini(model, api_key, text, retry_count + 1)
+            return call_gemini(model, api_key, text, config, retry_count + 1)
         else:
             raise RuntimeError("Réponse vide après 2 tentatives")
 
     return response.text
 
 
+def call_gemini_stream(model, api_key, text, on_line, config=None):
+    """
+    Appelle l'API Gemini en streaming
+    on_line(ligne) est appelé pour chaque ligne traduite complète dès sa réception
+    """
+    client = genai.Client(api_key=api_key)
+    buffer = ""
+    received = 0
+    usage = None
+    reason = None
+
+    for chunk in client.models.generate_content_stream(
+        model=model,
+        contents=text,
+        config=config or translation_config()
+    ):
+        # usage_metadata cumulé : la valeur du dernier fragment fait foi (souvent un fragment sans texte)
+        usage = getattr(chunk, "usage_metadata", None) or usage
+        reason = rejection_reason(chunk) or reason
+        if not chunk or not chunk.text:
+            continue
+        buffer += chunk.text
+        while "\n" in buffer:
+            line, buffer = buffer.split("\n", 1)
+            if line.strip():
+                on_line(line.strip())
+                received += 1
+
+    if buffer.strip():
+        on_line(buffer.strip())
+        received += 1
+
+    record_usage(model, api_key, usage)
+    if reason:
+        # Lignes déjà transmises à on_line() conservées : seul le reste du lot sera redemandé
+        raise RuntimeError(f"Contenu refusé ({reason})")
+    if received == 0:
+        raise RuntimeError("Réponse vide après 2 tentatives")
+
+
+# =========================
+# HEDGING (RELANCE DES LOTS LENTS)
+# =========================
+HEDGE_WINDOW = 200  # derniers appels retenus par modèle
+latency_samples = {}  # modèle → deque(secondes par ligne)
+hedge_stats = {"requests": 0, "sent": 0, "won": 0, "lost": 0, "over_budget": 0}
+
+
+def record_latency(model, duration, lines):
+    latency_samples.setdefault(model, deque(maxlen=HEDGE_WINDOW)).append(duration / max(lines, 1))
+
+
+def hedge_delay(model, lines):
+    """Délai avant relance : percentile des latences récentes du modèle × lignes (None = historique insuffisant)"""
+    samples = latency_samples.get(model)
+    if not samples or len(samples) < HEDGE_MIN_SAMPLES:
+        return None
+    ordered = sorted(samples)
+    rank = min(max(math.ceil(HEDGE_PERCENTILE / 100 * len(ordered)) - 1, 0), len(ordered) - 1)
+    return max(ordered[rank] * lines, HEDGE_MIN_SECONDS)
+
+
+def hedge_target(model, key_index):
+    """
+    Autre (modèle, clé) disponible pour la relance : même modèle sur une autre clé d'abord
+    Créneau KEY_MIN_INTERVAL réservé sur la cible ; une clé dont le créneau n'est pas libre est passée
+    (une relance ne doit pas provoquer de 429)
+    """
+    candidates = [(model, idx) for idx in range(len(API_KEYS)) if idx != key_index]
+    candidates += [(other, idx) for other in MODELS if other != model for idx in range(len(API_KEYS))]
+    for candidate in candidates:
+        if is_available(*candidate) and reserve_key_slot(*candidate, only_if_free=True) is not None:
+            return candidate
+    return None
+
+
+async def call_gemini_async(model, api_key, text, config, retry_count=0):
+    """call_gemini() asynchrone : la requête perdante d'une relance peut être annulée"""
+    client = genai.Client(api_key=api_key)
+
+    response = await client.aio.models.generate_content(
+        model=model,
+        contents=text,
+        config=config
+    )
+    record_usage(model, api_key, getattr(response, "usage_metadata", None))
+
+    reason = rejection_reason(response)
+    if reason:
+        raise RuntimeError(f"Contenu refusé ({reason})")
+
+    if not response or not response.text or response.text.strip() == "":
+        if retry_count < 1:
+            log(f"  ⚠️ Réponse vide, nouvelle tentative dans {RETRY_EMPTY_RESPONSE_DELAY}s...")
+            await asyncio.sleep(RETRY_EMPTY_RESPONSE_DELAY)
+            return await call_gemini_async(model, api_key, text, config, retry_count + 1)
+        else:
+            raise RuntimeError("Réponse vide après 2 tentatives")
+
+    return response.text
+
+
+async def race_hedged(model, key_index, texts, context, offset=0):
+    """
+    Appel principal, relancé sur un autre (modèle, clé) s'il dépasse hedge_delay()
+    Première réponse valide gagnante, l'autre requête est annulée (et comptée : elle a été envoyée)
+    Retourne (texte, modèle, clé) ; si tout échoue, lève l'erreur de l'appel principal
+    """
+    text = encode_batch(texts, offset)
+
+    def launch(target_model, target_key):
+        config = translation_config(target_model, target_key, context)
+        task = asyncio.ensure_future(call_gemini_async(target_model, API_KEYS[target_key], text, config))
+        contenders[task] = (target_model, target_key, time.monotonic())
+        return task
+
+    contenders = {}
+    primary = launch(model, key_index)
+    hedge_stats["requests"] += 1
+
+    delay = hedge_delay(model, len(texts))
+    if delay is not None:
+        done, _ = await asyncio.wait({primary}, timeout=delay)
+        target = None
+        if not done and hedge_stats["sent"] >= hedge_stats["requests"] * HEDGE_BUDGET_PERCENT / 100:
+            hedge_stats["over_budget"] += 1
+        elif not done:
+            # Budget vérifié avant : hedge_target() réserve le créneau de la cible
+            target = hedge_target(model, key_index)
+        if target:
+            hedge_stats["sent"] += 1
+            log(f"🏁 Lot lent (> {delay:.1f}s, p{HEDGE_PERCENTILE:g} {model}) → relance clé #{target[1] + 1} | modèle {target[0]}")
+            launch(*target)
+
+    primary_error = None
+    pending = set(contenders)
+    while pending:
+        done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+        for task in done:
+            task_model, task_key, started = contenders[task]
+            error = task.exception()
+            if error is not None:
+                if task is primary:
+                    primary_error = error
+                else:
+                    report_call_error(task_model, task_key, error)
+                continue
+
+            # Gagnant : les requêtes encore en vol sont annulées
+            for other in pending:
+                other.cancel()
+            await asyncio.gather(*pending, return_exceptions=True)
+
+            record_latency(task_model, time.monotonic() - started, len(texts))
+            metric_observe("translator_batch_seconds", time.monotonic() - started, model=task_model)
+            record_request(task_model, task_key)
+            breaker_success(task_model, task_key)
+            # Requêtes annulées : comptées (envoyées), mais leur durée interrompue n'est pas une latence
+            for other in pending:
+                other_model, other_key, _ = contenders[other]
+                record_request(other_model, other_key)
+
+            if len(contenders) > 1:
+                if task is primary:
+                    hedge_stats["lost"] += 1
+                else:
+                    hedge_stats["won"] += 1
+                    log(f"🏁 Relance gagnante (clé #{task_key + 1} | modèle {task_model}) en {time.monotonic() - started:.1f}s"
+                        f"{' | requête initiale annulée' if pending else ''}")
+            if primary_error is not None:
+                report_call_error(model, key_index, primary_error)
+            return task.result(), task_model, task_key
+
+    raise primary_error
+
+
+def call_gemini_hedged(model, key_index, texts, context, offset=0):
+    """Appel d'un lot avec relance possible (boucle asyncio le temps de l'appel)"""
+    return asyncio.run(race_hedged(model, key_index, texts, context, offset))
+
+
+def log_hedge_summary():
+    """Fin de cycle : relances envoyées et gagnées depuis le démarrage"""
+    if not HEDGE_REQUESTS or not hedge_stats["requests"]:
+        return
+    share = hedge_stats["sent"] / hedge_stats["requests"] * 100
+    log(f"🏁 Relances : {hedge_stats['sent']}/{hedge_stats['requests']} requêtes ({share:.1f}%, budget {HEDGE_BUDGET_PERCENT:g}%) | "
+        f"Gagnantes: {hedge_stats['won']} | Perdantes: {hedge_stats['lost']} | Hors budget: {hedge_stats['over_budget']}")
+
+
+# =========================
+# SHOW CONTEXT (GLOSSAIRE + CACHE)
+# =========================
+SEASON_FOLDER_RE = re.compile(r"^(season|saison|staffel|temporada|s)\s*\d+$|^specials?$", re.IGNORECASE)
+GLOSSARY_TERM_RE = re.compile(r"(?<=[a-z,;] )[A-Z][a-z]+(?: [A-Z][a-z]+)*")
+
+
+def show_folder(video_path):
+    """
+    Dossier de la série d'après l'arborescence (Series/Season 01/E01.mkv → Series)
+    None si la vidéo est directement à la racine d'un SOURCE_FOLDERS (films en vrac)
+    """
+    folder = os.path.dirname(os.path.abspath(video_path))
+    if SEASON_FOLDER_RE.match(os.path.basename(folder)):
+        folder = os.path.dirname(folder)
+
+    roots = {os.path.abspath(root) for root in SOURCE_FOLDERS}
+    if folder in roots:
+        return None
+    return folder
+
+
+def load_show_glossary(show):
+    """Termes récurrents de la série (noms propres conservés tels quels), les plus fréquents d'abord"""
+    rows = db_execute(
+        "SELECT term FROM glossary WHERE show = ? AND occurrences >= 2 ORDER BY occurrences DESC, term LIMIT ?",
+        (show, GLOSSARY_MAX_TERMS)
+    )
+    return [row[0] for row in rows]
+
+
+@profiled("update_show_glossary")
+def update_show_glossary(show, subs, translated):
+    """
+    Alimente le glossaire après un épisode terminé :
+    noms propres (majuscule hors début de phrase) repris à l'identique dans la traduction
+    """
+    counts = {}
+    for source, target in zip(subs, translated):
+        for term in set(GLOSSARY_TERM_RE.findall(source.text.replace("\n", " "))):
+            if term in target.text and term.lower() not in COMMON_SINGLE_WORDS:
+                counts[term] = counts.get(term, 0) + 1
+
+    for term, occurrences in counts.items():
+        db_execute(
+            "INSERT INTO glossary (show, term, occurrences) VALUES (?, ?, ?) "
+            "ON CONFLICT(show, term) DO UPDATE SET occurrences = occurrences + excluded.occurrences",
+            (show, term, occurrences)
+        )
+    return len(counts)
+
+
+@profiled("build_show_context")
+def build_show_context(video_path):
+    """
+    Contexte de traduction d'un fichier : instruction système + glossaire de la série
+    Retourne None hors série (aucun épisode précédent ne peut servir de référence)
+    """
+    if CONTEXT_CACHE == "off":
+        return None
+
+    show = show_folder(video_path)
+    if not show:
+        return None
+
+    glossary = load_show_glossary(show)
+    instruction = SYSTEM_INSTRUCTION
+    if glossary:
+        instruction += (
+            " Série : " + os.path.basename(show) + ". "
+            "Noms et termes récurrents à conserver à l'identique : " + ", ".join(glossary) + "."
+        )
+
+    return {
+        "show": show,
+        "instruction": instruction,
+        "glossary_size": len(glossary),
+        "hash": hashlib.sha256(instruction.encode("utf-8")).hexdigest()[:16]
+    }
+
+
+class GeminiContextCache:
+    """Contexte stocké côté Gemini (cachedContents) : chaque lot ne paie que ses nouvelles lignes"""
+
+    def __init__(self):
+        self.entries = {}   # (modèle, clé, hash contexte) → (nom du cache, expiration)
+        self.failed = set()  # (modèle, hash contexte) refusés (contexte trop court, modèle non supporté)
+
+    def get(self, model, key_index, context):
+        entry_key = (model, key_index, context["hash"])
+        entry = self.entries.get(entry_key)
+        if entry and entry[1] > now() + 60:
+            metric_inc("translator_context_cache_total", result="hit")
+            return entry[0]
+
+        if (model, context["hash"]) in self.failed:
+            return None
+
+        try:
+            client = genai.Client(api_key=API_KEYS[key_index])
+            cache = client.caches.create(
+                model=model,
+                config=types.CreateCachedContentConfig(
+                    display_name=f"subtitles-{context['hash']}",
+                    system_instruction=context["instruction"],
+                    ttl=f"{CONTEXT_CACHE_TTL}s"
+                )
+            )
+        except Exception as e:
+            self.failed.add((model, context["hash"]))
+            metric_inc("translator_context_cache_total", result="failed")
+            log(f"  ⚠️ Cache contexte indisponible ({model}) → instruction envoyée à chaque lot : {e}")
+            return None
+
+        self.entries[entry_key] = (cache.name, now() + CONTEXT_CACHE_TTL)
+        metric_inc("translator_context_cache_total", result="miss")
+        return cache.name
+
+    def forget(self, model, key_index):
+        """Caches du couple (modèle, clé) oubliés (expirés ou supprimés côté Gemini) : recréés au prochain lot"""
+        for entry_key in [entry_key for entry_key in self.entries if entry_key[:2] == (model, key_index)]:
+            del self.entries[entry_key]
+
+
+class LocalContextCache:
+    """Équivalent local (tests, hors ligne) : mêmes clés de cache, instruction envoyée en clair"""
+
+    def __init__(self):
+        self.entries = {}
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, model, key_index, context):
+        entry_key = (model, key_index, context["hash"])
+        if entry_key in self.entries:
+            self.hits += 1
+            metric_inc("translator_context_cache_total", result="hit")
+        else:
+            self.misses += 1
+            metric_inc("translator_context_cache_total", result="miss")
+            self.entries[entry_key] = f"local/{context['hash']}"
+        return None
+
+    def forget(self, model, key_index):
+        for entry_key in [entry_key for entry_key in self.entries if entry_key[:2] == (model, key_index)]:
+            del self.entries[entry_key]
+
+
+context_cache = GeminiContextCache() if CONTEXT_CACHE == "gemini" else LocalContextCache()
+
+
+# =========================
+# ROUTAGE DES MODÈLES
+# =========================
+# Score par modèle (plus bas = préféré) : écart entre le rang du modèle et la difficulté du lot
+# + pénalité de latence (secondes/ligne observées) + avance sur le rythme de consommation du quota.
+# Lots courts et simples → modèle rapide à gros quota, dialogues denses → modèle le plus fort.
+ROUTING_LATENCY_WEIGHT = 0.5
+ROUTING_QUOTA_WEIGHT = 1.0
+ROUTING_MIN_SAMPLES = 5  # appels observés avant de tenir compte de la latence d'un modèle
+COMPLEX_CUE_PATTERN = re.compile(r"^\s*-.*\s-\s*\S|[.!?…]\s+\S")  # deux interlocuteurs ou plusieurs phrases
+routing_stats = {}  # modèle → lots routés en premier choix
+
+
+def batch_difficulty(texts):
+    """0 (lot court, répliques brèves) → 1 (lot plein de dialogues denses)"""
+    if not texts:
+        return 0.0
+    density = min(sum(len(text) for text in texts) / len(texts) / ROUTING_DENSE_CHARS, 1.0)
+    complex_share = sum(1 for text in texts if COMPLEX_CUE_PATTERN.search(text)) / len(texts)
+    size = min(len(texts) / BATCH_SIZE, 1.0)
+    return round(0.5 * density + 0.3 * complex_share + 0.2 * size, 2)
+
+
+def latency_penalty(model):
+    """Latence médiane par ligne rapportée au modèle le plus rapide (0 = le plus rapide ou inconnu, max 1)"""
+    medians = {}
+    for candidate in MODELS:
+        samples = latency_samples.get(candidate)
+        if samples and len(samples) >= ROUTING_MIN_SAMPLES:
+            medians[candidate] = sorted(samples)[len(samples) // 2]
+    if model not in medians or not min(medians.values()):
+        return 0.0
+    return min(medians[model] / min(medians.values()) - 1, 1.0)
+
+
+def quota_pace(model):
+    """
+    Part du quota journalier du modèle déjà consommée moins la part de la période écoulée :
+    > 0 = en avance (à ménager), < 0 = en retard (quota qui serait perdu au reset), 0 si RPD inconnu
+    """
+    limit = int(MODELS_RPD.get(model, 0)) * len(API_KEYS)
+    if not limit or now() >= usage_period_end:
+        return 0.0
+    used = sum(usage_counts.get((model, idx), 0) for idx in range(len(API_KEYS)))
+    elapsed = 1 - (usage_period_end - now()) / 86400
+    return max(min(used / limit - elapsed, 1.0), -1.0)
+
+
+def route_models(texts):
+    """Ordre d'essai des modèles pour ce lot : (modèles, difficulté ou None si routage inactif)"""
+    if MODEL_ROUTING == "order" or len(MODELS) < 2:
+        return MODELS, None
+
+    difficulty = batch_difficulty(texts)
+    target = 1 - difficulty  # rang visé : 0 = modèle le plus fort (premier de GEMINI_MODELS)
+
+    def score(model):
+        rank = MODELS.index(model) / (len(MODELS) - 1)
+        return (abs(rank - target) + ROUTING_LATENCY_WEIGHT * latency_penalty(model)
+                + ROUTING_QUOTA_WEIGHT * quota_pace(model))
+
+    ordered = sorted(MODELS, key=score)
+    routing_stats[ordered[0]] = routing_stats.get(ordered[0], 0) + 1
+    metric_inc("translator_routed_batches_total", model=ordered[0])
+    return ordered, difficulty
+
+
+def log_routing_summary():
+    """Fin de cycle : répartition des lots entre modèles (premier choix du routage)"""
+    if not routing_stats:
+        return
+    total = sum(routing_stats.values())
+    shares = " | ".join(f"{model}: {count} ({count / total:.0%})" for model, count in routing_stats.items())
+    log(f"🧭 Routage des lots : {shares}")
+    routing_stats.clear()
+
+
 # =========================
 # TRANSLATE BATCH
 # =========================
-def translate_batch(texts):
+RETRY_DELAY_PATTERN = re.compile(r"^(\d+(?:\.\d+)?)s$")
+# Requête trop volumineuse (400/413) : le lot coupé en deux passera
+PAYLOAD_TOO_LARGE_PATTERN = re.compile(r"payload size|too large|exceeds the maximum number of tokens|input token count")
+
+
+def retry_after_hint(error):
+    """Délai demandé par l'API (en-tête Retry-After ou RetryInfo.retryDelay), None si absent"""
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None) or {}
+    try:
+        value = headers.get("Retry-After") or headers.get("retry-after")
+        if value:
+            return float(value)
+    except (TypeError, ValueError):
+        pass  # date HTTP : jamais renvoyée par l'API Gemini, le backoff s'applique
+
+    details = getattr(error, "details", None)
+    if isinstance(details, dict):
+        for detail in (details.get("error") or details).get("details") or []:
+            match = RETRY_DELAY_PATTERN.match(str(detail.get("retryDelay", "")))
+            if match:
+                return float(match.group(1))
+    return None
+
+
+def classify_error(error):
+    """
+    Erreur d'appel → (type, délai Retry-After ou None)
+    transient : 5xx, réseau, délai dépassé, réponse vide → nouvel essai après backoff
+    rate_limit : 429 par minute → pause courte (Retry-After)
+    quota_exhausted : 429 quota du jour → cooldown, reset observé
+    content_rejected : lot refusé par un filtre (rejection_reason) ou trop volumineux → découpé,
+    la clé n'y est pour rien
+    invalid_request : autre 400 (modèle inconnu, configuration, cache de contexte périmé) → pas de découpage,
+    cache oublié et backoff comme une erreur passagère
+    auth : clé invalide ou révoquée (401/403) → écartée pour tous les modèles
+    """
+    code = getattr(error, "code", None)
+    status = str(getattr(error, "status", "") or "").upper()
+    msg = str(error).lower()
+    retry_after = retry_after_hint(error)
+
+    # Clé invalide : renvoyée en 400 INVALID_ARGUMENT par l'API, à tester avant les refus de contenu
+    if code in (401, 403) or status in ("UNAUTHENTICATED", "PERMISSION_DENIED") or "api key not valid" in msg \
+            or "api_key_invalid" in msg:
+        return "auth", None
+    if "contenu refusé" in msg or code == 413 or (code == 400 and PAYLOAD_TOO_LARGE_PATTERN.search(msg)):
+        return "content_rejected", None
+    if code == 400:
+        return "invalid_request", None
+    if code == 429 or status == "RESOURCE_EXHAUSTED" or "quota" in msg or "429" in msg or "rate limit" in msg:
+        details = json.dumps(getattr(error, "details", None) or "").lower()
+        if "perday" in details or "per_day" in details:
+            return "quota_exhausted", retry_after
+        if "perminute" in details or "per_minute" in details or (retry_after is not None and retry_after < COOLDOWN_SECONDS):
+            return "rate_limit", retry_after
+        return "quota_exhausted", retry_after
+    return "transient", retry_after
+
+
+def backoff_delay(failures, retry_after=None):
+    """Pause après le n-ième échec consécutif : RETRY_BASE_SECONDS × 2^(n-1) avec gigue, jamais sous Retry-After"""
+    delay = min(RETRY_BASE_SECONDS * 2 ** (failures - 1), COOLDOWN_SECONDS)
+    delay = random.uniform(delay / 2, delay)
+    return max(delay, retry_after or 0)
+
+
+def breaker_failure(model, key_index, retry_after=None):
+    """Échec passager : backoff exponentiel, circuit ouvert (COOLDOWN_SECONDS) au-delà de BREAKER_THRESHOLD"""
+    failures = key_failures.get((model, key_index), 0) + 1
+    key_failures[(model, key_index)] = failures
+    if failures >= BREAKER_THRESHOLD:
+        # Circuit ouvert ; à sa réouverture, un seul essai : un nouvel échec le rouvre aussitôt
+        log(f"  ⛔ circuit ouvert clé #{key_index + 1} ({model}) : {failures} échecs consécutifs")
+        block_key(model, key_index, seconds=max(COOLDOWN_SECONDS, retry_after or 0))
+    else:
+        block_key(model, key_index, seconds=backoff_delay(failures, retry_after))
+
+
+def breaker_success(model, key_index):
+    """Appel réussi : compteur d'échecs du couple (modèle, clé) remis à zéro (circuit refermé)"""
+    if key_failures.pop((model, key_index), 0) >= BREAKER_THRESHOLD:
+        log(f"  ✅ circuit refermé clé #{key_index + 1} ({model})")
+
+
+def report_call_error(model, key_index, error):
+    """Erreur d'appel classée (classify_error) : pause adaptée du couple (modèle, clé), retourne le type"""
+    kind, retry_after = classify_error(error)
+    metric_inc("translator_gemini_errors_total", model=model, key=key_index + 1, kind=kind)
+
+    if kind == "content_rejected":
+        log(f"  🚫 Lot refusé par {model} : {error}")
+    elif kind == "invalid_request":
+        log(f"  ⚠️ Requête invalide clé #{key_index + 1} ({model}) : {error}")
+        context_cache.forget(model, key_index)
+        breaker_failure(model, key_index)
+    elif kind == "auth":
+        log(f"  ⚠️ Clé #{key_index + 1} refusée (authentification) : {error}")
+        for other in MODELS:
+            block_key(other, key_index, seconds=AUTH_COOLDOWN_SECONDS)
+    elif kind == "quota_exhausted":
+        log(f"  ⚠️ Quota dépassé pour clé #{key_index + 1}")
+        block_key(model, key_index, quota_exhausted=True, seconds=max(COOLDOWN_SECONDS, retry_after or 0))
+    elif kind == "rate_limit":
+        log(f"  ⚠️ Limite par minute atteinte - clé #{key_index + 1}")
+        breaker_failure(model, key_index, retry_after)
+    else:
+        log(f"  ⚠️ erreur clé #{key_index + 1} ({model}) : {error}")
+        breaker_failure(model, key_index, retry_after)
+    return kind
+
+
+def translate_rejected(texts, offset, context):
+    """
+    Lot refusé par le modèle (filtre de contenu, requête invalide) : coupé en deux jusqu'à isoler
+    la ou les répliques en cause, conservées en anglais ; retourne les lignes de réponse
+    """
+    if len(texts) == 1:
+        log(f"  🚫 Réplique refusée, conservée en anglais : {texts[0][:60]!r}")
+        metric_inc("translator_rejected_lines_total")
+        if MULTI_LANGUAGE:
+            values = {language: texts[0] for language in TARGET_LANGUAGES}
+            return json.dumps({"id": offset + 1, **values}, ensure_ascii=False)
+        return texts[0]
+
+    half = len(texts) // 2
+    log(f"  ✂️ Lot refusé découpé : {half} + {len(texts) - half} lignes")
+    first, _, _ = translate_batch(texts[:half], context=context, offset=offset)
+    second, _, _ = translate_batch(texts[half:], context=context, offset=offset + half)
+    return f"{first}\n{second}"
+
+
+def translate_batch(texts, on_line=None, context=None, offset=0):
+    """
+    Traduit un lot en essayant chaque (modèle, clé) disponible
+    En mode STREAMING, les lignes reçues avant une erreur sont conservées :
+    la tentative suivante ne demande que les lignes manquantes.
+    on_line(position, ligne) est appelé pour chaque ligne reçue (streaming uniquement).
+    context : contexte de série (build_show_context), None = instruction par défaut
+    offset : position du lot dans le lot d'origine (ids multi-langues d'un lot refusé puis découpé)
+    Retourne (texte, modèle, clé) ; modèle et clé à None si tout le lot a été refusé
+    """
+    received = []
+
+    def collect(line):
+        if not is_response_line(line):
+            return
+        if len(received) < len(texts):
+            received.append(line)
+            if on_line:
+                on_line(len(received) - 1, line)
+
     while True:
-        for model in MODELS:
+        # Cooldowns posés par les autres instances (même STATE_DB)
+        refresh_ledger()
+        models, difficulty = route_models(texts)
+        route_info = f" | lot {'dense' if difficulty >= 0.5 else 'simple'} ({difficulty:.2f})" if difficulty is not None else ""
+        for model in models:
             for key_index, api_key in enumerate(API_KEYS):
                 if not is_available(model, key_index):
                     continue
 
-                log(f"🔑 utilisation clé #{key_index + 1} | modèle {model}")
+                log(f"🔑 utilisation clé #{key_index + 1} | modèle {model}{route_info}")
 
                 try:
-                    translated = call_gemini(model, api_key, "\n".join(texts))
+                    wait = reserve_key_slot(model, key_index)
+                    if wait > 0:
+                        with span("key_slot", model=model):
+                            sleep_holding_leases(wait)
+                    config = translation_config(model, key_index, context)
+                    call_start = time.monotonic()
+                    if STREAMING:
+                        with span("call_gemini_stream", model=model, lines=len(texts) - len(received)):
+                            call_gemini_stream(model, api_key, encode_batch(texts[len(received):], offset + len(received)),
+                                               collect, config)
+                        translated = "\n".join(received)
+                    elif HEDGE_REQUESTS:
+                        # Enregistrement de la requête (et de la relance éventuelle) fait par race_hedged()
+                        with span("call_gemini", model=model, lines=len(texts)):
+                            return call_gemini_hedged(model, key_index, texts, context, offset)
+                    else:
+                        with span("call_gemini", model=model, lines=len(texts)):
+                            translated = call_gemini(model, api_key, encode_batch(texts, offset), config)
+                    metric_observe("translator_batch_seconds", time.monotonic() - call_start, model=model)
+                    record_latency(model, time.monotonic() - call_start, len(texts))
+                    record_request(model, key_index)
+                    breaker_success(model, key_index)
                     return translated, model, key_index
 
                 except Exception as e:
-                    msg = str(e).lower()
-
-                    if "quota" in msg or "429" in msg or "rate" in msg:
-                        log(f"  ⚠️ Quota dépassé pour clé #{key_index + 1}")
-                        block_key(model, key_index)
-                    elif "réponse vide" in msg:
-                        log(f"  ⚠️ Réponse vide après 2 tentatives - clé #{key_index + 1}")
-                        block_key(model, key_index)
-                    else:
-                        log(f"  ⚠️ erreur clé #{key_index + 1} ({model}) : {e}")
-                        block_key(model, key_index)
+                    if received:
+                        log(f"  💾 {len(received)}/{len(texts)} lignes déjà reçues conservées")
+                    if report_call_error(model, key_index, e) == "content_rejected":
+                        # Même lot refusé sur une autre clé : découpé au lieu de réessayer
+                        if len(received) < len(texts):
+                            # Lignes du lot découpé passées par collect() : checkpoint streaming comme les autres
+                            rejected = translate_rejected(texts[len(received):], offset + len(received), context)
+                            for line in rejected.split("\n"):
+                                collect(line)
+                        return "\n".join(received), None, None
+
+        # Pauses courtes (backoff, circuit ouvert) : attendre la première clé libérée plutôt que le reset quota
+        short_waits = [cooldowns.get((model, idx), 0) - now() for model in MODELS for idx in range(len(API_KEYS))
+                       if (model, idx) not in exhausted_at]
+        wait = min(short_waits, default=None)
+        if wait is not None and 0 < wait <= COOLDOWN_SECONDS and wait < calculate_next_quota_reset()[1]:
+            log(f"⏳ Toutes les clés en pause → nouvel essai dans {wait:.0f}s")
+            sleep_holding_leases(wait)
+            continue
 
         if not any_key_available():
             if WATCH_MODE:
@@ -246,6 +1865,163 @@ def translate_batch(texts):
         time.sleep(2)
 
 
+# =========================
+# ALIGNMENT CHECK
+# =========================
+ALIGN_RATIO_RANGE = (0.4, 2.5)  # longueur traduction / source hors de cet intervalle → suspecte
+ALIGN_MIN_CHARS = 12  # en dessous, le ratio de longueur n'est pas significatif
+ALIGN_EXPECTED_RATIO = 1.15  # une traduction est en moyenne un peu plus longue que l'anglais
+ALIGN_SIGMA = 0.5  # écart toléré (log du ratio de longueur)
+# Coûts d'alignement (-log des fréquences de Gale-Church) : 1-1 courant, fusion/coupure rare, omission très rare
+ALIGN_COST_MATCH = 0.1
+ALIGN_COST_MERGE = 2.3
+ALIGN_COST_SKIP = 4.6
+
+
+def suspicious_translation(text, translation):
+    """Traduction vide, recopiée telle quelle (3 mots et plus) ou de longueur aberrante"""
+    if not translation:
+        return True
+    if translation.strip().lower() == text.strip().lower() and len(text.split()) >= 3:
+        return True
+    ratio = len(translation) / max(len(text), 1)
+    if len(text) >= ALIGN_MIN_CHARS and not ALIGN_RATIO_RANGE[0] <= ratio <= ALIGN_RATIO_RANGE[1]:
+        return True
+    # Lignes courtes : seule une traduction beaucoup trop longue (fusion) est significative
+    return len(translation) > len(text) * ALIGN_RATIO_RANGE[1] + 20
+
+
+def length_cost(source_length, translation_length):
+    deviation = math.log((translation_length + 1) / (source_length + 1) / ALIGN_EXPECTED_RATIO)
+    return deviation * deviation / (2 * ALIGN_SIGMA * ALIGN_SIGMA)
+
+
+def align_lines(texts, lines):
+    """
+    Réponse sans id (une seule langue) : alignement des lignes reçues sur les lignes envoyées
+    d'après leurs longueurs (programmation dynamique façon Gale-Church : 1-1, fusion 2-1,
+    coupure 1-2, omission 1-0, ligne en trop 0-1)
+    Retourne {position: traduction} pour les seules paires 1-1
+    """
+    n, m = len(texts), len(lines)
+    source = [len(text) for text in texts]
+    target = [len(line) for line in lines]
+    infinity = float("inf")
+    cost = [[infinity] * (m + 1) for _ in range(n + 1)]
+    step = [[None] * (m + 1) for _ in range(n + 1)]
+    cost[0][0] = 0.0
+
+    moves = (
+        (1, 1, ALIGN_COST_MATCH),
+        (2, 1, ALIGN_COST_MERGE),
+        (1, 2, ALIGN_COST_MERGE),
+        (1, 0, ALIGN_COST_SKIP),
+        (0, 1, ALIGN_COST_SKIP),
+    )
+    for i in range(n + 1):
+        for j in range(m + 1):
+            for di, dj, penalty in moves:
+                if i < di or j < dj or cost[i - di][j - dj] == infinity:
+                    continue
+                total = cost[i - di][j - dj] + penalty
+                if di and dj:
+                    total += length_cost(sum(source[i - di:i]), sum(target[j - dj:j]))
+                if total < cost[i][j]:
+                    cost[i][j] = total
+                    step[i][j] = (di, dj)
+
+    aligned = {}
+    i, j = n, m
+    while i or j:
+        di, dj = step[i][j]
+        if di == 1 and dj == 1:
+            aligned[i - 1] = lines[j - 1]
+        i, j = i - di, j - dj
+    return aligned
+
+
+def retranslate_positions(texts, positions, context):
+    """
+    Redemande les lignes suspectes par sous-lots de ALIGN_CHUNK_SIZE
+    Un sous-lot encore décalé est coupé en deux, une ligne seule est acceptée telle quelle
+    Retourne ({position: {langue: traduction}}, requêtes envoyées)
+    """
+    fixed = {}
+    requests = 0
+    chunks = [positions[start:start + ALIGN_CHUNK_SIZE] for start in range(0, len(positions), ALIGN_CHUNK_SIZE)]
+    while chunks:
+        chunk = chunks.pop(0)
+        chunk_texts = [texts[position] for position in chunk]
+        translated_text, _, _ = translate_batch(chunk_texts, context=context)
+        requests += 1
+        results = decode_response(translated_text)
+
+        if MULTI_LANGUAGE:
+            values_by_position = {position: values for position, values in reversed(results)}
+            complete = all(len(values_by_position.get(index, {})) == len(TARGET_LANGUAGES)
+                           for index in range(len(chunk)))
+        else:
+            complete = len(results) == len(chunk)
+
+        if not complete and len(chunk) > 1:
+            half = len(chunk) // 2
+            chunks[:0] = [chunk[:half], chunk[half:]]
+            continue
+
+        if not MULTI_LANGUAGE and len(chunk) == 1 and results:
+            # Ligne seule coupée en plusieurs lignes par le modèle : recollée
+            language = TARGET_LANGUAGES[0]
+            results = [(0, {language: " ".join(values[language] for _, values in results)})]
+
+        for position, values in results:
+            if 0 <= position < len(chunk) and values:
+                fixed[chunk[position]] = values
+    return fixed, requests
+
+
+def align_batch(texts, results, context, label):
+    """
+    Contrôle d'un lot traduit : lignes manquantes, décalées, de longueur aberrante ou non traduites
+    Seules les lignes suspectes sont redemandées ; retourne la liste corrigée de (position, {langue: traduction})
+    """
+    if MULTI_LANGUAGE:
+        # Réponse indexée par id : pas de décalage possible, seulement des lignes manquantes ou suspectes
+        values_by_position = {position: values for position, values in reversed(results) if 0 <= position < len(texts)}
+        aligned = {
+            position: values for position, values in values_by_position.items()
+            if all(language in values and not suspicious_translation(texts[position], values[language])
+                   for language in TARGET_LANGUAGES)
+        }
+    else:
+        language = TARGET_LANGUAGES[0]
+        lines = [values[language] for _, values in results]
+        if len(lines) == len(texts):
+            candidates = dict(enumerate(lines))
+        else:
+            candidates = align_lines(texts, lines)
+        aligned = {
+            position: {language: line} for position, line in candidates.items()
+            if not suspicious_translation(texts[position], line)
+        }
+        # Même nombre de lignes mais suspectes : peut-être une fusion compensée par une coupure → réalignement
+        if len(lines) == len(texts) and len(aligned) < len(texts):
+            realigned = align_lines(texts, lines)
+            if realigned != candidates:
+                aligned = {
+                    position: {language: line} for position, line in realigned.items()
+                    if not suspicious_translation(texts[position], line)
+                }
+
+    suspects = [position for position in range(len(texts)) if position not in aligned]
+    if not suspects:
+        return sorted(aligned.items())
+
+    fixed, requests = retranslate_positions(texts, suspects, context)
+    aligned.update(fixed)
+    log(f"🧩 {label} | {len(suspects)}/{len(texts)} ligne(s) décalée(s) ou suspecte(s) → redemandée(s) en {requests} requête(s)")
+    return sorted(aligned.items())
+
+
 # =========================
 # FORMAT CONVERSION
 # =========================
@@ -257,7 +2033,7 @@ def clean_html_tags(srt_file):
     import re
     
     try:
-        subs = pysrt.open(srt_file, encoding='utf-8')
+        subs = subtitle_formats.read_srt(srt_file)
         modified = False
         
         for sub in subs:
@@ -268,7 +2044,7 @@ def clean_html_tags(srt_file):
                 modified = True
         
         if modified:
-            subs.save(srt_file, encoding='utf-8')
+            subtitle_formats.write_srt(srt_file, subs)
             return True
         return False
     except Exception as e:
@@ -276,6 +2052,27 @@ def clean_html_tags(srt_file):
         return False
 
 
+def converted_srt_path(subtitle_file):
+    """Chemin du SRT converti (.to.srt.tmp) associé à une source ASS/SSA/VTT"""
+    if '.ass.tmp' in subtitle_file:
+        return subtitle_file.replace('.ass.tmp', '.ass.to.srt.tmp')
+    elif '.ssa.tmp' in subtitle_file:
+        return subtitle_file.replace('.ssa.tmp', '.ssa.to.srt.tmp')
+    elif '.vtt.tmp' in subtitle_file:
+        return subtitle_file.replace('.vtt.tmp', '.vtt.to.srt.tmp')
+    elif subtitle_file.endswith('.ass'):
+        return subtitle_file.replace('.ass', '.ass.to.srt.tmp')
+    elif subtitle_file.endswith('.ssa'):
+        return subtitle_file.replace('.ssa', '.ssa.to.srt.tmp')
+    elif subtitle_file.endswith('.vtt'):
+        return subtitle_file.replace('.vtt', '.vtt.to.srt.tmp')
+    else:
+        # Autre format
+        base = subtitle_file.rsplit('.', 1)[0]
+        return f"{base}.to.srt.tmp"
+
+
+@profiled("convert_to_srt_if_needed")
 def convert_to_srt_if_needed(subtitle_file):
     """
     Convertit ASS/SSA/VTT en SRT temporaire pour traduction
@@ -290,22 +2087,7 @@ def convert_to_srt_if_needed(subtitle_file):
         return None, False
     
     # Besoin conversion
-    if '.ass.tmp' in subtitle_file:
-        temp_srt = subtitle_file.replace('.ass.tmp', '.ass.to.srt.tmp')
-    elif '.ssa.tmp' in subtitle_file:
-        temp_srt = subtitle_file.replace('.ssa.tmp', '.ssa.to.srt.tmp')
-    elif '.vtt.tmp' in subtitle_file:
-        temp_srt = subtitle_file.replace('.vtt.tmp', '.vtt.to.srt.tmp')
-    elif subtitle_file.endswith('.ass'):
-        temp_srt = subtitle_file.replace('.ass', '.ass.to.srt.tmp')
-    elif subtitle_file.endswith('.ssa'):
-        temp_srt = subtitle_file.replace('.ssa', '.ssa.to.srt.tmp')
-    elif subtitle_file.endswith('.vtt'):
-        temp_srt = subtitle_file.replace('.vtt', '.vtt.to.srt.tmp')
-    else:
-        # Autre format
-        base = subtitle_file.rsplit('.', 1)[0]
-        temp_srt = f"{base}.to.srt.tmp"
+    temp_srt = converted_srt_path(subtitle_file)
     
     # Convertir avec ffmpeg si pas déjà fait
     if not os.path.exists(temp_srt):
@@ -334,8 +2116,10 @@ def convert_to_srt_if_needed(subtitle_file):
             
             result = subprocess.run(cmd, check=True, capture_output=True, text=True)
             
-            # Copier le résultat vers la destination finale
-            shutil.move(tmp_output, temp_srt)
+            # Copier le résultat vers la destination finale (écriture atomique : jamais de .to.srt.tmp tronqué)
+            with open(tmp_output, encoding="utf-8") as f:
+                subtitle_formats.atomic_write(temp_srt, f.read())
+            os.remove(tmp_output)
             
             # Nettoyer /tmp
             if os.path.exists(tmp_input):
@@ -356,6 +2140,85 @@ def convert_to_srt_if_needed(subtitle_file):
     return temp_srt, True  # Fichier temp, à nettoyer
 
 
+@profiled("load_source_subtitles")
+def load_source_subtitles(subtitle_file):
+    """
+    Charge une source anglaise en mémoire (liste de subtitle_formats.Cue)
+    - SRT : lecture directe
+    - ASS/SSA/VTT : parser natif (SUBTITLE_PARSER=native) ou ffmpeg (SUBTITLE_PARSER=ffmpeg)
+    - SUP/SUB : OCR Tesseract (None si OCR_ENABLED=false ou Tesseract absent)
+    Retourne (subs, converted)
+    """
+    fmt = subtitle_formats.detect_format(subtitle_file)
+
+    if fmt == 'srt':
+        return subtitle_formats.read_srt(subtitle_file), False
+
+    # Un .to.srt.tmp déjà présent est réutilisé : une reprise garde le même découpage
+    converted_path = converted_srt_path(subtitle_file)
+
+    if fmt in ('sup', 'sub'):
+        if os.path.exists(converted_path):
+            return subtitle_formats.read_srt(converted_path), True
+        if not ocr_available():
+            return None, False
+        cues = ocr_bitmaps(bitmap_ocr.read_bitmaps(subtitle_file), os.path.basename(subtitle_file))
+        if KEEP_CONVERTED_SRT:
+            subtitle_formats.write_srt(converted_path, cues)
+        return cues, True
+    if SUBTITLE_PARSER == "ffmpeg" or os.path.exists(converted_path):
+        srt_file, _ = convert_to_srt_if_needed(subtitle_file)
+        if not srt_file:
+            return None, False
+        return subtitle_formats.read_srt(srt_file), True
+
+    cues = subtitle_formats.read_cues(subtitle_file)
+    if KEEP_CONVERTED_SRT:
+        subtitle_formats.write_srt(converted_path, cues)
+    return cues, True
+
+
+def ocr_available():
+    """OCR activé et Tesseract installé"""
+    return OCR_ENABLED and shutil.which("tesseract") is not None
+
+
+def lookup_ocr_cache(hashes):
+    """Textes déjà reconnus pour ces empreintes d'image (table ocr_cache)"""
+    known = {}
+    for start in range(0, len(hashes), 500):
+        chunk = hashes[start:start + 500]
+        rows = db_execute(
+            f"SELECT hash, text FROM ocr_cache WHERE hash IN ({', '.join('?' * len(chunk))})", chunk
+        )
+        known.update(rows)
+    return known
+
+
+@profiled("ocr_bitmaps")
+def ocr_bitmaps(bitmaps, label):
+    """OCR d'images de sous-titres → répliques anglaises (cache par empreinte, pool de processus)"""
+    started = time.time()
+    cues, recognized = bitmap_ocr.recognize(bitmaps, lookup=lookup_ocr_cache, workers=OCR_WORKERS,
+                                            language=OCR_LANGUAGE)
+    if recognized:
+        with _db_lock:
+            db = get_db()
+            db.execute("BEGIN IMMEDIATE")
+            try:
+                db.executemany(
+                    "INSERT OR REPLACE INTO ocr_cache (hash, text, created_at) VALUES (?, ?, ?)",
+                    [(digest, text, now()) for digest, text in recognized.items()]
+                )
+                db.execute("COMMIT")
+            except Exception:
+                db.execute("ROLLBACK")
+                raise
+    log(f"🔍 {label} | OCR : {len(bitmaps)} image(s), {len(recognized)} reconnue(s), "
+        f"{len(bitmaps) - len(recognized)} en cache/doublon | {len(cues)} réplique(s) en {time.time() - started:.1f}s")
+    return cues
+
+
 def cleanup_converted_files(base_path):
     """Supprime tous les fichiers .to.srt.tmp si DELETE_CONVERTED_AFTER=true"""
     if not DELETE_CONVERTED_AFTER:
@@ -367,54 +2230,459 @@ def cleanup_converted_files(base_path):
             os.remove(converted)
 
 
-# =========================
-# PROGRESS
-# =========================
-def load_progress(path):
-    if os.path.exists(path):
-        with open(path, "r") as f:
-            return json.load(f).get("last_index", 0)
-    return 0
+# =========================
+# TITLE STATE
+# =========================
+TITLE_COLUMNS = ("source_path", "size", "mtime", "status", "last_index", "total", "partial",
+                 "output_checksum", "started_at", "finished_at", "duration")
+
+
+def source_key(source_file):
+    """Clé d'état d'une source : (chemin, taille, mtime) → une source ré-extraite repart de zéro"""
+    stat = os.stat(source_file)
+    return source_file, stat.st_size, stat.st_mtime
+
+
+def load_title_state(video_path, language):
+    """État enregistré d'une vidéo pour une langue cible (dict) ou None"""
+    rows = db_execute(
+        f"SELECT {', '.join(TITLE_COLUMNS)} FROM titles WHERE video_path = ? AND language = ? "
+        "ORDER BY updated_at DESC LIMIT 1",
+        (video_path, language)
+    )
+    if not rows:
+        return None
+    state = dict(zip(TITLE_COLUMNS, rows[0]))
+    state["partial"] = json.loads(state["partial"]) if state["partial"] else {}
+    return state
+
+
+@profiled("save_title_state")
+def save_title_state(video_path, language, key, **fields):
+    """
+    Crée ou met à jour l'état d'une vidéo (langue cible) pour la source `key`
+    Une seule ligne par vidéo et par langue : l'état d'une ancienne version de la source est remplacé
+    """
+    source_path, size, mtime = key
+    if "partial" in fields:
+        fields["partial"] = json.dumps(fields["partial"], ensure_ascii=False) if fields["partial"] else None
+
+    with _db_lock:
+        db = get_db()
+        db.execute("BEGIN IMMEDIATE")
+        try:
+            db.execute(
+                "DELETE FROM titles WHERE video_path = ? AND language = ? "
+                "AND NOT (source_path = ? AND size = ? AND mtime = ?)",
+                (video_path, language, source_path, size, mtime)
+            )
+            db.execute(
+                "INSERT INTO titles (source_path, size, mtime, language, video_path, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT (source_path, size, mtime, language) DO UPDATE SET video_path = excluded.video_path, "
+                "updated_at = excluded.updated_at",
+                (source_path, size, mtime, language, video_path, now())
+            )
+            if fields:
+                assignments = ", ".join(f"{name} = ?" for name in fields)
+                db.execute(
+                    f"UPDATE titles SET {assignments} "
+                    "WHERE source_path = ? AND size = ? AND mtime = ? AND language = ?",
+                    (*fields.values(), source_path, size, mtime, language)
+                )
+            db.execute("COMMIT")
+        except Exception:
+            db.execute("ROLLBACK")
+            raise
+
+
+def delete_title_state(video_path, language):
+    """Supprime l'état d'une vidéo (langue cible) si DELETE_PROGRESS_AFTER=true"""
+    if not DELETE_PROGRESS_AFTER:
+        return
+
+    db_execute("DELETE FROM titles WHERE video_path = ? AND language = ?", (video_path, language))
+
+
+def state_matches(state, key):
+    """L'état enregistré correspond-il à la source actuelle ?"""
+    return state is not None and (state["source_path"], state["size"], state["mtime"]) == key
+
+
+def file_checksum(path):
+    """Empreinte SHA-256 d'un fichier (lecture par blocs)"""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def import_legacy_progress(video_path, base_path):
+    """
+    Migre un ancien Film.fr.progress.json dans STATE_DB (une seule fois, le fichier est supprimé)
+    Retourne le nouvel état ou None si rien à migrer
+    """
+    progress_path = f"{base_path}.fr.progress.json"
+    output_path = f"{base_path}.fr.srt"
+
+    with open(progress_path, "r") as f:
+        data = json.load(f)
+
+    last_index = data.get("last_index", 0)
+    partial = data.get("partial", {})
+    total = subtitle_formats.count_srt_cues(output_path) if os.path.isfile(output_path) else None
+    done = total is not None and last_index >= total and not partial
+    if done:
+        last_index = total
+
+    # Source déjà supprimée (DELETE_SOURCE_AFTER) : la clé porte sur la sortie
+    key_file = find_english_subtitle(base_path) or (output_path if total is not None else None)
+    if not key_file:
+        return None
+
+    save_title_state(
+        video_path, "fr", source_key(key_file),
+        status="done" if done else "in_progress",
+        last_index=last_index, total=total, partial=partial,
+        output_checksum=file_checksum(output_path) if done else None,
+        finished_at=os.path.getmtime(output_path) if done else None
+    )
+    os.remove(progress_path)
+
+    if done:
+        # Titre terminé avant la migration : même nettoyage qu'en fin de traduction
+        delete_title_state(video_path, "fr")
+        if TARGET_LANGUAGES == ["fr"]:
+            delete_extracted_subtitle(base_path)
+            cleanup_converted_files(base_path)
+    return load_title_state(video_path, "fr")
+
+
+def load_video_state(video_path, base_path, language):
+    """État d'une vidéo pour une langue, ancien .fr.progress.json migré au passage"""
+    state = load_title_state(video_path, language)
+    if state is None and language == "fr" and os.path.exists(f"{base_path}.fr.progress.json"):
+        state = import_legacy_progress(video_path, base_path)
+    return state
+
+
+def source_unchanged(video_path, base_path, state, current):
+    """
+    La source d'une traduction terminée est-elle toujours la même ?
+    current : liste à un élément, clé de la source actuelle (calculée au premier appel, partagée entre langues)
+    """
+    if not current:
+        source_file = find_english_subtitle(base_path)
+        current.append(source_key(source_file) if source_file else None)
+    if current[0] is not None:
+        return state_matches(state, current[0])
+    if state["source_path"].startswith(f"{video_path}#"):
+        # Piste extraite en mémoire (mode pipeline) : seule la vidéo est connue sans la relire
+        return os.path.isfile(video_path) and os.stat(video_path).st_mtime == state["mtime"]
+    # Source supprimée après traduction (DELETE_SOURCE_AFTER) : rien à comparer
+    return True
+
+
+@profiled("pending_languages")
+def pending_languages(video_path, base_path):
+    """
+    Langues restant à traduire pour une vidéo
+    Retourne (à_traduire, terminées) : deux dicts langue → état (ou None)
+    Terminée = .{langue}.srt présent et état "done" sur la source actuelle
+    (ou aucun état : traduction antérieure à STATE_DB) ; source ré-extraite ou remplacée → à refaire
+    """
+    pending = {}
+    done = {}
+    current = []
+    for language in TARGET_LANGUAGES:
+        state = load_video_state(video_path, base_path, language)
+        if os.path.isfile(f"{base_path}.{language}.srt") and (
+                state is None or (state["status"] == "done" and source_unchanged(video_path, base_path, state, current))):
+            done[language] = state
+        else:
+            pending[language] = state
+    return pending, done
+
+
+def resume_index(state, key, output_path, total):
+    """Reprise uniquement si l'état porte sur cette source et que la sortie partielle existe encore"""
+    if state_matches(state, key) and os.path.exists(output_path):
+        return min(state["last_index"], total)
+    return 0
+
+
+def sweep_partial_files():
+    """
+    Démarrage : supprime les écritures interrompues (*.partial) laissées par un arrêt brutal
+    La sortie précédente est intacte et STATE_DB ne dépasse jamais le dernier lot écrit → reprise normale
+    """
+    removed = 0
+    for folder in SOURCE_FOLDERS:
+        for root, _, files in os.walk(folder):
+            for name in files:
+                if not name.endswith(subtitle_formats.PARTIAL_SUFFIX):
+                    continue
+                try:
+                    os.remove(os.path.join(root, name))
+                    removed += 1
+                except OSError as e:
+                    log(f"⚠️ {name} | Suppression impossible: {e}")
+
+    if removed:
+        log(f"🧹 {removed} écriture(s) interrompue(s) (.partial) supprimée(s)")
+
+
+def delete_extracted_subtitle(base_path):
+    """Supprime les fichiers .en.XXX.tmp (fichiers extraits du MKV) si DELETE_SOURCE_AFTER=true"""
+    deleted = False
+
+    if DELETE_SOURCE_AFTER:
+        for ext in SUBTITLE_EXTENSIONS:
+            extracted_file = f"{base_path}.en.{ext}.tmp"
+            if os.path.isfile(extracted_file):
+                os.remove(extracted_file)
+                deleted = True
+        
+        # Index VobSub extrait avec le .sub
+        idx_file = f"{base_path}.en.idx.tmp"
+        if os.path.isfile(idx_file):
+            os.remove(idx_file)
+
+    # Supprimer le fichier marqueur .en.nosubtitle.tmp si DELETE_NO_SUBTITLE_MARKER=true
+    if DELETE_NO_SUBTITLE_MARKER:
+        marker_file = f"{base_path}.en.nosubtitle.tmp"
+        if os.path.isfile(marker_file):
+            os.remove(marker_file)
+            deleted = True
+
+    return deleted
+
+
+# =========================
+# BAUX MULTI-INSTANCE
+# =========================
+# Un bail (STATE_DB) par vidéo en cours : deux instances aux SOURCE_FOLDERS communs ne traduisent
+# jamais le même titre. Renouvelé à chaque lot, il expire seul si son instance meurt.
+def acquire_lease(video_path):
+    """Prend ou prolonge le bail d'une vidéo ; retourne l'instance qui le détient si ce n'est pas celle-ci"""
+    with db_transaction() as db:
+        row = db.execute("SELECT owner, expires_at FROM leases WHERE video_path = ?", (video_path,)).fetchone()
+        if row and row[0] != REPLICA_ID and row[1] > now():
+            return row[0]
+        db.execute("INSERT OR REPLACE INTO leases (video_path, owner, expires_at) VALUES (?, ?, ?)",
+                   (video_path, REPLICA_ID, now() + LEASE_SECONDS))
+    return None
+
+
+def release_lease(video_path):
+    db_execute("DELETE FROM leases WHERE video_path = ? AND owner = ?", (video_path, REPLICA_ID))
+
+
+def release_own_leases():
+    """Démarrage : les baux laissés par un arrêt brutal de cette instance sont libérés"""
+    released = db_execute("SELECT COUNT(*) FROM leases WHERE owner = ?", (REPLICA_ID,))[0][0]
+    db_execute("DELETE FROM leases WHERE owner = ?", (REPLICA_ID,))
+    active = db_execute("SELECT COUNT(DISTINCT owner) FROM leases WHERE expires_at > ?", (now(),))[0][0]
+    if released or active:
+        log(f"🤝 Instance {REPLICA_ID} | {released} bail(aux) libéré(s) | {active} autre(s) instance(s) active(s)")
+
+
+def renew_own_leases():
+    """Prolonge tous les baux détenus par cette instance (vidéo en cours + demandes prioritaires imbriquées)"""
+    db_execute("UPDATE leases SET expires_at = ? WHERE owner = ?", (now() + LEASE_SECONDS, REPLICA_ID))
+
+
+def sleep_holding_leases(seconds):
+    """
+    time.sleep() des longues attentes d'un lot (reset quota, backoff, créneau de clé) :
+    baux renouvelés au fil de l'attente, une autre instance ne reprend pas la vidéo pour rien
+    """
+    deadline = time.monotonic() + seconds
+    while True:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            return
+        time.sleep(min(remaining, LEASE_SECONDS / 3))
+        renew_own_leases()
+
+
+def lease_lost(video_path):
+    """Prolonge le bail pendant la traduction ; True s'il a expiré et été repris par une autre instance"""
+    holder = acquire_lease(video_path)
+    if holder is not None:
+        log(f"🤝 {os.path.basename(video_path)} | Bail repris par l'instance {holder} → abandon, elle reprend depuis l'état sauvegardé")
+    return holder is not None
+
+
+# =========================
+# RÉUTILISATION DES TRADUCTIONS
+# =========================
+# Empreinte = texte normalisé des répliques (sans balises, espaces réduits, timings exclus) :
+# la traduction mémorisée est reposée sur les timings de la nouvelle source
+REUSE_TAG_RE = re.compile(r"<[^>]+>|\{[^}]*\}")
+REUSE_CANDIDATES = 10  # fuzzy : sources de taille voisine comparées
+
+
+def normalize_cue_text(text):
+    return " ".join(REUSE_TAG_RE.sub("", text).split())
+
+
+def source_fingerprint(normalized):
+    return hashlib.sha256("\n".join(normalized).encode("utf-8")).hexdigest()
+
+
+def store_translations(video_path, flat_texts, language, translated):
+    """Fin de traduction : empreinte de la source → répliques traduites (compressées)"""
+    if TRANSLATION_REUSE == "off":
+        return
+    normalized = [normalize_cue_text(text) for text in flat_texts]
+    data = zlib.compress(json.dumps({
+        "source": normalized,
+        "translated": [cue.text for cue in translated]
+    }, ensure_ascii=False).encode("utf-8"))
+    db_execute(
+        "INSERT OR REPLACE INTO translation_cache (hash, language, cues, data, video_path, created_at) "
+        "VALUES (?, ?, ?, ?, ?, ?)",
+        (source_fingerprint(normalized), language, len(normalized), data, video_path, now())
+    )
+
+
+def load_cached_entry(row):
+    entry = json.loads(zlib.decompress(row[0]).decode("utf-8"))
+    entry["video_path"] = row[1]
+    return entry
 
 
-def save_progress(path, index):
-    with open(path, "w") as f:
-        json.dump({"last_index": index}, f)
+def find_reusable_translation(normalized, language):
+    """
+    Traduction terminée d'une source identique (exact) ou très proche (fuzzy)
+    Retourne (entrée, {index source: index traduit}, similarité) ou None
+    """
+    row = db_execute("SELECT data, video_path FROM translation_cache WHERE hash = ? AND language = ?",
+                     (source_fingerprint(normalized), language))
+    if row:
+        return load_cached_entry(row[0]), {index: index for index in range(len(normalized))}, 1.0
 
+    if TRANSLATION_REUSE != "fuzzy" or not normalized:
+        return None
 
-def delete_progress(path):
-    """Supprime le fichier de progression si DELETE_PROGRESS_AFTER=true"""
-    if not DELETE_PROGRESS_AFTER:
-        return
-    
-    if os.path.exists(path):
-        os.remove(path)
+    # Candidats de taille voisine : au-delà, la similarité minimale est impossible
+    margin = int(len(normalized) * (1 - REUSE_MIN_SIMILARITY)) + 1
+    rows = db_execute(
+        "SELECT data, video_path FROM translation_cache WHERE language = ? AND cues BETWEEN ? AND ? "
+        "ORDER BY ABS(cues - ?) LIMIT ?",
+        (language, len(normalized) - margin, len(normalized) + margin, len(normalized), REUSE_CANDIDATES)
+    )
 
+    best = None
+    for row in rows:
+        entry = load_cached_entry(row)
+        matcher = difflib.SequenceMatcher(None, normalized, entry["source"], autojunk=False)
+        if matcher.quick_ratio() < REUSE_MIN_SIMILARITY:
+            continue
+        mapping = {}
+        for source_start, cached_start, size in matcher.get_matching_blocks():
+            for offset in range(size):
+                mapping[source_start + offset] = cached_start + offset
+        similarity = len(mapping) / max(len(normalized), len(entry["source"]))
+        if similarity >= REUSE_MIN_SIMILARITY and (best is None or similarity > best[2]):
+            best = (entry, mapping, similarity)
+    return best
+
+
+@profiled("reuse_translations")
+def reuse_translations(video_name, flat_texts, languages):
+    """
+    Traductions reprises d'une source déjà traduite, par langue : {langue: {texte: traduction}}
+    Les répliques absentes (fuzzy) restent à traduire normalement
+    """
+    if TRANSLATION_REUSE == "off":
+        return {}
+
+    normalized = [normalize_cue_text(text) for text in flat_texts]
+    reused = {}
+    for language in languages:
+        found = find_reusable_translation(normalized, language)
+        if not found:
+            continue
+        entry, mapping, similarity = found
+        reused[language] = {
+            flat_texts[index]: entry["translated"][cached] for index, cached in mapping.items() if flat_texts[index].strip()
+        }
+        kind = "identique" if similarity == 1.0 else f"{similarity:.0%} similaire"
+        metric_inc("translator_reused_cues_total", len(reused[language]), language=language,
+                   kind="exact" if similarity == 1.0 else "fuzzy")
+        log(f"♻️ {video_name} | {language} : {len(mapping)}/{len(flat_texts)} répliques réutilisées ({kind}) "
+            f"| Source: {os.path.basename(entry['video_path'] or '?')}")
+    return reused
 
-def delete_extracted_subtitle(base_path):
-    """Supprime les fichiers .en.XXX.tmp (fichiers extraits du MKV) si DELETE_SOURCE_AFTER=true"""
-    deleted = False
 
-    if DELETE_SOURCE_AFTER:
-        for ext in SUBTITLE_EXTENSIONS:
-            extracted_file = f"{base_path}.en.{ext}.tmp"
-            if os.path.isfile(extracted_file):
-                os.remove(extracted_file)
-                deleted = True
+# =========================
+# DÉTECTION DE LANGUE (HORS LIGNE)
+# =========================
+# Mots outils comptés par language_detection.py (module partagé avec l'extractor)
+def language_tagged(source_file, source=None):
+    """
+    Source déjà étiquetée anglaise : piste MKV déclarée (ou vérifiée) en mode pipeline,
+    fichier Film.en.srt / Film.eng.ass, extraction .en.XXX.tmp (piste anglaise ou "und" vérifiée par l'extractor)
+    """
+    if source is not None:
+        return bool(source.get("language_known"))
+    name = os.path.basename(source_file)
+    if name.endswith(".tmp"):
+        name = name[:-len(".tmp")]
+    stem, _ = os.path.splitext(name)
+    return os.path.splitext(stem)[1].lower() in (".en", ".eng")
 
-    # Supprimer le fichier marqueur .en.nosubtitle.tmp si DELETE_NO_SUBTITLE_MARKER=true
-    if DELETE_NO_SUBTITLE_MARKER:
-        marker_file = f"{base_path}.en.nosubtitle.tmp"
-        if os.path.isfile(marker_file):
-            os.remove(marker_file)
-            deleted = True
 
-    return deleted
+def load_language_decision(key):
+    """Langue déjà détectée pour cette source (clé chemin + taille + mtime) : code, "" si indéterminée, None si jamais vue"""
+    rows = db_execute("SELECT language FROM source_languages WHERE source = ? AND size = ? AND mtime = ?", key)
+    return rows[0][0] if rows else None
+
+
+def check_source_language(video_path, base, key, subs, languages):
+    """
+    Source réellement anglaise ? (fichier sans langue, piste "und" extraite comme anglaise)
+    Décision enregistrée par source : la détection ne tourne qu'une fois par fichier
+    Retourne None (traduire) ou l'issue "wrong_language" ; une source déjà dans une langue cible
+    devient directement le .{langue}.srt de cette langue
+    """
+    video_name = os.path.basename(video_path)
+    language = load_language_decision(key)
+    if language is None:
+        language, share = language_detection.detect_language([sub.text.replace("\n", " ") for sub in subs])
+        language = language or ""
+        db_execute(
+            "INSERT OR REPLACE INTO source_languages (source, size, mtime, language, share, checked_at) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            (*key, language, share, now())
+        )
+        metric_inc("translator_language_checks_total", language=language or "und")
+        if language and language != "en":
+            log(f"🌐 {video_name} | Source détectée en {language_name(language)} ({share:.0%} de mots outils)")
+    elif language and language != "en":
+        log_routine("source non anglaise", video_path, f"⏭️ {video_name} | Source en {language_name(language)} (déjà détectée)")
+
+    if not language or language == "en":
+        return None
+
+    if language in languages:
+        output_path = f"{base}.{language}.srt"
+        subtitle_formats.write_srt(output_path, subs)
+        delete_title_state(video_path, language)
+        log(f"🌐 {video_name} | Source conservée comme {os.path.basename(output_path)} (aucun appel API)")
+    others = [target for target in languages if target != language]
+    if others:
+        log(f"⏭️ {video_name} | Source non anglaise : {', '.join(others)} non traduit(s)")
+    return "wrong_language"
 
 
 # =========================
 # FILE DETECTION
 # =========================
+@profiled("find_english_subtitle")
 def find_english_subtitle(base_path):
     """Cherche un fichier source anglais dans l'ordre de priorité"""
     # Priorité 1 : fichiers extraits .en.XXX.tmp
@@ -440,105 +2708,471 @@ def find_english_subtitle(base_path):
     return None
 
 
+# =========================
+# PRE-TRANSLATION FILTER
+# =========================
+# Bruitages courants (contenu des [..] / (..)) → équivalent français
+SOUND_EFFECTS = {
+    "music": "musique",
+    "music playing": "musique",
+    "soft music": "musique douce",
+    "upbeat music": "musique entraînante",
+    "dramatic music": "musique dramatique",
+    "tense music": "musique tendue",
+    "ominous music": "musique inquiétante",
+    "suspenseful music": "musique angoissante",
+    "music continues": "la musique continue",
+    "music stops": "la musique s'arrête",
+    "laughs": "rires",
+    "laughing": "rires",
+    "laughter": "rires",
+    "chuckles": "petit rire",
+    "chuckling": "petits rires",
+    "giggles": "gloussements",
+    "sighs": "soupire",
+    "gasps": "halète",
+    "panting": "halètement",
+    "screams": "crie",
+    "screaming": "cris",
+    "groans": "gémit",
+    "grunts": "grogne",
+    "grunting": "grognements",
+    "coughs": "tousse",
+    "coughing": "toux",
+    "sniffles": "renifle",
+    "sobbing": "sanglots",
+    "crying": "pleurs",
+    "whispering": "chuchotements",
+    "whispers": "chuchote",
+    "clears throat": "se racle la gorge",
+    "scoffs": "ricane",
+    "exhales": "expire",
+    "inhales": "inspire",
+    "applause": "applaudissements",
+    "cheering": "acclamations",
+    "crowd cheering": "la foule acclame",
+    "indistinct chatter": "bavardages indistincts",
+    "indistinct conversation": "conversation indistincte",
+    "gunshot": "coup de feu",
+    "gunshots": "coups de feu",
+    "gunfire": "coups de feu",
+    "explosion": "explosion",
+    "thunder": "tonnerre",
+    "thunder rumbling": "grondement de tonnerre",
+    "footsteps": "bruits de pas",
+    "knocking": "on frappe",
+    "knock on door": "on frappe à la porte",
+    "door opens": "la porte s'ouvre",
+    "door closes": "la porte se ferme",
+    "door slams": "la porte claque",
+    "phone ringing": "le téléphone sonne",
+    "phone rings": "le téléphone sonne",
+    "phone buzzing": "le téléphone vibre",
+    "doorbell rings": "on sonne à la porte",
+    "dog barking": "aboiements",
+    "dogs barking": "aboiements",
+    "birds chirping": "gazouillis",
+    "siren wailing": "sirène",
+    "sirens wailing": "sirènes",
+    "tires screeching": "crissement de pneus",
+    "engine starts": "le moteur démarre",
+    "beeping": "bips",
+    "static": "grésillements",
+    "silence": "silence",
+}
+
+# Mots courants qui, seuls sur une ligne, se traduisent (≠ prénom isolé)
+COMMON_SINGLE_WORDS = {
+    "yes", "yeah", "yep", "no", "nope", "okay", "ok", "hey", "hi", "hello", "bye", "goodbye", "thanks", "thank",
+    "sorry", "please", "wait", "stop", "help", "go", "come", "run", "look", "listen", "watch", "move", "hurry",
+    "what", "why", "who", "where", "when", "how", "really", "seriously", "right", "well", "oh", "ah", "now",
+    "here", "there", "fine", "good", "great", "sure", "perfect", "exactly", "maybe", "never", "always", "again",
+    "enough", "quiet", "silence", "careful", "down", "up", "out", "back", "damn", "god", "mom", "dad", "sir",
+    "madam", "man", "guys", "everyone", "nothing", "cheers", "congratulations", "morning", "night", "welcome",
+    "action", "cut", "freeze", "fire", "police", "mommy", "daddy", "grandma", "grandpa", "baby", "honey",
+    "darling", "sweetie", "buddy", "dude", "bro", "boss", "captain", "doctor", "officer", "detective", "agent",
+}
+
+NO_TRANSLATION_RE = re.compile(r"^(?:https?://|www\.)\S+$|^[\w.+-]+@[\w-]+\.[\w.-]+$", re.IGNORECASE)
+SOUND_TAG_RE = re.compile(r"[\[(]([^\])]+)[\])]")
+LONE_NAME_RE = re.compile(r"^-?\s*([A-Z][a-z]+(?:-[A-Z][a-z]+)?)[!?.,…]*$")
+PROPER_NOUN_RE = re.compile(r"(?<=[a-z,;] )[A-Z][a-z]+(?:-[A-Z][a-z]+)?")
+
+
+def known_proper_nouns(video_path, texts):
+    """
+    Noms propres connus du fichier : termes du glossaire de la série
+    + mots écrits avec une majuscule en milieu de phrase ailleurs dans le fichier
+    Seuls ces mots, isolés sur une ligne, sont conservés sans traduction
+    """
+    names = set()
+    show = show_folder(video_path)
+    if show:
+        for term in load_show_glossary(show):
+            names.add(term)
+            names.update(term.split())
+
+    for text in texts:
+        names.update(PROPER_NOUN_RE.findall(text))
+
+    return {name for name in names if name.lower() not in COMMON_SINGLE_WORDS}
+
+
+def translate_sound_effects(text):
+    """
+    Traduit une ligne composée uniquement de bruitages connus ([music], (gunshot)...)
+    Retourne None si un des bruitages est inconnu ou si la ligne contient du dialogue
+    """
+    remainder = SOUND_TAG_RE.sub("", text).strip(" -♪♫")
+    if remainder or not SOUND_TAG_RE.search(text):
+        return None
+
+    unknown = False
+
+    def replace(match):
+        nonlocal unknown
+        tag = match.group(1).strip()
+        french = SOUND_EFFECTS.get(tag.lower())
+        if french is None:
+            unknown = True
+            return match.group(0)
+        if tag.isupper():
+            french = french.upper()
+        return match.group(0).replace(match.group(1), french)
+
+    translated = SOUND_TAG_RE.sub(replace, text)
+    return None if unknown else translated
+
+
+def classify_cue(text, names=frozenset()):
+    """
+    Classe une réplique avant envoi à l'API
+    names : noms propres connus (known_proper_nouns), seuls conservés tels quels sur une ligne isolée
+    Retourne (type, texte_final) :
+    - ("passthrough", texte) : rien à traduire (♪, ponctuation, nombres, URL, nom propre connu seul)
+    - ("sound", traduction) : bruitages traduits via SOUND_EFFECTS
+    - ("translate", None) : à envoyer à Gemini
+    """
+    flat = text.replace("\n", " ").strip()
+
+    if not any(char.isalpha() for char in flat):
+        return "passthrough", text
+
+    if NO_TRANSLATION_RE.match(flat):
+        return "passthrough", text
+
+    name = LONE_NAME_RE.match(flat)
+    if name and name.group(1) in names:
+        return "passthrough", text
+
+    sound = translate_sound_effects(flat)
+    if sound is not None:
+        return "sound", sound
+
+    return "translate", None
+
+
+def local_translation(kind, value, language):
+    """
+    Traduction d'une réplique classée, résolue sans API pour cette langue, ou None
+    Les bruitages (SOUND_EFFECTS) n'existent qu'en français : autres langues → API
+    """
+    if kind == "passthrough":
+        return value
+    if kind == "sound" and language == "fr":
+        return value
+    return None
+
+
 # =========================
 # MAIN TRANSLATION
 # =========================
-def translate_subtitle(video_path):
-    """Traduit un fichier de sous-titre"""
+# Mode pipeline : fournit une source extraite en mémoire quand aucune source n'est sur disque
+# (fonction video_path → dict source ou None, voir translate_subtitle)
+source_provider = None
+
+
+@counted_outcome
+@profiled_file
+def translate_subtitle(video_path, source=None):
+    """
+    Traduit un fichier de sous-titre vers chaque langue de TARGET_LANGUAGES (mêmes requêtes)
+    source : sous-titre anglais déjà en mémoire (mode pipeline), dict
+    {"name": libellé, "key": clé d'état (chemin, taille, mtime), "cues": répliques}
+    → aucun fichier source lu ni écrit, seul le .{langue}.srt final est produit
+    """
     base, _ = os.path.splitext(video_path)
     video_name = os.path.basename(video_path)
-    output_path = f"{base}.fr.srt"
-    progress_path = f"{base}.fr.progress.json"
     
-    # 1. Vérifier si .fr.srt existe
-    if os.path.isfile(output_path):
-        if not os.path.exists(progress_path):
-            log(f"⏭️ {video_name} | Déjà traduit (Film.fr.srt existe)")
+    # Demandes prioritaires (API) reçues depuis le fichier précédent
+    serve_priority_requests()
+    
+    # 1. Vérifier l'état de chaque langue (STATE_DB) : une recherche, aucune lecture de fichier
+    try:
+        states, done = pending_languages(video_path, base)
+    except Exception as e:
+        log(f"⚠️ {video_name} | Erreur lecture état: {e}")
+        states = {language: None for language in TARGET_LANGUAGES}
+        done = {}
+    
+    if not states:
+        if MULTI_LANGUAGE:
+            log_routine("déjà traduit", video_path, f"⏭️ {video_name} | Déjà traduit ({', '.join(TARGET_LANGUAGES)})")
             return "already_done"
         
+        state = done[TARGET_LANGUAGES[0]]
+        if state is None:
+            log_routine("déjà traduit", video_path, f"⏭️ {video_name} | Déjà traduit (Film.{TARGET_LANGUAGES[0]}.srt existe)")
+        else:
+            log_routine("déjà traduit", video_path, f"⏭️ {video_name} | Traduction complète ({state['last_index']}/{state['total']})")
+        return "already_done"
+    
+    # Multi-instance : une seule instance traduit une vidéo donnée
+    holder = acquire_lease(video_path)
+    if holder is not None:
+        log_routine("autre instance", video_path, f"⏭️ {video_name} | En cours sur l'instance {holder}")
+        return "leased"
+    
+    try:
+        # Relu sous bail : une autre instance a pu terminer ce titre entre-temps
         try:
-            subs_check = pysrt.open(output_path, encoding="utf-8")
-            total_lines = len(subs_check)
-            last_index = load_progress(progress_path)
-            
-            if last_index >= total_lines:
-                log(f"⏭️ {video_name} | Traduction complète ({last_index}/{total_lines})")
-                delete_progress(progress_path)
-                delete_extracted_subtitle(base)
-                cleanup_converted_files(base)
-                return "already_done"
-        except Exception as e:
-            log(f"⚠️ {video_name} | Erreur vérification progress: {e}")
+            states, _ = pending_languages(video_path, base)
+        except Exception:
+            pass
+        if not states:
+            log_routine("déjà traduit", video_path, f"⏭️ {video_name} | Déjà traduit (autre instance)")
+            return "already_done"
+        with tracked_usage():
+            return translate_title(video_path, base, states, source)
+    finally:
+        release_lease(video_path)
+
+
+def translate_title(video_path, base, states, source):
+    """Étapes 2 à 8 de translate_subtitle(), sous bail : langues restantes de states"""
+    video_name = os.path.basename(video_path)
+    languages = list(states)
     
-    # 2. Chercher fichier source anglais
-    source_file = find_english_subtitle(base)
+    # 2. Chercher fichier source anglais (sur disque, sinon extraction en mémoire si disponible)
+    source_file = None
+    if source is None:
+        source_file = find_english_subtitle(base)
+        if not source_file and source_provider is not None:
+            source = source_provider(video_path)
     
-    if not source_file:
+    if source is not None:
+        subs, needs_cleanup = source["cues"], False
+        key = source["key"]
+        source_file = source["name"]
+    elif not source_file:
         log(f"❌ {video_name} | Aucune source anglaise trouvée")
         return "no_source"
+    else:
+        key = source_key(source_file)
+        known = load_language_decision(key) if LANGUAGE_DETECTION and not language_tagged(source_file) else None
+        if known and known != "en" and known not in languages:
+            log_routine("source non anglaise", video_path, f"⏭️ {video_name} | Source en {language_name(known)} (déjà détectée)")
+            return "wrong_language"
+        
+        # 3-4. Charger la source (conversion ASS/SSA/VTT en mémoire si nécessaire)
+        try:
+            subs, needs_cleanup = load_source_subtitles(source_file)
+        except Exception as e:
+            log(f"❌ {video_name} | Erreur lecture source: {e}")
+            return "error"
+        
+        if subs is None:
+            log(f"❌ {video_name} | Format bitmap (image) non traduisible sans OCR")
+            return "unsupported_format"
     
-    # 3. Convertir en SRT si nécessaire
-    srt_file, needs_cleanup = convert_to_srt_if_needed(source_file)
-    
-    if not srt_file:
-        log(f"❌ {video_name} | Format bitmap (image) non traduisible sans OCR")
-        return "unsupported_format"
+    # Source sans réplique (fichier vide, ASS sans dialogue) : rien à écrire, rien à traduire
+    if not subs:
+        log(f"❌ {video_name} | Source vide (aucune réplique): {os.path.basename(source_file)}")
+        return "no_source"
     
-    # 4. Charger le fichier SRT
-    try:
-        subs = pysrt.open(srt_file, encoding="utf-8")
-    except Exception as e:
-        log(f"❌ {video_name} | Erreur lecture source: {e}")
-        return "error"
+    # Source réellement anglaise ? (décision enregistrée, aucune requête envoyée sinon)
+    # Source étiquetée anglaise (nom de fichier, piste déclarée) : étiquette crue, pas de détection
+    if LANGUAGE_DETECTION and not language_tagged(source_file, source):
+        outcome = check_source_language(video_path, base, key, subs, languages)
+        if outcome:
+            return outcome
     
     total = len(subs)
-    last_done = load_progress(progress_path)
     
-    if os.path.exists(output_path):
-        translated = pysrt.open(output_path, encoding="utf-8")
-    else:
-        translated = subs[:]
+    # Une sortie par langue : copie de la source, les textes traduits remplacent l'anglais au fil des lots
+    outputs = {}
+    for language in languages:
+        state = states[language]
+        output_path = f"{base}.{language}.srt"
+        language_done = resume_index(state, key, output_path, total)
+        
+        translated = [subtitle_formats.Cue(sub.start, sub.end, sub.text) for sub in subs]
+        if language_done > 0:
+            previous = subtitle_formats.read_srt(output_path)
+            if len(previous) < total:
+                # Sortie tronquée (arrêt brutal avant l'écriture atomique) : dernière réplique lue incertaine
+                language_done = min(language_done, max(len(previous) - 1, 0))
+                log(f"⚠️ {video_name} | {os.path.basename(output_path)} tronqué ({len(previous)}/{total}) → reprise à {language_done + 1}")
+            for index in range(language_done):
+                translated[index].text = previous[index].text
+        
+        started_at = state["started_at"] if language_done > 0 and state["started_at"] else time.time()
+        save_title_state(video_path, language, key, status="in_progress", last_index=language_done, total=total,
+                         started_at=started_at, finished_at=None)
+        outputs[language] = {
+            "path": output_path,
+            "last_done": language_done,
+            "translated": translated,
+            "partial": state["partial"] if language_done > 0 else {}
+        }
+    
+    # Les langues en retard fixent le point de reprise, les autres ne sont pas réécrites avant leur index
+    last_done = min(output["last_done"] for output in outputs.values())
     
     # Log de début compact
     source_name = os.path.basename(source_file)
     conversion_info = ""
-    if needs_cleanup or '.ssa.txt' in source_file or '.ass.txt' in source_file:
+    if source is None and subtitle_formats.detect_format(source_file) in ('sup', 'sub'):
+        conversion_info = " | OCR"
+    elif needs_cleanup or '.ssa.txt' in source_file or '.ass.txt' in source_file:
         conversion_info = " | Converting ASS→SRT"
     
+    if MULTI_LANGUAGE:
+        conversion_info += f" | Langues: {', '.join(languages)}"
+    
     if last_done > 0:
         log(f"🎬 {video_name} | Source: {source_name} ({total} lignes) | Reprise à {last_done + 1}{conversion_info}")
     else:
         log(f"🎬 {video_name} | Source: {source_name} ({total} lignes){conversion_info}")
     
+    # Contexte de série : glossaire des épisodes précédents (+ cache Gemini)
+    context = build_show_context(video_path)
+    if context and context["glossary_size"]:
+        log(f"📖 {video_name} | Glossaire {os.path.basename(context['show'])} : {context['glossary_size']} terme(s)")
+    
     # 5. Suivi du temps pour estimation
     batch_times = []
     start_time = time.time()
     
-    # 6. Traduction par lots
-    for i in range(last_done, total, BATCH_SIZE):
-        batch_start = time.time()
+    # 6. Classification : ce qui n'a pas besoin de l'API est résolu localement
+    flat_texts = [sub.text.replace("\n", " ") for sub in subs]
+    if PRE_FILTER:
+        names = known_proper_nouns(video_path, flat_texts)
+        classified = [classify_cue(text, names) for text in flat_texts]
+    else:
+        classified = [("translate", None)] * total
+    
+    # Doublons du fichier : une ligne déjà traduite n'est jamais renvoyée (mémo par langue)
+    memos = {}
+    for language, output in outputs.items():
+        memo = {}
+        for index in range(output["last_done"]):
+            if local_translation(*classified[index], language) is None:
+                memo.setdefault(flat_texts[index], output["translated"][index].text)
+        # Lignes reçues en streaming avant une interruption : pas redemandées
+        memo.update(output["partial"])
+        memos[language] = memo
+    
+    # Même source déjà traduite (autre qualité, autre dossier) : répliques reprises sans appel API
+    for language, values in reuse_translations(video_name, flat_texts, languages).items():
+        for text, value in values.items():
+            memos[language].setdefault(text, value)
+    saved_cues = 0
+    
+    def needs_api(index):
+        # Envoyée si au moins une langue en retard n'a ni traduction locale ni traduction mémorisée
+        text = flat_texts[index]
+        return any(
+            index >= outputs[language]["last_done"]
+            and local_translation(*classified[index], language) is None
+            and text not in memos[language]
+            for language in languages
+        )
+    
+    def remember(texts, position, values):
+        if 0 <= position < len(texts):
+            for language, value in values.items():
+                if language in memos:
+                    memos[language][texts[position]] = value
+    
+    # 7. Traduction par lots (BATCH_SIZE textes uniques à envoyer par requête)
+    i = last_done
+    update_live_progress(video_path, status="translating", done=last_done, total=total,
+                         percent=round(last_done / total * 100, 1) if total else 100.0,
+                         languages=languages, eta=None, started_at=time.time())
+    while i < total:
+        # Entre deux lots : une demande prioritaire passe devant, ce fichier reprend ensuite
+        if i > last_done:
+            serve_priority_requests(video_path)
+        if lease_lost(video_path):
+            return "leased"
         
-        batch = subs[i:i + BATCH_SIZE]
-        texts = [s.text.replace("\n", " ") for s in batch]
+        batch_start = time.time()
         
-        translated_result = translate_batch(texts)
-        translated_text, used_model, used_key_index = translated_result
+        texts = []
+        pending = set()
+        j = i
+        while j < total and len(texts) < BATCH_SIZE:
+            text = flat_texts[j]
+            if text not in pending and needs_api(j):
+                pending.add(text)
+                texts.append(text)
+            j += 1
+        batch = subs[i:j]
         
-        lines = [l.strip() for l in translated_text.split("\n") if l.strip()]
+        def checkpoint(position, line, texts=texts, batch_first=i):
+            # Streaming : chaque ligne reçue est mémorisée, sauvegarde tous les STREAM_CHECKPOINT_LINES
+            remember(texts, *decode_line(line, position))
+            received = position + 1
+            if received % STREAM_CHECKPOINT_LINES == 0 and received < len(texts):
+                for language, output in outputs.items():
+                    partial = dict(output["partial"])
+                    partial.update({text: memos[language][text] for text in texts[:received] if text in memos[language]})
+                    save_title_state(video_path, language, key, last_index=max(batch_first, output["last_done"]),
+                                     partial=partial)
+                log(f"📡 {video_name} | lot {batch_first + 1}+ : {received}/{len(texts)} lignes reçues")
         
-        for j, sub in enumerate(batch):
-            if j < len(lines):
-                translated[i + j].text = lines[j]
+        # Un SIGTERM pendant le lot attend sa sauvegarde (SHUTDOWN_GRACE_SECONDS max)
+        with shutdown_guard():
+            if texts:
+                translated_result = translate_batch(texts, on_line=checkpoint if STREAMING else None, context=context)
+                translated_text, used_model, used_key_index = translated_result
+            
+                results = decode_response(translated_text)
+                if ALIGN_CHECK:
+                    results = align_batch(texts, results, context, f"{video_name} | lot {i + 1}+")
+                for position, values in results:
+                    remember(texts, position, values)
+                # Lot resté bloqué au-delà du bail (attente du reset quota) : ne pas écraser l'autre instance
+                if lease_lost(video_path):
+                    return "leased"
         
-        translated.save(output_path, encoding="utf-8")
-        save_progress(progress_path, i + len(batch))
+            for language, output in outputs.items():
+                memo = memos[language]
+                translated = output["translated"]
+                for k in range(max(i, output["last_done"]), j):
+                    local = local_translation(*classified[k], language)
+                    if local is not None:
+                        translated[k].text = local
+                    elif flat_texts[k] in memo:
+                        translated[k].text = memo[flat_texts[k]]
+            
+                with span("save", language=language, cues=len(translated)):
+                    subtitle_formats.write_srt(output["path"], translated)
+                save_title_state(video_path, language, key, last_index=max(j, output["last_done"]), partial=None)
+        saved_cues += len(batch) - len(texts)
+        metric_inc("translator_cues_total", len(texts), path="api")
+        metric_inc("translator_cues_total", len(batch) - len(texts), path="saved")
+        if _usage_stack:
+            _usage_stack[-1]["api_cues"] += len(texts)
         
         current_index = i + len(batch)
         percent = current_index / total * 100
         
-        # Pause avant de mesurer le temps total
-        if current_index < total:
-            time.sleep(PAUSE_SECONDS)
+        # Pause avant de mesurer le temps total (inutile si aucun appel API)
+        if current_index < total and texts:
+            with span("pause"):
+                time.sleep(PAUSE_SECONDS)
         
         # Calculer le temps TOTAL du batch (traduction + pause)
         batch_end = time.time()
@@ -552,7 +3186,7 @@ def translate_subtitle(video_path):
         if current_index < total and len(batch_times) > 0:
             avg_batch_time = sum(batch_times) / len(batch_times)
             remaining_lines = total - current_index
-            remaining_batches = remaining_lines / BATCH_SIZE
+            remaining_batches = remaining_lines / len(batch)
             estimated_seconds = remaining_batches * avg_batch_time
             
             if estimated_seconds < 60:
@@ -569,11 +3203,15 @@ def translate_subtitle(video_path):
             end_time_str = end_time.strftime("%H:%M")
             
             log(f"⏳ {video_name} | {i+1}-{current_index}/{total} ({percent:.1f}%) | ETA: ~{time_str} (fin: {end_time_str})")
+            update_live_progress(video_path, done=current_index, percent=round(percent, 1), eta=end_time_str)
         else:
             # Dernier batch
             log(f"⏳ {video_name} | {i+1}-{current_index}/{total} ({percent:.1f}%)")
+            update_live_progress(video_path, done=current_index, percent=round(percent, 1), eta=None)
+        
+        i = j
     
-    # 7. Traduction terminée → nettoyage
+    # 8. Traduction terminée → nettoyage
     total_duration = time.time() - start_time
     if total_duration < 60:
         duration_str = f"{int(total_duration)}s"
@@ -586,15 +3224,116 @@ def translate_subtitle(video_path):
         minutes = int((total_duration % 3600) / 60)
         duration_str = f"{hours}h {minutes}m"
     
-    delete_progress(progress_path)
+    if context:
+        update_show_glossary(context["show"], subs, outputs[languages[0]]["translated"])
+    
+    for language, output in outputs.items():
+        store_translations(video_path, flat_texts, language, output["translated"])
+        save_title_state(video_path, language, key, status="done", last_index=total, partial=None,
+                         output_checksum=file_checksum(output["path"]), finished_at=time.time(),
+                         duration=total_duration)
+        delete_title_state(video_path, language)
     delete_extracted_subtitle(base)
     cleanup_converted_files(base)
     
-    log(f"✅ {video_name} | Terminé en {duration_str} | Output: {os.path.basename(output_path)}")
+    update_live_progress(video_path, status="completed", finished_at=time.time())
+    output_names = ", ".join(os.path.basename(output["path"]) for output in outputs.values())
+    filter_info = f" | Filtre: {saved_cues} ligne(s) économisée(s)" if saved_cues else ""
+    usage = save_title_usage(video_path, languages, total, total_duration)
+    if usage and usage["prompt_tokens"]:
+        filter_info += (f" | Tokens: {usage['prompt_tokens']} entrée ({usage['cached_tokens']} en cache)"
+                        f" + {usage['output_tokens']} sortie")
+    log(f"✅ {video_name} | Terminé en {duration_str} | Output: {output_names}{filter_info}")
     
     return "completed"
 
 
+# =========================
+# SCAN INCRÉMENTAL (MTIME DES DOSSIERS)
+# =========================
+# Créer, supprimer ou renommer un fichier change le mtime de son dossier : un dossier dont le mtime
+# n'a pas bougé depuis un passage où toutes ses vidéos étaient dans un état stable n'est pas relisté,
+# seuls ses sous-dossiers connus sont revisités (un stat chacun)
+dir_index = {}  # dossier → {"mtime", "children"} du dernier passage stable
+unstable_dirs = set()  # dossiers à relister au prochain cycle (erreur, traduction en attente...)
+scan_stats = {"cycle": 0, "deep": True, "listed": 0, "pruned": 0}
+STABLE_OUTCOMES = ("already_done", "completed", "no_source", "unsupported_format", "wrong_language")
+
+
+def start_scan_cycle():
+    """Début de cycle : décide si le scan est complet (premier cycle, tous les DEEP_SCAN_EVERY cycles)"""
+    scan_stats["cycle"] += 1
+    scan_stats["deep"] = (
+        not INCREMENTAL_SCAN
+        or not dir_index
+        or (DEEP_SCAN_EVERY > 0 and scan_stats["cycle"] % DEEP_SCAN_EVERY == 0)
+    )
+    scan_stats["listed"] = 0
+    scan_stats["pruned"] = 0
+
+
+def mark_unstable(directory):
+    """Le dossier devra être relisté au prochain cycle"""
+    unstable_dirs.add(directory)
+    dir_index.pop(directory, None)
+
+
+def scan_folder(folder_path):
+    """
+    os.walk() incrémental : produit (root, files) pour les seuls dossiers à relister
+    Un dossier est mémorisé une fois ses fichiers traités, sauf si mark_unstable() a été appelé entre-temps
+    """
+    stack = [folder_path]
+    while stack:
+        root = stack.pop()
+        try:
+            mtime = os.stat(root).st_mtime_ns
+        except OSError:
+            dir_index.pop(root, None)
+            continue
+
+        known = dir_index.get(root)
+        if not scan_stats["deep"] and known and known["mtime"] == mtime:
+            scan_stats["pruned"] += 1
+            metric_inc("translator_scan_dirs_total", result="pruned")
+            stack.extend(reversed(known["children"]))
+            continue
+
+        try:
+            with os.scandir(root) as entries:
+                entries = sorted(entries, key=lambda entry: entry.name)
+        except OSError as e:
+            log(f"  ⚠️ Dossier illisible, ignoré: {root} ({e})")
+            dir_index.pop(root, None)
+            continue
+
+        children = [entry.path for entry in entries if entry.is_dir() and not entry.is_symlink()]
+        files = [entry.name for entry in entries if not entry.is_dir()]
+        scan_stats["listed"] += 1
+        metric_inc("translator_scan_dirs_total", result="listed")
+
+        unstable_dirs.discard(root)
+        yield root, files
+
+        # mtime lu AVANT le listing : nos propres écritures (.fr.srt...) provoquent un relisting au cycle suivant,
+        # un fichier arrivé pendant le traitement n'est donc jamais manqué
+        if root in unstable_dirs:
+            dir_index.pop(root, None)
+        else:
+            dir_index[root] = {"mtime": mtime, "children": children}
+        stack.extend(reversed(children))
+
+
+def log_scan_summary():
+    """Résumé du scan incrémental en fin de cycle (mode watch)"""
+    if not INCREMENTAL_SCAN or not WATCH_MODE:
+        return
+    if scan_stats["deep"]:
+        log(f"🗂️ Scan complet : {scan_stats['listed']} dossier(s) listé(s)")
+    else:
+        log(f"🗂️ Scan incrémental : {scan_stats['pruned']} dossier(s) inchangé(s) ignoré(s) | {scan_stats['listed']} relisté(s)")
+
+
 # =========================
 # FOLDER PROCESSING
 # =========================
@@ -615,10 +3354,11 @@ def process_folder(folder_path, folder_index, total_folders):
         "completed": 0,
         "no_source": 0,
         "unsupported_format": 0,
+        "wrong_language": 0,
         "error": 0
     }
     
-    for root, _, files in os.walk(folder_path):
+    for root, files in scan_folder(folder_path):
         for file in files:
             if not file.lower().endswith(VIDEO_EXTENSIONS):
                 continue
@@ -635,10 +3375,13 @@ def process_folder(folder_path, folder_index, total_folders):
                 
                 if result in stats:
                     stats[result] += 1
+                if result not in STABLE_OUTCOMES:
+                    mark_unstable(root)
                 
                 stats["total"] += 1
             except Exception as e:
                 log(f"❌ {file} | Erreur inattendue: {e}")
+                mark_unstable(root)
                 stats["error"] += 1
                 stats["total"] += 1
     
@@ -654,6 +3397,416 @@ def merge_stats(global_stats, folder_stats):
         global_stats[key] += folder_stats[key]
 
 
+# =========================
+# PLANIFICATION
+# =========================
+def count_source_cues(source_file):
+    """
+    Compte les répliques d'une source sans la parser entièrement
+    Formats bitmap (SUP/SUB) : nombre d'affichages, None si OCR indisponible
+    """
+    name = source_file[:-4] if source_file.endswith('.tmp') else source_file
+    ext = name.rsplit('.', 1)[-1].lower()
+
+    if ext in ('sup', 'sub'):
+        return bitmap_ocr.count_bitmap_cues(source_file) if ocr_available() else None
+
+    if ext not in ('ass', 'ssa'):
+        return subtitle_formats.count_srt_cues(source_file)
+
+    count = 0
+    with open(source_file, 'r', encoding='utf-8', errors='ignore') as f:
+        for line in f:
+            if line.startswith('Dialogue:'):
+                count += 1
+    return count
+
+
+def estimate_job(video_path, folder_index):
+    """
+    Estime le travail restant pour une vidéo
+    Retourne un dict (lignes restantes, requêtes estimées...) ou None si rien à traduire
+    """
+    base, _ = os.path.splitext(video_path)
+
+    try:
+        states, _ = pending_languages(video_path, base)
+    except Exception:
+        states = {language: None for language in TARGET_LANGUAGES}
+
+    if not states:
+        return None
+
+    source_file = find_english_subtitle(base)
+    if not source_file:
+        return None
+
+    try:
+        cues = count_source_cues(source_file)
+        if cues is None:
+            return None
+        key = source_key(source_file)
+        # Toutes les langues partagent les requêtes : la plus en retard décide
+        last_done = min(
+            resume_index(state, key, f"{base}.{language}.srt", cues) for language, state in states.items()
+        )
+    except Exception:
+        return None
+
+    if cues is None:
+        return None
+
+    remaining = max(cues - last_done, 0)
+    if remaining == 0:
+        return None
+
+    return {
+        "video_path": video_path,
+        "folder_index": folder_index,
+        "cues": cues,
+        "remaining": remaining,
+        "requests": math.ceil(remaining / BATCH_SIZE),
+        "mtime": os.path.getmtime(video_path)
+    }
+
+
+def scan_library():
+    """
+    Parcourt tous les folders et sépare les vidéos à traduire des autres
+    Retourne (jobs, autres_vidéos, trailers_ignorés)
+    """
+    jobs = []
+    others = []
+    trailers = 0
+
+    for folder_index, folder_path in enumerate(SOURCE_FOLDERS):
+        if not os.path.isdir(folder_path):
+            log(f"  ⚠️ Dossier inexistant, ignoré: {folder_path}")
+            continue
+
+        for root, files in scan_folder(folder_path):
+            for file in files:
+                if not file.lower().endswith(VIDEO_EXTENSIONS):
+                    continue
+
+                if "-trailer" in file.lower():
+                    trailers += 1
+                    continue
+
+                video_path = os.path.join(root, file)
+                job = estimate_job(video_path, folder_index)
+
+                if job:
+                    jobs.append(job)
+                    mark_unstable(root)
+                else:
+                    others.append(video_path)
+
+    return jobs, others, trailers
+
+
+def build_plan(jobs):
+    """
+    Ordonne les jobs selon SCHEDULE_POLICY et les répartit sur les journées de quota
+    Chaque job reçoit "day" : 0 = avant le prochain reset, 1 = journée suivante, etc.
+    """
+    if SCHEDULE_POLICY == "shortest":
+        ordered = sorted(jobs, key=lambda j: (j["requests"], j["remaining"]))
+    elif SCHEDULE_POLICY == "newest":
+        ordered = sorted(jobs, key=lambda j: -j["mtime"])
+    elif SCHEDULE_POLICY == "folder":
+        ordered = sorted(jobs, key=lambda j: (j["folder_index"], j["requests"]))
+    else:
+        ordered = list(jobs)
+
+    capacity = daily_capacity()
+    remaining_today = remaining_daily_quota()
+    cumulative = 0
+
+    for job in ordered:
+        cumulative += job["requests"]
+        if not capacity or cumulative <= remaining_today:
+            job["day"] = 0
+        else:
+            job["day"] = math.ceil((cumulative - remaining_today) / capacity)
+
+    return ordered
+
+
+def plan_day_label(day):
+    """Date de fin projetée pour une journée de quota du plan"""
+    if day == 0:
+        return datetime.now(PARIS_TZ).strftime("%d/%m/%Y")
+    next_reset, _ = calculate_next_quota_reset()
+    return (next_reset + timedelta(days=day - 1)).strftime("%d/%m/%Y")
+
+
+def log_plan(plan, detailed=False):
+    """Affiche le plan (résumé par journée, détail par fichier si detailed)"""
+    total_requests = sum(job["requests"] for job in plan)
+    total_lines = sum(job["remaining"] for job in plan)
+    capacity = daily_capacity()
+    remaining_today = remaining_daily_quota()
+
+    quota_info = f"Quota restant: {remaining_today}/{capacity} req" if capacity else "Quota: inconnu (GEMINI_MODELS_RPD)"
+    log(f"🗓️ PLAN ({SCHEDULE_POLICY}) | {len(plan)} fichier(s) | {total_lines} lignes | ~{total_requests} requêtes | {quota_info}")
+
+    if detailed:
+        for position, job in enumerate(plan, start=1):
+            log(f"  {position}. {os.path.basename(job['video_path'])} | {job['remaining']}/{job['cues']} lignes | ~{job['requests']} req | fin: J+{job['day']} ({plan_day_label(job['day'])})")
+
+    days = {}
+    for job in plan:
+        count, requests = days.get(job["day"], (0, 0))
+        days[job["day"]] = (count + 1, requests + job["requests"])
+
+    for day in sorted(days):
+        count, requests = days[day]
+        log(f"  📅 J+{day} ({plan_day_label(day)}) : {count} fichier(s), ~{requests} req")
+
+    if plan:
+        log(f"  🏁 Fin projetée du backlog : {plan_day_label(plan[-1]['day'])}")
+
+
+def run_planned_translation(global_stats):
+    """Cycle de traduction piloté par le plan (SCHEDULE_POLICY ≠ walk ou PLAN_DRY_RUN)"""
+    jobs, others, trailers = scan_library()
+    plan = build_plan(jobs)
+    log_plan(plan, detailed=PLAN_DRY_RUN)
+
+    if PLAN_DRY_RUN:
+        return
+
+    global_stats["trailers_skipped"] += trailers
+
+    # Vidéos sans travail restant d'abord (rapide : skips et nettoyages), puis le plan
+    for video_path in others + [job["video_path"] for job in plan]:
+        try:
+            result = translate_subtitle(video_path)
+
+            if result in global_stats:
+                global_stats[result] += 1
+            if result not in STABLE_OUTCOMES:
+                mark_unstable(os.path.dirname(video_path))
+
+            global_stats["total"] += 1
+        except Exception as e:
+            log(f"❌ {os.path.basename(video_path)} | Erreur inattendue: {e}")
+            mark_unstable(os.path.dirname(video_path))
+            global_stats["error"] += 1
+            global_stats["total"] += 1
+
+
+# =========================
+# HTTP API (TRADUCTION À LA DEMANDE)
+# =========================
+priority_queue = []  # vidéos demandées via l'API, dans l'ordre d'arrivée
+priority_event = threading.Event()
+live_progress = {}  # vidéo → progression en cours ou dernier résultat
+serving_priority = False
+_api_lock = threading.Lock()
+
+
+def update_live_progress(video_path, **fields):
+    """Met à jour la progression exposée par GET /status"""
+    with _api_lock:
+        entry = live_progress.setdefault(video_path, {"video": video_path})
+        entry.update(fields)
+        entry["updated_at"] = now()
+
+
+def enqueue_priority(video_path):
+    """Place une vidéo dans la file prioritaire, retourne sa position (1 = prochaine)"""
+    with _api_lock:
+        if video_path not in priority_queue:
+            priority_queue.append(video_path)
+        position = priority_queue.index(video_path) + 1
+    update_live_progress(video_path, status="queued", requested_at=now())
+    priority_event.set()
+    return position
+
+
+def serve_priority_requests(current_video=None):
+    """
+    Traite les demandes prioritaires en attente
+    Appelé entre deux lots : la vidéo en cours est mise en pause puis reprend là où elle en était
+    """
+    global serving_priority
+    if serving_priority or not priority_queue:
+        return
+
+    serving_priority = True
+    try:
+        while True:
+            with _api_lock:
+                if not priority_queue:
+                    break
+                video_path = priority_queue.pop(0)
+
+            if video_path == current_video:
+                continue
+
+            if current_video:
+                log(f"⏸️ {os.path.basename(current_video)} | Pause → demande prioritaire : {os.path.basename(video_path)}")
+            else:
+                log(f"⚡ Demande prioritaire : {os.path.basename(video_path)}")
+
+            try:
+                result = translate_subtitle(video_path)
+            except Exception as e:
+                log(f"❌ {os.path.basename(video_path)} | Erreur inattendue: {e}")
+                result = "error"
+            update_live_progress(video_path, status=result, finished_at=now())
+
+            if current_video:
+                log(f"▶️ {os.path.basename(current_video)} | Reprise")
+    finally:
+        serving_priority = False
+
+
+def wait_for_next_cycle(seconds):
+    """Attente entre deux cycles, interrompue à chaque demande prioritaire"""
+    deadline = time.time() + seconds
+    while True:
+        remaining = deadline - time.time()
+        if remaining <= 0:
+            return
+        if priority_event.wait(remaining):
+            priority_event.clear()
+            serve_priority_requests()
+
+
+def resolve_request_path(path):
+    """
+    Valide le chemin d'une demande : vidéo existante, dans un des SOURCE_FOLDERS
+    Retourne (chemin, None) ou (None, (code HTTP, message))
+    """
+    if not path:
+        return None, (400, "paramètre 'path' manquant")
+
+    video_path = os.path.abspath(path)
+    if not video_path.lower().endswith(VIDEO_EXTENSIONS):
+        return None, (400, "extension vidéo non supportée")
+
+    real_path = os.path.realpath(video_path)
+    roots = [os.path.realpath(root) for root in SOURCE_FOLDERS]
+    if not any(os.path.commonpath([real_path, root]) == root for root in roots):
+        return None, (400, "chemin hors SOURCE_FOLDERS")
+
+    if not os.path.isfile(video_path):
+        return None, (404, "vidéo introuvable")
+
+    return video_path, None
+
+
+def video_status(video_path):
+    """Progression d'une vidéo : en mémoire si traitée depuis le démarrage, sinon STATE_DB"""
+    with _api_lock:
+        entry = live_progress.get(video_path)
+        if entry:
+            return dict(entry)
+
+    languages = {}
+    for language in TARGET_LANGUAGES:
+        state = load_title_state(video_path, language)
+        if state:
+            languages[language] = {key: state[key] for key in ("status", "last_index", "total", "finished_at")}
+    return {"video": video_path, "status": "unknown" if not languages else "stored", "languages": languages}
+
+
+def api_status():
+    """Vue d'ensemble : file prioritaire, traductions en cours, derniers fichiers traités"""
+    with _api_lock:
+        entries = sorted(live_progress.values(), key=lambda entry: entry["updated_at"], reverse=True)
+        return {
+            "queue": list(priority_queue),
+            "active": [dict(entry) for entry in entries if entry.get("status") == "translating"],
+            "recent": [dict(entry) for entry in entries[:50]],
+            "hedging": dict(hedge_stats) if HEDGE_REQUESTS else None,
+            "replica": REPLICA_ID,
+            "leases": [
+                {"video": video, "owner": owner, "expires_at": expires_at}
+                for video, owner, expires_at in db_execute(
+                    "SELECT video_path, owner, expires_at FROM leases WHERE expires_at > ? ORDER BY video_path", (now(),)
+                )
+            ]
+        }
+
+
+class TranslatorAPIHandler(BaseHTTPRequestHandler):
+    """
+    POST /translate {"path": "/media/movies/Film.mkv"} → file prioritaire (202)
+    GET  /status[?path=...] → progression en direct
+    GET  /metrics → métriques Prometheus
+    """
+
+    def log_message(self, format, *args):
+        pass
+
+    def send_json(self, code, payload):
+        body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def send_text(self, code, text):
+        body = text.encode("utf-8")
+        self.send_response(code)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        if url.path == "/metrics":
+            return self.send_text(200, render_metrics())
+        if url.path != "/status":
+            return self.send_json(404, {"error": "route inconnue"})
+
+        path = parse_qs(url.query).get("path", [None])[0]
+        if path:
+            return self.send_json(200, video_status(os.path.abspath(path)))
+        return self.send_json(200, api_status())
+
+    def do_POST(self):
+        url = urlparse(self.path)
+        if url.path != "/translate":
+            return self.send_json(404, {"error": "route inconnue"})
+
+        if API_TOKEN and self.headers.get("Authorization") != f"Bearer {API_TOKEN}":
+            return self.send_json(401, {"error": "token invalide"})
+
+        path = parse_qs(url.query).get("path", [None])[0]
+        length = int(self.headers.get("Content-Length") or 0)
+        if length:
+            try:
+                path = json.loads(self.rfile.read(length)).get("path", path)
+            except (ValueError, AttributeError):
+                return self.send_json(400, {"error": "JSON invalide"})
+
+        video_path, error = resolve_request_path(path)
+        if error:
+            return self.send_json(error[0], {"error": error[1]})
+
+        position = enqueue_priority(video_path)
+        log(f"📥 API | Demande prioritaire : {os.path.basename(video_path)} (position {position})")
+        return self.send_json(202, {"video": video_path, "status": "queued", "position": position})
+
+
+def start_api_server():
+    """Démarre l'API HTTP dans un thread (si API_PORT est défini)"""
+    if not API_PORT:
+        return None
+
+    server = ThreadingHTTPServer((API_HOST, API_PORT), TranslatorAPIHandler)
+    threading.Thread(target=server.serve_forever, name="api", daemon=True).start()
+    log(f"🌐 API HTTP : http://{API_HOST}:{API_PORT} (POST /translate, GET /status, GET /metrics)")
+    return server
+
+
 # =========================
 # RUN CYCLE
 # =========================
@@ -665,7 +3818,9 @@ def run_translation():
         return
     
     log("🚀 DÉBUT DE LA TRADUCTION")
-    log(f"📂 {len(SOURCE_FOLDERS)} dossier(s) configuré(s) | Formats: SRT, ASS, SSA, VTT | Modèles: {', '.join(MODELS)}")
+    reset_profile()
+    start_scan_cycle()
+    log(f"📂 {len(SOURCE_FOLDERS)} dossier(s) configuré(s) | Formats: SRT, ASS, SSA, VTT{', SUP, SUB (OCR)' if ocr_available() else ''} | Modèles: {', '.join(MODELS)}")
     
     # Stats globales
     global_stats = {
@@ -675,16 +3830,30 @@ def run_translation():
         "completed": 0,
         "no_source": 0,
         "unsupported_format": 0,
+        "wrong_language": 0,
         "error": 0
     }
     
-    # Traiter chaque folder
-    total_folders = len(SOURCE_FOLDERS)
-    for index, folder in enumerate(SOURCE_FOLDERS, start=1):
-        folder_stats = process_folder(folder, index, total_folders)
-        merge_stats(global_stats, folder_stats)
+    if SCHEDULE_POLICY != "walk" or PLAN_DRY_RUN:
+        # Ordre piloté par le plan (tous folders confondus)
+        run_planned_translation(global_stats)
+        if PLAN_DRY_RUN:
+            log('='*60)
+            return
+    else:
+        # Traiter chaque folder
+        total_folders = len(SOURCE_FOLDERS)
+        for index, folder in enumerate(SOURCE_FOLDERS, start=1):
+            folder_stats = process_folder(folder, index, total_folders)
+            merge_stats(global_stats, folder_stats)
     
-    log(f"✅ TRADUCTION TERMINÉE | Total: {global_stats['total']} | Complétés: {global_stats['completed']} | Déjà faits: {global_stats['already_done']} | Erreurs: {global_stats['error'] + global_stats['no_source'] + global_stats['unsupported_format']}")
+    language_info = f" | Sources non anglaises: {global_stats['wrong_language']}" if global_stats["wrong_language"] else ""
+    log(f"✅ TRADUCTION TERMINÉE | Total: {global_stats['total']} | Complétés: {global_stats['completed']} | Déjà faits: {global_stats['already_done']} | Erreurs: {global_stats['error'] + global_stats['no_source'] + global_stats['unsupported_format']}{language_info}")
+    log_hedge_summary()
+    log_routing_summary()
+    log_routine_summary()
+    log_scan_summary()
+    log_profile_summary()
     log('='*60)
 
 
@@ -694,25 +3863,40 @@ def run_translation():
 def main():
     mode = "WATCH (agent continu)" if WATCH_MODE else "RUN ONCE (exécution unique)"
     log(f"🐳 Mode: {mode}")
+    install_shutdown_handler()
+    load_quota_ledger()
+    release_own_leases()
+    sweep_partial_files()
+    
+    if PLAN_DRY_RUN:
+        # Dry-run : affiche le plan une seule fois, sans appel API
+        log("🧪 PLAN_DRY_RUN=true → affichage du plan uniquement")
+        run_translation()
+        return
     
     if WATCH_MODE:
         interval_hours = WATCH_INTERVAL / 3600
         log(f"⏰ Intervalle: {WATCH_INTERVAL}s ({interval_hours:.1f}h) | CTRL+C pour arrêter")
+        start_api_server()
         
         while True:
             try:
                 run_translation()
                 log(f"💤 Prochaine vérification dans {interval_hours:.1f}h...")
-                time.sleep(WATCH_INTERVAL)
+                wait_for_next_cycle(WATCH_INTERVAL)
             except KeyboardInterrupt:
                 log("👋 Arrêt de l'agent demandé")
                 break
             except Exception as e:
                 log(f"❌ Erreur inattendue: {e}")
                 log(f"⏳ Nouvelle tentative dans {interval_hours:.1f}h...")
-                time.sleep(WATCH_INTERVAL)
+                wait_for_next_cycle(WATCH_INTERVAL)
     else:
-        run_translation()
+        start_api_server()
+        try:
+            run_translation()
+        except KeyboardInterrupt:
+            log("👋 Arrêt de l'agent demandé")
 
 
 if __name__ == "__main__":